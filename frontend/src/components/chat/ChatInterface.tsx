@@ -46,6 +46,12 @@ interface EventCardProps {
 
 const MotionBox = motion(Box);
 
+// The data line of a server-sent event frame, which also has an `id:` line
+function frameData(frame: string): string | null {
+  const line = frame.split("\n").find((line) => line.startsWith("data: "));
+  return line === undefined ? null : line.slice(6);
+}
+
 function EventCard({ event }: EventCardProps) {
   const getEventTypeColor = () => {
     switch (event.type) {
@@ -369,11 +375,12 @@ export function ChatInterface({ activeRequestId, selectedCalendarId, onAddNewReq
           if (done) break;
 
           const text = new TextDecoder().decode(value);
-          const lines = text.split("\n\n");
+          const frames = text.split("\n\n");
 
-          for (const line of lines) {
-            if (line.startsWith("data: ")) {
-              const data = JSON.parse(line.slice(6));
+          for (const frame of frames) {
+            const payload = frameData(frame);
+            if (payload !== null) {
+              const data = JSON.parse(payload);
               if (data.op === "trace_id") {
                 updateSession(requestId, { threadId: data.trace_id });
               } else if (data.op === "info") {
@@ -481,11 +488,12 @@ export function ChatInterface({ activeRequestId, selectedCalendarId, onAddNewReq
           if (done) break;
 
           const text = new TextDecoder().decode(value);
-          const lines = text.split("\n\n");
+          const frames = text.split("\n\n");
 
-          for (const line of lines) {
-            if (line.startsWith("data: ")) {
-              const data = JSON.parse(line.slice(6));
+          for (const frame of frames) {
+            const payload = frameData(frame);
+            if (payload !== null) {
+              const data = JSON.parse(payload);
               if (data.op === "info") {
                 // Keep track of thinking process in the session
                 const parsedMessage = parseMessage(data.message);
@@ -0,0 +1,73 @@
+"""
+Offline runs of JSONL files of chat turns, see BatchController:
+
+    python batch.py turns.jsonl results.jsonl --threads 8
+
+Run again with the same output to resume after a crash.
+"""
+
+import argparse
+import asyncio
+
+import orjson
+
+from controllers import BatchController
+from core.google_api import get_google_api_scheduler
+from core.main_graph import compile_graph, get_compiled_graph
+from database import LangfuseHandler, get_redis_saver
+from helpers import get_settings
+
+app_settings = get_settings()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("input", help="JSONL file of turns")
+    parser.add_argument("output", help="JSONL file of results, appended to")
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=app_settings.BATCH_MAX_CONCURRENT_THREADS,
+        help="conversation threads run at once",
+    )
+    parser.add_argument(
+        "--llm-concurrency",
+        type=int,
+        default=app_settings.LLM_MAX_CONCURRENT_CALLS,
+        help="LLM calls in flight at once",
+    )
+    parser.add_argument(
+        "--google-concurrency",
+        type=int,
+        default=app_settings.GOOGLE_MAX_CONCURRENT_CALLS,
+        help="Google API calls in flight at once",
+    )
+    parser.add_argument(
+        "--google-user-concurrency",
+        type=int,
+        default=app_settings.GOOGLE_USER_MAX_CONCURRENT_CALLS,
+        help="Google API calls in flight at once per user",
+    )
+    return parser.parse_args()
+
+
+async def main(args: argparse.Namespace):
+    # Read when the LLM and Google limits are first used
+    app_settings.LLM_MAX_CONCURRENT_CALLS = args.llm_concurrency
+    app_settings.GOOGLE_MAX_CONCURRENT_CALLS = args.google_concurrency
+    app_settings.GOOGLE_USER_MAX_CONCURRENT_CALLS = args.google_user_concurrency
+
+    langfuse = LangfuseHandler()
+    try:
+        async for checkpointer in get_redis_saver():
+            compile_graph(checkpointer=checkpointer)
+            controller = BatchController(get_compiled_graph(), args.threads)
+            report = await controller.run(args.input, args.output)
+            print(orjson.dumps(report, option=orjson.OPT_INDENT_2).decode())
+    finally:
+        langfuse.flush()
+        get_google_api_scheduler().flush_stats()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,122 @@
+"""
+Token count and formatting latency of tool outputs, raw vs compact projection.
+
+Run from `src/`:
+    python -m benchmarks.tool_outputs
+"""
+
+import json
+import time
+
+import orjson
+
+from core.main_graph.projections import format_event, format_events
+
+RUNS = 1000
+
+
+def _count_tokens():
+    try:
+        import tiktoken
+
+        encoding = tiktoken.get_encoding("o200k_base")  # gpt-4.1 tokenizer
+        return lambda text: len(encoding.encode(text)), "o200k_base"
+    except Exception:
+        # Offline fallback, about 4 characters per token for JSON
+        return lambda text: len(text) // 4, "chars/4 estimate"
+
+
+def sample_event(i: int, attendees: int = 3) -> dict:
+    return {
+        "kind": "calendar#event",
+        "etag": f'"33{i:012d}"',
+        "id": f"4q1k2n3o4p5q6r7s8t9u{i:04d}",
+        "status": "confirmed",
+        "htmlLink": f"https://www.google.com/calendar/event?eid=NHExazJuM29{i:04d}",
+        "created": "2025-04-01T09:12:33.000Z",
+        "updated": "2025-04-01T09:12:34.021Z",
+        "summary": f"Project sync #{i}",
+        "description": "Weekly sync on the project status and blockers.",
+        "location": "Meeting room 2",
+        "creator": {"email": "me@example.com", "self": True},
+        "organizer": {"email": "me@example.com", "self": True},
+        "start": {
+            "dateTime": "2025-04-02T10:00:00+02:00",
+            "timeZone": "Africa/Cairo",
+        },
+        "end": {"dateTime": "2025-04-02T11:00:00+02:00", "timeZone": "Africa/Cairo"},
+        "iCalUID": f"4q1k2n3o4p5q6r7s8t9u{i:04d}@google.com",
+        "sequence": 0,
+        "attendees": [
+            {"email": "me@example.com", "organizer": True, "self": True}
+            | {"responseStatus": "accepted"}
+        ]
+        + [
+            {"email": f"person{j}@example.com", "responseStatus": "needsAction"}
+            for j in range(attendees - 1)
+        ],
+        "reminders": {"useDefault": True},
+        "eventType": "default",
+    }
+
+
+def _measure(name: str, raw, compact, count_tokens):
+    raw_text = raw()
+    compact_text = compact()
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        compact()
+    latency_us = (time.perf_counter() - start) / RUNS * 1e6
+    raw_tokens = count_tokens(raw_text)
+    compact_tokens = count_tokens(compact_text)
+    print(
+        f"{name:<36}{raw_tokens:>10}{compact_tokens:>10}"
+        f"{1 - compact_tokens / raw_tokens:>9.0%}{latency_us:>12.1f}"
+    )
+
+
+def main():
+    count_tokens, tokenizer = _count_tokens()
+    event = sample_event(0)
+    events = [sample_event(i) for i in range(10)]
+
+    print(f"Tokenizer: {tokenizer}, latency averaged over {RUNS} runs\n")
+    print(f"{'tool':<36}{'raw':>10}{'compact':>10}{'saved':>9}{'format µs':>12}")
+    # Raw formats are the ones the tools returned before projection: indented
+    # JSON for writes, ToolNode's json.dumps for lists
+    _measure(
+        "create_event_tool",
+        lambda: "Event created successfully.\n\n"
+        + str(orjson.dumps(event, option=orjson.OPT_INDENT_2)),
+        lambda: "Event created successfully.\n\n" + format_event(event),
+        count_tokens,
+    )
+    _measure(
+        "edit_event_tool",
+        lambda: "Event updated successfully: "
+        + str(orjson.dumps(event, option=orjson.OPT_INDENT_2)),
+        lambda: "Event updated successfully: " + format_event(event),
+        count_tokens,
+    )
+    _measure(
+        "get_event_tool",
+        lambda: json.dumps(event, ensure_ascii=False),
+        lambda: format_event(event),
+        count_tokens,
+    )
+    _measure(
+        "get_all_events_tool (10)",
+        lambda: json.dumps(events, ensure_ascii=False),
+        lambda: format_events(events),
+        count_tokens,
+    )
+    _measure(
+        "get_calendar_invitations_tool (10)",
+        lambda: json.dumps(events, ensure_ascii=False),
+        lambda: format_events(events),
+        count_tokens,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Per-turn overhead of the Langfuse tracing at 0%, 10% and 100% sampling, on a
+graph shaped like a turn (agent, tool, agent) with a fake LLM, no network.
+
+Run from `src/`:
+    python -m benchmarks.tracing
+"""
+
+import asyncio
+import logging
+import time
+from typing import Annotated
+
+from langchain_core.language_models.fake_chat_models import \
+    FakeMessagesListChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.tools import tool
+from langgraph.graph import END, START, StateGraph
+from langgraph.graph.message import add_messages
+from langgraph.prebuilt import ToolNode, tools_condition
+from typing_extensions import TypedDict
+
+from helpers import get_settings
+
+TURNS = 300
+
+app_settings = get_settings()
+# Traces go nowhere, the exporter's uploads fail in the background
+app_settings.LANGFUSE_ENABLED = True
+app_settings.LANGFUSE_PK = "pk-benchmark"
+app_settings.LANGFUSE_SK = "sk-benchmark"
+app_settings.LANGFUSE_HOST = "http://127.0.0.1:9"
+logging.getLogger("langfuse").disabled = True
+
+from core.turns import make_trace_callbacks  # noqa: E402
+from database import LangfuseHandler  # noqa: E402
+
+
+class State(TypedDict):
+    messages: Annotated[list, add_messages]
+
+
+@tool
+def get_all_events_tool(query: str) -> str:
+    """Lists the events matching `query`."""
+    return "Project sync, 2025-04-02 10:00-11:00, Meeting room 2"
+
+
+def build_graph():
+    llm = FakeMessagesListChatModel(
+        responses=[
+            AIMessage(
+                content="",
+                tool_calls=[
+                    {
+                        "name": "get_all_events_tool",
+                        "args": {"query": "tomorrow"},
+                        "id": "call_1",
+                    }
+                ],
+            ),
+            AIMessage(content='{"response": "You have a project sync.", "events": []}'),
+        ]
+    )
+
+    async def main_agent(state: State):
+        return {"messages": [await llm.ainvoke(state["messages"])]}
+
+    builder = StateGraph(State)
+    builder.add_node("main_agent", main_agent)
+    builder.add_node("tools", ToolNode([get_all_events_tool]))
+    builder.add_edge(START, "main_agent")
+    builder.add_conditional_edges("main_agent", tools_condition)
+    builder.add_edge("tools", "main_agent")
+    builder.add_edge("main_agent", END)
+    return builder.compile()
+
+
+async def _measure(graph, callbacks_for) -> float:
+    """Mean milliseconds per turn."""
+    start = time.perf_counter()
+    for i in range(TURNS):
+        await graph.ainvoke(
+            {"messages": [HumanMessage(content="What do I have tomorrow?")]},
+            config={"callbacks": callbacks_for(f"thread-{i}")},
+        )
+    return (time.perf_counter() - start) / TURNS * 1000
+
+
+async def main():
+    graph = build_graph()
+    langfuse_handler = LangfuseHandler()
+    # Warm up
+    await _measure(graph, lambda key: [])
+
+    def sampled(rate: float):
+        def callbacks_for(key: str) -> list:
+            langfuse_handler.sample_rate = rate
+            return make_trace_callbacks(key)
+
+        return callbacks_for
+
+    def inline(key: str) -> list:
+        # The Langfuse handler on the turn's path, as before the export queue
+        trace = langfuse_handler.langfuse_client.trace()
+        return [trace.get_langchain_handler(update_parent=True)]
+
+    baseline = await _measure(graph, lambda key: [])
+    print(f"{TURNS} turns per mode, agent -> tool -> agent\n")
+    print(f"{'tracing':<24}{'ms/turn':>10}{'overhead':>12}{'dropped':>10}")
+    print(f"{'off':<24}{baseline:>10.2f}{'':>12}{'':>10}")
+    for name, callbacks_for in [
+        ("0% sampled", sampled(0.0)),
+        ("10% sampled", sampled(0.1)),
+        ("100% sampled", sampled(1.0)),
+        ("100% inline handler", inline),
+    ]:
+        dropped = langfuse_handler.exporter.dropped
+        latency = await _measure(graph, callbacks_for)
+        print(
+            f"{name:<24}{latency:>10.2f}{latency - baseline:>+10.2f}ms"
+            f"{langfuse_handler.exporter.dropped - dropped:>10}"
+        )
+        # The backlog isn't charged to the next mode
+        langfuse_handler.exporter.join()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,3 +1,3 @@
 from .base_controller import BaseController
+from .batch_controller import BatchController
 from .chat_controller import ChatController
-from .document_controller import DocumentController
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import math
+import os
+import time
+import uuid
+from typing import Optional
+
+import orjson
+from langgraph.graph.state import CompiledStateGraph
+
+from .base_controller import BaseController
+from .chat_controller import ChatController
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile, 0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q / 100 * len(ordered)) - 1, 0)]
+
+
+class BatchController(BaseController):
+    """
+    Runs the chat turns of a JSONL file, one object per line:
+    `{"id": ..., "thread_id": ..., "user_id": ..., "message": ...}`, where only
+    `message` is required.
+
+    The turns of a thread run in file order, up to `max_concurrent_threads`
+    threads at once; the LLM and Google calls stay under the caps of the
+    process (LLM_MAX_CONCURRENT_CALLS, GOOGLE_MAX_CONCURRENT_CALLS), and each
+    turn is admitted by the rate limiter and runs under its thread's lease like
+    the API's turns (see ChatController.chat_message). Results
+    are appended to the output JSONL as they complete, so a run on the same
+    output resumes after a crash, skipping the turns that already succeeded.
+    """
+
+    def __init__(self, graph: CompiledStateGraph, max_concurrent_threads: int):
+        super().__init__()
+        self.chat = ChatController(graph)
+        self.max_concurrent_threads = max_concurrent_threads
+        self.progress = {"turns": 0, "skipped": 0, "succeeded": 0, "failed": 0}
+
+    def read_turns(
+        self, input_path: str, output_path: str, user_id: Optional[str] = None
+    ) -> dict[str, list[dict]]:
+        """
+        Turns per thread, in file order. Raises ValueError on an invalid line,
+        or with `user_id`, on a turn of another user.
+        """
+        # Threads without an id are named after the output, to resume them
+        namespace = os.path.abspath(output_path)
+        threads: dict[str, list[dict]] = {}
+        with open(input_path, "rb") as input_file:
+            for number, line in enumerate(input_file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    turn = orjson.loads(line)
+                except orjson.JSONDecodeError as e:
+                    raise ValueError(f"Line {number}: invalid JSON ({e})")
+                if not isinstance(turn, dict) or not turn.get("message"):
+                    raise ValueError(f"Line {number}: a turn needs a `message`")
+                turn["id"] = str(turn.get("id", number))
+                turn.setdefault(
+                    "thread_id",
+                    str(uuid.uuid5(uuid.NAMESPACE_URL, f"{namespace}#{turn['id']}")),
+                )
+                turn.setdefault("user_id", user_id or self.app_settings.DEFAULT_USER_ID)
+                if user_id is not None and turn["user_id"] != user_id:
+                    raise ValueError(f"Line {number}: a turn of another user")
+                threads.setdefault(turn["thread_id"], []).append(turn)
+        return threads
+
+    @staticmethod
+    def read_done(output_path: str) -> set[str]:
+        """Ids of the turns already answered in `output_path`."""
+        done = set()
+        if not os.path.exists(output_path):
+            return done
+        with open(output_path, "rb") as output_file:
+            for line in output_file:
+                try:
+                    result = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    # Cut short by a crash
+                    continue
+                if "response" in result:
+                    done.add(result["id"])
+        return done
+
+    async def _run_turn(self, turn: dict) -> dict:
+        result = {
+            "id": turn["id"],
+            "thread_id": turn["thread_id"],
+            "user_id": turn["user_id"],
+        }
+        start = time.perf_counter()
+        try:
+            result["response"] = await self.chat.chat_message(
+                turn["thread_id"],
+                turn["message"],
+                turn["user_id"],
+                turn.get("deadline_seconds"),
+            )
+        except Exception as e:
+            logger.exception("Batch turn %s failed", turn["id"])
+            result["error"] = repr(e)
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+
+    async def run(
+        self,
+        input_path: str,
+        output_path: str,
+        threads: Optional[dict[str, list[dict]]] = None,
+    ) -> dict:
+        """Runs the turns not yet answered in `output_path`, returns the report."""
+        threads = threads or self.read_turns(input_path, output_path)
+        done = self.read_done(output_path)
+        pending = [
+            [turn for turn in turns if turn["id"] not in done]
+            for turns in threads.values()
+        ]
+        self.progress["turns"] = sum(len(turns) for turns in threads.values())
+        self.progress["skipped"] = self.progress["turns"] - sum(map(len, pending))
+        latencies: list[float] = []
+        slots = asyncio.Semaphore(self.max_concurrent_threads)
+
+        if os.path.exists(output_path) and os.path.getsize(output_path):
+            with open(output_path, "rb") as output_file:
+                output_file.seek(-1, os.SEEK_END)
+                truncated = output_file.read() != b"\n"
+        else:
+            truncated = False
+
+        start = time.perf_counter()
+        with open(output_path, "ab") as output_file:
+            if truncated:
+                output_file.write(b"\n")
+
+            async def run_thread(turns: list[dict]):
+                async with slots:
+                    for turn in turns:
+                        result = await self._run_turn(turn)
+                        output_file.write(orjson.dumps(result) + b"\n")
+                        output_file.flush()
+                        if "error" in result:
+                            # The next turns build on this one
+                            self.progress["failed"] += 1
+                            return
+                        self.progress["succeeded"] += 1
+                        latencies.append(result["latency_ms"])
+
+            await asyncio.gather(*(run_thread(turns) for turns in pending if turns))
+        elapsed = time.perf_counter() - start
+
+        return {
+            **self.progress,
+            "elapsed_seconds": round(elapsed, 3),
+            "turns_per_second": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+            "latency_ms": {
+                "mean": (
+                    round(sum(latencies) / len(latencies), 1) if latencies else 0.0
+                ),
+                **{f"p{q}": percentile(latencies, q) for q in (50, 90, 95, 99)},
+                "max": max(latencies, default=0.0),
+            },
+        }
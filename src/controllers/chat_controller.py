@@ -1,26 +1,72 @@
+import asyncio
 import uuid
+from typing import Optional
 
 from langgraph.graph.state import CompiledStateGraph
 
+from core.turns import (TurnAdmission, admit_user_turn, make_graph_config,
+                        turn_deadline)
+from database import RateLimitExceededError, get_thread_lease
+
 from .base_controller import BaseController
 
 
 class ChatController(BaseController):
     def __init__(self, graph: CompiledStateGraph):
+        super().__init__()
         self.graph = graph
 
     async def new_conversation(self) -> str:
         conversation_id = str(uuid.uuid4())
         return conversation_id
 
-    async def chat_message(self, conversation_id: str, message: str) -> str:
-        config = {
-            "configurable": {"thread_id": conversation_id},
-        }
-        async for update in self.graph.astream(
-            {"user_message": message}, config=config
-        ):
-            pass
-
-        final_state = await self.graph.aget_state(config=config)
-        return final_state.values["response"]
+    async def chat_message(
+        self,
+        conversation_id: str,
+        message: str,
+        user_id: str = None,
+        deadline_seconds: Optional[float] = None,
+    ) -> str:
+        """
+        Answers `message`, under the rate limits and the thread lease of the
+        API's turns. Waits while the user is over a rate limit, or while
+        another turn of the conversation runs.
+        """
+        user_id = user_id or self.app_settings.DEFAULT_USER_ID
+        admission = await self._admit(user_id)
+        try:
+            lease = get_thread_lease(conversation_id)
+            if not await lease.wait_acquire(
+                message, self.app_settings.THREAD_LOCK_WAIT_SECONDS
+            ):
+                raise TimeoutError(
+                    "The previous message of the conversation is taking too long"
+                )
+            try:
+                config = make_graph_config(
+                    conversation_id,
+                    user_id,
+                    None,
+                    turn_deadline(deadline_seconds),
+                    admission,
+                )
+                config["configurable"]["fencing_token"] = lease.token
+                async for update in self.graph.astream(
+                    {"user_message": message}, config=config
+                ):
+                    pass
+
+                final_state = await self.graph.aget_state(config=config)
+                return final_state.values["response"]
+            finally:
+                await lease.release()
+        finally:
+            if admission is not None:
+                await admission.finish()
+
+    async def _admit(self, user_id: str) -> Optional[TurnAdmission]:
+        while True:
+            try:
+                return await admit_user_turn(user_id)
+            except RateLimitExceededError as e:
+                await asyncio.sleep(e.retry_after)
@@ -0,0 +1,117 @@
+"""Conversations held over a persistent connection, e.g. a WebSocket."""
+
+import asyncio
+import uuid
+from typing import Awaitable, Callable, Optional
+
+from langgraph.graph.state import CompiledStateGraph
+from langgraph.types import StateSnapshot
+
+from database import RateLimitExceededError, get_thread_lease
+from helpers import get_settings
+
+from .turns import (admit_user_turn, deliver_turn, make_graph_config,
+                    make_trace_callbacks, spawn_turn, thread_turn,
+                    turn_deadline)
+
+app_settings = get_settings()
+
+
+class ChatSession:
+    """
+    A conversation over one connection. Keeps what its turns share while the
+    connection is open: the Langfuse trace, the last state of the thread, and
+    the turn in flight, which the client can cancel in-band.
+
+    Turns run one at a time per session, in this process, under the thread's
+    lease like the HTTP turns, streaming the tokens of the response.
+    """
+
+    def __init__(
+        self,
+        graph: CompiledStateGraph,
+        send: Callable[[dict], Awaitable],
+        user_id: str,
+        thread_id: Optional[str] = None,
+    ):
+        self.graph = graph
+        self.send = send
+        self.user_id = user_id
+        self.thread_id = thread_id or str(uuid.uuid4())
+        self.callbacks = make_trace_callbacks(self.thread_id)
+        self.state: Optional[StateSnapshot] = None
+        self.turn: Optional[asyncio.Task] = None
+        self.cancelled = asyncio.Event()
+
+    @property
+    def busy(self) -> bool:
+        return self.turn is not None and not self.turn.done()
+
+    async def last_response(self) -> Optional[str]:
+        messages = (await self.get_state()).values.get("main_agent_messages")
+        return messages[-1].content if messages else None
+
+    async def get_state(self) -> StateSnapshot:
+        """State of the thread, read once per turn."""
+        if self.state is None:
+            self.state = await self.graph.aget_state(
+                {"configurable": {"thread_id": self.thread_id}}
+            )
+        return self.state
+
+    async def start_turn(
+        self, user_message: str, deadline_seconds: Optional[float] = None
+    ) -> bool:
+        """Starts a turn in the background, False if it was refused."""
+        if self.busy:
+            await self.send(
+                {"op": "error", "message": "A message is already being answered."}
+            )
+            return False
+        try:
+            admission = await admit_user_turn(self.user_id)
+        except RateLimitExceededError as e:
+            await self.send(
+                {
+                    "op": "error",
+                    "message": f"Too many requests ({e.limit}), please try again later.",
+                    "retry_after": e.retry_after,
+                }
+            )
+            return False
+
+        self.cancelled = asyncio.Event()
+        graph_config = make_graph_config(
+            self.thread_id,
+            self.user_id,
+            None,
+            turn_deadline(deadline_seconds),
+            admission,
+            self.callbacks,
+        )
+        graph_config["configurable"]["cancelled"] = self.cancelled
+        lease = get_thread_lease(self.thread_id)
+        acquired = await lease.acquire(user_message)
+        events = thread_turn(
+            lease, acquired, user_message, graph_config, self.graph, stream_tokens=True
+        )
+        # Outlives the connection until the turn reaches a safe point
+        self.turn = spawn_turn(self._run(events, admission))
+        return True
+
+    async def _run(self, events, admission):
+        await deliver_turn(str(uuid.uuid4()), events, self.send, admission)
+        # Reloaded when next asked for
+        self.state = None
+
+    def cancel(self) -> bool:
+        """Stops the turn in flight at its next safe point, False if none."""
+        if not self.busy:
+            return False
+        self.cancelled.set()
+        return True
+
+    def close(self):
+        """The connection went away."""
+        if app_settings.CANCEL_ABANDONED_TURNS:
+            self.cancel()
@@ -0,0 +1,37 @@
+import zlib
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Deterministic offline embedder hashing character n-grams into a fixed
+    number of dimensions.
+
+    It has no notion of meaning, but similar spellings land close together,
+    which makes it a stand-in for the API embedders in tests and local runs.
+    """
+
+    def __init__(self, size: int = 256, ngram_sizes: tuple[int, ...] = (2, 3)):
+        self.size = size
+        self.ngram_sizes = ngram_sizes
+
+    def _embed(self, text: str) -> list[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        padded = f" {text.lower()} "
+        for n in self.ngram_sizes:
+            for i in range(len(padded) - n + 1):
+                digest = zlib.crc32(padded[i : i + n].encode())
+                sign = 1.0 if digest & 1 else -1.0
+                vector[(digest >> 1) % self.size] += sign
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
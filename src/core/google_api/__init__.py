@@ -0,0 +1,11 @@
+from .auth import (MissingCredentialsError, get_user_calendar_service,
+                   get_user_id, get_user_people_service)
+from .batch import execute_batch
+from .contact_embeddings import get_contact_embeddings
+from .contacts import get_contact_index, invalidate_contact_index
+from .event_cache import (EventConflictError, get_event, get_event_cache,
+                          patch_event, patch_event_request)
+from .invitations import (get_pending_invitations, sync_channel,
+                          verify_notification)
+from .scheduler import (GoogleApiUnavailableError, execute,
+                        get_google_api_scheduler)
@@ -0,0 +1,143 @@
+import os
+import pickle
+import threading
+from collections import defaultdict
+from typing import Optional
+
+import httplib2
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.discovery import build
+from langchain_core.runnables import RunnableConfig
+
+from database import get_credential_store
+from helpers import get_settings
+
+app_settings = get_settings()
+
+SCOPES = ["https://www.googleapis.com/auth/calendar"]
+PEOPLE_SCOPES = ["https://www.googleapis.com/auth/contacts.readonly"]
+
+SERVICE_SCOPES = {
+    "calendar": SCOPES,
+    "people": PEOPLE_SCOPES,
+}
+
+# Token files written by the single-user version of the app, imported once
+# into the credential store for the default user.
+LEGACY_TOKEN_FILES = {
+    "calendar": "token.pickle",
+    "people": "token_people.pickle",
+}
+
+
+class MissingCredentialsError(Exception):
+    pass
+
+
+# Valid credentials per (user_id, service), so most calls skip the store.
+_credentials_cache: dict[tuple[str, str], Credentials] = {}
+_refresh_locks: defaultdict[tuple[str, str], threading.Lock] = defaultdict(
+    threading.Lock
+)
+_refresh_locks_guard = threading.Lock()
+
+
+def get_user_id(config: Optional[RunnableConfig]) -> str:
+    """Resolves the user owning the current graph run from its config."""
+    configurable = (config or {}).get("configurable", {})
+    return configurable.get("user_id") or app_settings.DEFAULT_USER_ID
+
+
+def _load_legacy_credentials(user_id: str, service: str) -> Optional[Credentials]:
+    path = LEGACY_TOKEN_FILES[service]
+    if user_id != app_settings.DEFAULT_USER_ID or not os.path.exists(path):
+        return None
+    with open(path, "rb") as token:
+        return pickle.load(token)
+
+
+def _run_local_oauth_flow(user_id: str, service: str) -> Credentials:
+    # Waits for a browser consent, only for local development
+    if not app_settings.GOOGLE_LOCAL_OAUTH_FLOW:
+        raise MissingCredentialsError(
+            f"User {user_id} has not authorized access to Google {service}."
+        )
+    flow = InstalledAppFlow.from_client_secrets_file(
+        app_settings.GOOGLE_CLIENT_SECRETS_FILE, SERVICE_SCOPES[service]
+    )
+    return flow.run_local_server(port=0)
+
+
+def get_user_credentials(user_id: str, service: str) -> Credentials:
+    """
+    Returns valid OAuth credentials of `user_id` for the given Google service.
+
+    Refreshes are single-flight: concurrent callers in this process wait on a
+    local lock, callers in other processes wait on the store's refresh lock, and
+    everyone re-reads the store after acquiring it so that only the first caller
+    actually hits the OAuth token endpoint.
+    """
+    key = (user_id, service)
+    creds = _credentials_cache.get(key)
+    if creds and creds.valid:
+        return creds
+
+    with _refresh_locks_guard:
+        local_lock = _refresh_locks[key]
+
+    store = get_credential_store()
+    with local_lock:
+        creds = _credentials_cache.get(key)
+        if creds and creds.valid:
+            return creds
+
+        creds = store.get(user_id, service)
+        if not (creds and creds.valid):
+            with store.refresh_lock(user_id, service):
+                creds = store.get(user_id, service) or _load_legacy_credentials(
+                    user_id, service
+                )
+                if creds and not creds.valid:
+                    if creds.expired and creds.refresh_token:
+                        creds.refresh(Request())
+                    else:
+                        creds = None
+                if creds:
+                    store.put(user_id, service, creds)
+            if not creds:
+                # Not under the refresh lock, which would expire during it
+                creds = _run_local_oauth_flow(user_id, service)
+                store.put(user_id, service, creds)
+
+        _credentials_cache[key] = creds
+        return creds
+
+
+def _build_service(
+    name: str, version: str, creds: Credentials, timeout: Optional[float]
+):
+    if timeout is None:
+        return build(name, version, credentials=creds)
+    http = AuthorizedHttp(creds, http=httplib2.Http(timeout=timeout))
+    return build(name, version, http=http)
+
+
+def get_user_calendar_service(user_id: str, timeout: Optional[float] = None):
+    """
+    Returns an authorized Google Calendar API service instance for the user,
+    its requests timing out after `timeout` seconds if given.
+    """
+    creds = get_user_credentials(user_id, "calendar")
+    return _build_service("calendar", "v3", creds, timeout)
+
+
+def get_user_people_service(user_id: str, timeout: Optional[float] = None):
+    """
+    Returns an authorized Google People API service instance for the user,
+    its requests timing out after `timeout` seconds if given.
+    """
+    creds = get_user_credentials(user_id, "people")
+    return _build_service("people", "v1", creds, timeout)
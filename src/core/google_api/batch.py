@@ -0,0 +1,61 @@
+import time
+from functools import partial
+
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+
+from .scheduler import execute, get_google_api_scheduler, is_rate_limited
+
+# Google Calendar accepts at most 50 calls per batch request
+CALENDAR_BATCH_LIMIT = 50
+
+
+def _collect(
+    results: list,
+    rate_limited: dict[int, HttpError],
+    index: int,
+    request_id: str,
+    response,
+    exception,
+):
+    if exception is None:
+        results[index] = {"ok": True, "result": response}
+        return
+    results[index] = {"ok": False, "error": str(exception)}
+    if isinstance(exception, HttpError) and is_rate_limited(exception):
+        rate_limited[index] = exception
+
+
+def execute_batch(
+    service,
+    requests: list[HttpRequest],
+    user_id: str,
+    batch_limit: int = CALENDAR_BATCH_LIMIT,
+) -> list[dict]:
+    """
+    Executes `requests` with one HTTP call per `batch_limit` requests. The
+    requests rate limited within a batch, which Google didn't apply, are sent
+    again with the backoff of the scheduler.
+
+    Returns one item per request, in order: {"ok": True, "result": ...} or
+    {"ok": False, "error": ...}, so a failing request does not fail the others.
+    """
+    scheduler = get_google_api_scheduler()
+    results: list[dict] = [None] * len(requests)
+    pending = list(range(len(requests)))
+    attempt = 0
+    while True:
+        rate_limited: dict[int, HttpError] = {}
+        for start in range(0, len(pending), batch_limit):
+            batch = service.new_batch_http_request()
+            for index in pending[start : start + batch_limit]:
+                batch.add(
+                    requests[index],
+                    callback=partial(_collect, results, rate_limited, index),
+                )
+            execute(batch, user_id, write=True)
+        if not rate_limited or attempt >= scheduler.max_retries:
+            return results
+        pending = sorted(rate_limited)
+        time.sleep(scheduler.backoff(attempt, rate_limited[pending[0]]))
+        attempt += 1
@@ -0,0 +1,248 @@
+"""Semantic contact matching over a memory-mapped matrix of contact embeddings."""
+
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+import orjson
+from langchain_core.embeddings import Embeddings
+
+from core.llm_factories import get_embedder
+from helpers import get_settings
+
+from .contacts import ContactIndex, get_contact_index
+
+app_settings = get_settings()
+
+# Embeddings of the names looked up, per user
+QUERY_CACHE_SIZE = 1024
+
+
+def _contact_text(contact: dict) -> str:
+    if contact["email"] == "No email":
+        return contact["name"]
+    return f"{contact['name']} <{contact['email']}>"
+
+
+class ContactEmbeddings:
+    """
+    Unit-normalized float32 embeddings of a user's contacts, one row per contact.
+
+    Rows live in a memory-mapped file named by a JSON file listing the contact
+    of each row, so restarts only embed contacts that changed since the last run.
+    The names looked up are embedded once, the last QUERY_CACHE_SIZE are kept.
+    """
+
+    def __init__(self, path: str, embedder: Embeddings, model_name: str):
+        self.path = path
+        self.embedder = embedder
+        self.model_name = model_name
+        self.lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self.resource_names: list[str] = []
+        self.texts: list[str] = []
+        self.matrix: np.ndarray = np.zeros((0, 0), dtype=np.float32)
+        self.contacts: dict[str, dict] = {}
+        self._index_state: tuple[int, int] = (0, -1)
+        self._matrix_path: Optional[str] = None
+        self._queries: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._queries_lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(f"{self.path}.json"):
+            return
+        with open(f"{self.path}.json", "rb") as f:
+            meta = orjson.loads(f.read())
+        if meta["model"] != self.model_name:
+            return
+        rows = len(meta["resource_names"])
+        if rows:
+            matrix_path = os.path.join(
+                os.path.dirname(self.path), meta.get("matrix") or f"{self.path}.f32"
+            )
+            # Missing or not of the listed rows: everything is embedded again
+            expected = rows * meta["dim"] * np.dtype(np.float32).itemsize
+            if (
+                not os.path.exists(matrix_path)
+                or os.path.getsize(matrix_path) != expected
+            ):
+                return
+            self.matrix = np.memmap(
+                matrix_path, dtype=np.float32, mode="r", shape=(rows, meta["dim"])
+            )
+            self._matrix_path = matrix_path
+        self.resource_names = meta["resource_names"]
+        self.texts = meta["texts"]
+
+    def _save(self, matrix: np.ndarray):
+        """
+        Writes the matrix to a file of its own, then replaces the JSON file
+        naming it: other processes and restarts see either the previous rows
+        or the new ones, never a partial write.
+        """
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        suffix = f"{os.getpid()}.{uuid.uuid4().hex}"
+        matrix_path = None
+        if len(matrix):
+            matrix_path = f"{self.path}.{suffix}.f32"
+            rows = np.memmap(
+                matrix_path, dtype=np.float32, mode="w+", shape=matrix.shape
+            )
+            rows[:] = matrix
+            rows.flush()
+            del rows
+        with open(f"{self.path}.{suffix}.json", "wb") as f:
+            f.write(
+                orjson.dumps(
+                    {
+                        "model": self.model_name,
+                        "dim": matrix.shape[1] if len(matrix) else 0,
+                        "matrix": matrix_path and os.path.basename(matrix_path),
+                        "resource_names": self.resource_names,
+                        "texts": self.texts,
+                    }
+                )
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{self.path}.{suffix}.json", f"{self.path}.json")
+
+        self.matrix = (
+            np.memmap(matrix_path, dtype=np.float32, mode="r", shape=matrix.shape)
+            if matrix_path
+            else matrix
+        )
+        previous, self._matrix_path = self._matrix_path, matrix_path
+        if previous:
+            # Still readable through the memory maps already open on it
+            try:
+                os.remove(previous)
+            except FileNotFoundError:
+                pass
+
+    def refresh(self, index: ContactIndex):
+        """Re-embeds only the contacts added or changed in `index`."""
+        with self._refresh_lock:
+            with index.lock:
+                state = (id(index), index.version)
+                if self._index_state == state:
+                    return
+                contacts = {name: dict(index.contacts[name]) for name in index.contacts}
+            resource_names = list(contacts)
+            texts = [_contact_text(contacts[name]) for name in resource_names]
+            if texts == self.texts and resource_names == self.resource_names:
+                with self.lock:
+                    self.contacts = contacts
+                    self._index_state = state
+                return
+
+            known = {
+                (name, text): row
+                for row, (name, text) in enumerate(zip(self.resource_names, self.texts))
+            }
+            missing = [
+                i
+                for i, key in enumerate(zip(resource_names, texts))
+                if key not in known
+            ]
+            new_rows = (
+                np.asarray(
+                    self.embedder.embed_documents([texts[i] for i in missing]),
+                    dtype=np.float32,
+                )
+                if missing
+                else None
+            )
+            dim = new_rows.shape[1] if new_rows is not None else self.matrix.shape[1]
+            matrix = np.empty((len(texts), dim), dtype=np.float32)
+            for i, key in enumerate(zip(resource_names, texts)):
+                if key in known:
+                    matrix[i] = self.matrix[known[key]]
+            if missing:
+                norms = np.linalg.norm(new_rows, axis=1, keepdims=True)
+                matrix[missing] = new_rows / np.maximum(norms, 1e-12)
+            with self.lock:
+                self.resource_names = resource_names
+                self.texts = texts
+                self.contacts = contacts
+                self._save(matrix)
+                self._index_state = state
+
+    def _embed_queries(self, names: list[str]) -> np.ndarray:
+        """Unit-normalized embeddings of `names`, the new ones in one call."""
+        with self._queries_lock:
+            cached = {name: self._queries.get(name) for name in names}
+        missing = list(
+            dict.fromkeys(name for name, row in cached.items() if row is None)
+        )
+        if missing:
+            rows = np.asarray(self.embedder.embed_documents(missing), dtype=np.float32)
+            rows /= np.maximum(np.linalg.norm(rows, axis=1, keepdims=True), 1e-12)
+            cached.update(zip(missing, rows))
+        with self._queries_lock:
+            for name in names:
+                self._queries[name] = cached[name]
+                self._queries.move_to_end(name)
+            while len(self._queries) > QUERY_CACHE_SIZE:
+                self._queries.popitem(last=False)
+        return np.stack([cached[name] for name in names])
+
+    def search_many(
+        self, names: list[str], top_n: int = 2, threshold: Optional[float] = None
+    ) -> list[list[dict]]:
+        """Top `top_n` contacts per name, ranked by cosine similarity."""
+        threshold = (
+            app_settings.CONTACT_EMBEDDING_THRESHOLD if threshold is None else threshold
+        )
+        with self.lock:
+            matrix = self.matrix
+            resource_names = self.resource_names
+            contacts = self.contacts
+        if not names:
+            return []
+        if not len(resource_names):
+            return [[] for _ in names]
+
+        scores = matrix @ self._embed_queries(names).T
+        k = min(top_n, len(resource_names))
+        results = []
+        for column in scores.T:
+            top = np.argpartition(-column, k - 1)[:k]
+            top = top[np.argsort(-column[top], kind="stable")]
+            results.append(
+                [
+                    {
+                        **contacts[resource_names[row]],
+                        "similarity": round(float(column[row]), 4),
+                    }
+                    for row in top
+                    if column[row] > threshold
+                ]
+            )
+        return results
+
+    def search(self, name: str, top_n: int = 2) -> list[dict]:
+        return self.search_many([name], top_n=top_n)[0]
+
+
+_embeddings: dict[str, ContactEmbeddings] = {}
+_embeddings_lock = threading.Lock()
+
+
+def get_contact_embeddings(user_id: str) -> ContactEmbeddings:
+    """Returns the user's contact embeddings, in sync with their contact index."""
+    with _embeddings_lock:
+        embeddings = _embeddings.get(user_id)
+        if embeddings is None:
+            embeddings = ContactEmbeddings(
+                os.path.join(app_settings.CONTACT_EMBEDDINGS_DIR, user_id),
+                get_embedder(app_settings.EMBEDDING_MODEL),
+                app_settings.EMBEDDING_MODEL,
+            )
+            _embeddings[user_id] = embeddings
+    embeddings.refresh(get_contact_index(user_id))
+    return embeddings
@@ -0,0 +1,307 @@
+"""Per-user contact index kept current through People API incremental sync."""
+
+import heapq
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+from typing import Optional
+
+import orjson
+from googleapiclient.errors import HttpError
+
+from database import get_redis_client
+from database.redis import REDIS_KEY_SEPARATOR
+from helpers import get_settings
+
+from .auth import get_user_people_service
+from .scheduler import GoogleApiUnavailableError, execute
+
+app_settings = get_settings()
+logger = logging.getLogger(__name__)
+
+PERSON_FIELDS = "names,emailAddresses,metadata"
+SIMILARITY_THRESHOLD = 0.2
+# Contacts scored exactly per lookup, picked by trigram overlap
+MAX_CANDIDATES = 128
+
+
+def _trigrams(text: str) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def _part_similarity(search_parts: list[str], contact_parts: list[str]) -> float:
+    # Only count strong partial matches (substring of at least 3 chars)
+    part_matches = 0
+    for search_part in search_parts:
+        for contact_part in contact_parts:
+            if search_part == contact_part:
+                part_matches += 1
+                break
+            elif (
+                len(search_part) >= 3
+                and len(contact_part) >= 3
+                and (search_part in contact_part or contact_part in search_part)
+            ):
+                part_matches += 0.5  # partial match, but not full
+                break
+    return part_matches / max(len(search_parts), len(contact_parts), 1)
+
+
+class ContactIndex:
+    """
+    In-memory contact list with a trigram inverted index.
+
+    Lookups score the MAX_CANDIDATES contacts sharing the most trigrams with
+    the query first, most overlapping first, and all the others only when
+    those didn't give `top_n` matches. The exact ratio is skipped when its
+    upper bound cannot beat the current top-N.
+    """
+
+    def __init__(self):
+        self.contacts: dict[str, dict] = {}
+        self.sync_token: Optional[str] = None
+        self.synced_at: float = 0.0
+        # Bumped on every change so derived indexes know when to rebuild
+        self.version = 0
+        self.lock = threading.RLock()
+        self._names: dict[str, str] = {}
+        self._chars: dict[str, Counter] = {}
+        self._postings: defaultdict[str, set[str]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self.contacts)
+
+    def upsert(self, resource_name: str, name: str, email: str):
+        with self.lock:
+            self.remove(resource_name)
+            lowered = name.lower()
+            self.contacts[resource_name] = {"name": name, "email": email}
+            self._names[resource_name] = lowered
+            self._chars[resource_name] = Counter(lowered)
+            self.version += 1
+            for trigram in _trigrams(lowered):
+                self._postings[trigram].add(resource_name)
+
+    def remove(self, resource_name: str):
+        with self.lock:
+            lowered = self._names.pop(resource_name, None)
+            self._chars.pop(resource_name, None)
+            self.contacts.pop(resource_name, None)
+            if lowered is None:
+                return
+            self.version += 1
+            for trigram in _trigrams(lowered):
+                postings = self._postings.get(trigram)
+                if postings is not None:
+                    postings.discard(resource_name)
+                    if not postings:
+                        del self._postings[trigram]
+
+    def clear(self):
+        with self.lock:
+            self.contacts.clear()
+            self._names.clear()
+            self._chars.clear()
+            self._postings.clear()
+            self.sync_token = None
+            self.version += 1
+
+    def apply_person(self, person: dict):
+        """Applies a People API person resource (full or incremental)."""
+        resource_name = person["resourceName"]
+        names = person.get("names", [])
+        if person.get("metadata", {}).get("deleted") or not names:
+            self.remove(resource_name)
+            return
+        emails = person.get("emailAddresses", [])
+        self.upsert(
+            resource_name,
+            names[0].get("displayName", ""),
+            emails[0].get("value", "") if emails else "No email",
+        )
+
+    def _candidates(self, query: str) -> list[str]:
+        """Contacts sharing the most trigrams with the query, best first."""
+        postings = sorted(
+            (self._postings.get(trigram, ()) for trigram in _trigrams(query)),
+            key=len,
+        )
+        overlap = Counter()
+        for posting in postings:
+            # Very common trigrams barely discriminate, skip them once rarer
+            # ones already produced candidates
+            if overlap and len(posting) > MAX_CANDIDATES * 10:
+                break
+            overlap.update(posting)
+        return heapq.nlargest(MAX_CANDIDATES, overlap, key=overlap.__getitem__)
+
+    def search(self, name: str, top_n: int = 2) -> list[dict]:
+        """Top `top_n` contacts scoring above the similarity threshold."""
+        query = name.lower()
+        query_chars = Counter(query)
+        search_parts = query.split()
+        top: list[tuple[float, int, str]] = []
+
+        def score(order: int, resource_name: str):
+            contact_name = self._names[resource_name]
+            floor = top[0][0] if len(top) == top_n else SIMILARITY_THRESHOLD
+            if query.strip() == contact_name.strip():
+                similarity = 1.0
+            else:
+                part_similarity = _part_similarity(search_parts, contact_name.split())
+                # Same upper bound as SequenceMatcher.quick_ratio(), from
+                # the precomputed character counts
+                total = len(query) + len(contact_name)
+                common = (query_chars & self._chars[resource_name]).total()
+                if 2.0 * common / total > floor:
+                    ratio = SequenceMatcher(None, query, contact_name).ratio()
+                else:
+                    ratio = 0.0
+                similarity = min(max(ratio, part_similarity), 0.99)
+            if similarity <= floor:
+                return
+            # Ties keep the earlier (more overlapping) candidate
+            entry = (similarity, -order, resource_name)
+            if len(top) < top_n:
+                heapq.heappush(top, entry)
+            else:
+                heapq.heapreplace(top, entry)
+
+        with self.lock:
+            candidates = self._candidates(query)
+            for order, resource_name in enumerate(candidates):
+                score(order, resource_name)
+            if len(top) < top_n and len(candidates) < len(self._names):
+                # Contacts without enough shared trigrams can still score
+                # above the threshold, scan them all like before the index
+                scored = set(candidates)
+                for order, resource_name in enumerate(self._names, len(candidates)):
+                    if resource_name not in scored:
+                        score(order, resource_name)
+            ranked = sorted(top, reverse=True)
+            return [
+                {**self.contacts[resource_name], "similarity": similarity}
+                for similarity, _, resource_name in ranked
+            ]
+
+    def search_many(self, names: list[str], top_n: int = 2) -> list[list[dict]]:
+        """`search` for several names under a single lock acquisition."""
+        with self.lock:
+            return [self.search(name, top_n=top_n) for name in names]
+
+    def to_snapshot(self) -> bytes:
+        with self.lock:
+            return orjson.dumps(
+                {
+                    "sync_token": self.sync_token,
+                    "synced_at": self.synced_at,
+                    "contacts": self.contacts,
+                }
+            )
+
+    @classmethod
+    def from_snapshot(cls, data: bytes) -> "ContactIndex":
+        snapshot = orjson.loads(data)
+        index = cls()
+        for resource_name, contact in snapshot["contacts"].items():
+            index.upsert(resource_name, contact["name"], contact["email"])
+        index.sync_token = snapshot["sync_token"]
+        index.synced_at = snapshot["synced_at"]
+        return index
+
+
+def sync_contact_index(service, index: ContactIndex, user_id: str):
+    """
+    Brings `index` up to date, incrementally when it holds a sync token.
+
+    Falls back to a full download when the token expired (HTTP 410).
+    """
+    with index.lock:
+        try:
+            _sync_pages(service, index, index.sync_token, user_id)
+        except HttpError as e:
+            if e.resp.status != 410 or index.sync_token is None:
+                raise
+            index.clear()
+            _sync_pages(service, index, None, user_id)
+        index.synced_at = time.time()
+
+
+def _sync_pages(service, index: ContactIndex, sync_token: Optional[str], user_id: str):
+    next_page_token = None
+    while True:
+        results = execute(
+            service.people()
+            .connections()
+            .list(
+                resourceName="people/me",
+                pageSize=1000,
+                pageToken=next_page_token,
+                personFields=PERSON_FIELDS,
+                requestSyncToken=True,
+                syncToken=sync_token,
+            ),
+            user_id,
+        )
+        for person in results.get("connections", []):
+            index.apply_person(person)
+        next_page_token = results.get("nextPageToken")
+        if not next_page_token:
+            index.sync_token = results.get("nextSyncToken")
+            return
+
+
+_indexes: dict[str, ContactIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def _snapshot_key(user_id: str) -> str:
+    return REDIS_KEY_SEPARATOR.join(["contacts", user_id])
+
+
+def get_contact_index(user_id: str) -> ContactIndex:
+    """
+    Returns the user's contact index, syncing it if older than
+    CONTACTS_SYNC_INTERVAL_SECONDS.
+
+    The index is kept in process memory and snapshotted to Redis so that other
+    workers and restarts resume from the last sync token.
+    """
+    with _indexes_lock:
+        index = _indexes.get(user_id)
+        if index is None:
+            data = get_redis_client().get(_snapshot_key(user_id))
+            index = ContactIndex.from_snapshot(data) if data else ContactIndex()
+            _indexes[user_id] = index
+
+    if time.time() - index.synced_at > app_settings.CONTACTS_SYNC_INTERVAL_SECONDS:
+        with index.lock:
+            # Another thread may have synced while we waited for the lock
+            if (
+                time.time() - index.synced_at
+                > app_settings.CONTACTS_SYNC_INTERVAL_SECONDS
+            ):
+                try:
+                    sync_contact_index(get_user_people_service(user_id), index, user_id)
+                except GoogleApiUnavailableError as e:
+                    if not index.synced_at:
+                        raise
+                    # The last synced contacts stand in while Google is degraded
+                    logger.warning("Using stale contacts of %s: %s", user_id, e)
+                    return index
+                get_redis_client().set(
+                    _snapshot_key(user_id),
+                    index.to_snapshot(),
+                    ex=app_settings.CONTACTS_CACHE_TTL_SECONDS,
+                )
+    return index
+
+
+def invalidate_contact_index(user_id: str):
+    """Forces a sync on the next lookup, e.g. after a contact was written."""
+    index = _indexes.get(user_id)
+    if index is not None:
+        index.synced_at = 0.0
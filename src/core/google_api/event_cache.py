@@ -0,0 +1,116 @@
+"""Read-through cache of calendar events, revalidated with ETags."""
+
+from functools import lru_cache
+from typing import Optional
+
+import orjson
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+from redis import Redis
+
+from database import get_redis_client
+from database.redis import REDIS_KEY_SEPARATOR
+from helpers import get_settings
+
+from .scheduler import execute
+
+app_settings = get_settings()
+
+
+class EventConflictError(Exception):
+    """The event changed on Google's side since the cached version was read."""
+
+
+class EventCache:
+    """Events keyed by (user_id, calendar_id, event_id), shared through Redis."""
+
+    def __init__(self, conn: Redis, ttl_seconds: int):
+        self.conn = conn
+        self.ttl_seconds = ttl_seconds
+
+    @staticmethod
+    def _key(user_id: str, calendar_id: str, event_id: str) -> str:
+        return REDIS_KEY_SEPARATOR.join(["event", user_id, calendar_id, event_id])
+
+    def get(self, user_id: str, calendar_id: str, event_id: str) -> Optional[dict]:
+        data = self.conn.get(self._key(user_id, calendar_id, event_id))
+        return orjson.loads(data) if data else None
+
+    def put(self, user_id: str, calendar_id: str, event: dict):
+        self.put_many(user_id, calendar_id, [event])
+
+    def put_many(self, user_id: str, calendar_id: str, events: list[dict]):
+        pipeline = self.conn.pipeline(transaction=False)
+        for event in events:
+            if "id" in event and "etag" in event:
+                pipeline.set(
+                    self._key(user_id, calendar_id, event["id"]),
+                    orjson.dumps(event),
+                    ex=self.ttl_seconds,
+                )
+        pipeline.execute()
+
+    def evict(self, user_id: str, calendar_id: str, event_id: str):
+        self.conn.delete(self._key(user_id, calendar_id, event_id))
+
+
+@lru_cache()
+def get_event_cache() -> EventCache:
+    return EventCache(get_redis_client(), app_settings.EVENT_CACHE_TTL_SECONDS)
+
+
+def get_event(service, user_id: str, calendar_id: str, event_id: str) -> dict:
+    """
+    Returns the event, revalidating a cached copy with `If-None-Match` so an
+    unchanged event costs a 304 instead of a full payload.
+    """
+    cache = get_event_cache()
+    cached = cache.get(user_id, calendar_id, event_id)
+    request = service.events().get(calendarId=calendar_id, eventId=event_id)
+    if cached:
+        request.headers["If-None-Match"] = cached["etag"]
+    try:
+        # The cached copy stands in while Google is degraded
+        event = execute(request, user_id, fallback=lambda: cached)
+    except HttpError as e:
+        if cached and e.resp.status == 304:
+            return cached
+        raise
+    cache.put(user_id, calendar_id, event)
+    return event
+
+
+def patch_event_request(
+    service, user_id: str, calendar_id: str, event_id: str, body: dict, **kwargs
+) -> HttpRequest:
+    """
+    Builds a patch request guarded by `If-Match` when the event's ETag is known,
+    so edits based on a stale read fail instead of overwriting newer changes.
+    """
+    cached = get_event_cache().get(user_id, calendar_id, event_id)
+    request = service.events().patch(
+        calendarId=calendar_id, eventId=event_id, body=body, **kwargs
+    )
+    if cached:
+        request.headers["If-Match"] = cached["etag"]
+    return request
+
+
+def patch_event(
+    service, user_id: str, calendar_id: str, event_id: str, body: dict, **kwargs
+) -> dict:
+    cache = get_event_cache()
+    request = patch_event_request(
+        service, user_id, calendar_id, event_id, body, **kwargs
+    )
+    try:
+        event = execute(request, user_id, write=True)
+    except HttpError as e:
+        if e.resp.status == 412:
+            cache.evict(user_id, calendar_id, event_id)
+            raise EventConflictError(
+                f"Event {event_id} was changed since it was last read."
+            ) from e
+        raise
+    cache.put(user_id, calendar_id, event)
+    return event
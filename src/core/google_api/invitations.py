@@ -0,0 +1,295 @@
+"""
+Pending invitations index per (user, calendar), kept current by Calendar push
+notifications with sync token polling as the fallback.
+"""
+
+import logging
+import secrets
+import time
+import urllib.request
+import uuid
+from datetime import date, datetime, timezone, tzinfo
+from typing import Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import orjson
+from googleapiclient.errors import HttpError
+
+from database import get_redis_client
+from database.redis import REDIS_KEY_SEPARATOR
+from helpers import get_settings
+
+from .auth import get_user_calendar_service
+from .scheduler import GoogleApiUnavailableError, execute
+
+app_settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+def is_pending_invitation(event: dict) -> bool:
+    """
+    True if the user hasn't answered the invitation, or organizes the event and
+    some attendees haven't answered yet.
+    """
+    if event.get("status") == "cancelled":
+        return False
+    attendees = event.get("attendees", [])
+    for attendee in attendees:
+        # Check if user is an attendee and hasn't responded
+        if attendee.get("self", False) and attendee.get("responseStatus") in [
+            "needsAction",
+            "tentative",
+        ]:
+            return True
+    # Also include events where user is the organizer and others haven't responded
+    if event.get("organizer", {}).get("self", False):
+        for attendee in attendees:
+            if (
+                not attendee.get("self", False)
+                and attendee.get("responseStatus") == "needsAction"
+            ):
+                return True
+    return False
+
+
+def _event_time(event: dict, field: str, time_zone: tzinfo) -> datetime:
+    """Start or end of the event, all-day ones at midnight in `time_zone`."""
+    value = event.get(field, {})
+    if value.get("dateTime"):
+        parsed = datetime.fromisoformat(value["dateTime"])
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=time_zone)
+    if value.get("date"):
+        return datetime.combine(
+            date.fromisoformat(value["date"]), datetime.min.time(), tzinfo=time_zone
+        )
+    return datetime.min.replace(tzinfo=timezone.utc)
+
+
+def _time_zone(name: Optional[str]) -> tzinfo:
+    try:
+        return ZoneInfo(name) if name else timezone.utc
+    except (ZoneInfoNotFoundError, ValueError):
+        return timezone.utc
+
+
+class InvitationIndex:
+    """
+    Redis-backed map of pending invitations of one user's calendar.
+
+    Layout:
+    - `invitations:{user}:{calendar}`: hash event_id -> event
+    - `invitations_state:{user}:{calendar}`: hash with the sync token, the
+      time of the last sync and the time zone of the calendar
+    """
+
+    def __init__(self, user_id: str, calendar_id: str):
+        self.user_id = user_id
+        self.calendar_id = calendar_id
+        self.conn = get_redis_client()
+        self.key = REDIS_KEY_SEPARATOR.join(["invitations", user_id, calendar_id])
+        self.state_key = REDIS_KEY_SEPARATOR.join(
+            ["invitations_state", user_id, calendar_id]
+        )
+
+    def state(self) -> dict:
+        return {
+            k.decode(): v.decode() for k, v in self.conn.hgetall(self.state_key).items()
+        }
+
+    def apply_events(self, events: list[dict]):
+        pipeline = self.conn.pipeline(transaction=False)
+        for event in events:
+            if is_pending_invitation(event):
+                pipeline.hset(self.key, event["id"], orjson.dumps(event))
+            else:
+                pipeline.hdel(self.key, event["id"])
+        pipeline.execute()
+
+    def pending(self, limit: int) -> list[dict]:
+        """Upcoming pending invitations, soonest first."""
+        # All-day events start and end at midnight in the calendar's time zone
+        time_zone = _time_zone(self.state().get("time_zone"))
+        now = datetime.now(tz=timezone.utc)
+        events = [orjson.loads(data) for data in self.conn.hvals(self.key)]
+        upcoming = [
+            event for event in events if _event_time(event, "end", time_zone) >= now
+        ]
+        upcoming.sort(key=lambda event: _event_time(event, "start", time_zone))
+        return upcoming[:limit]
+
+    def sync(self, service):
+        """Applies changes since the last sync, or does a full sync."""
+        # Notifications often arrive in bursts, one sync at a time is enough
+        with self.conn.lock(f"{self.state_key}:lock", timeout=60, blocking_timeout=60):
+            sync_token = self.state().get("sync_token")
+            try:
+                last_page = self._sync_pages(service, sync_token)
+            except HttpError as e:
+                if e.resp.status != 410 or sync_token is None:
+                    raise
+                # Sync token expired, start over
+                self.conn.delete(self.key)
+                last_page = self._sync_pages(service, None)
+            self.conn.hset(
+                self.state_key,
+                mapping={
+                    "sync_token": last_page["nextSyncToken"],
+                    "synced_at": time.time(),
+                    "time_zone": last_page.get("timeZone", "UTC"),
+                },
+            )
+
+    def _sync_pages(self, service, sync_token: Optional[str]) -> dict:
+        """Applies all the pages of changes, returns the last one."""
+        page_token = None
+        while True:
+            results = execute(
+                service.events().list(
+                    calendarId=self.calendar_id,
+                    maxResults=2500,
+                    pageToken=page_token,
+                    singleEvents=True,
+                    showDeleted=sync_token is not None,
+                    syncToken=sync_token,
+                ),
+                self.user_id,
+            )
+            self.apply_events(results.get("items", []))
+            page_token = results.get("nextPageToken")
+            if not page_token:
+                return results
+
+
+# ---- Push notification channels ----
+
+
+def _channel_key(channel_id: str) -> str:
+    return REDIS_KEY_SEPARATOR.join(["calendar_channel", channel_id])
+
+
+def _watch_key(user_id: str, calendar_id: str) -> str:
+    return REDIS_KEY_SEPARATOR.join(["calendar_watch", user_id, calendar_id])
+
+
+def watch_calendar(service, user_id: str, calendar_id: str) -> Optional[dict]:
+    """
+    Registers an `events.watch` channel delivering notifications to
+    CALENDAR_WEBHOOK_URL. Returns None when no webhook URL is configured.
+    """
+    if not app_settings.CALENDAR_WEBHOOK_URL:
+        return None
+    channel = {
+        "id": str(uuid.uuid4()),
+        "token": secrets.token_urlsafe(32),
+        "user_id": user_id,
+        "calendar_id": calendar_id,
+    }
+    response = execute(
+        service.events().watch(
+            calendarId=calendar_id,
+            body={
+                "id": channel["id"],
+                "type": "web_hook",
+                "address": app_settings.CALENDAR_WEBHOOK_URL,
+                "token": channel["token"],
+                "params": {"ttl": str(app_settings.CALENDAR_WATCH_TTL_SECONDS)},
+            },
+        ),
+        user_id,
+        write=True,
+    )
+    channel["resource_id"] = response.get("resourceId", "")
+    channel["expiration"] = int(response.get("expiration", 0)) / 1000
+    return register_channel(channel)
+
+
+def register_channel(channel: dict) -> dict:
+    """Stores a notification channel so incoming notifications can be routed."""
+    conn = get_redis_client()
+    ttl = max(int(channel["expiration"] - time.time()), 1)
+    conn.set(_channel_key(channel["id"]), orjson.dumps(channel), ex=ttl)
+    conn.set(
+        _watch_key(channel["user_id"], channel["calendar_id"]), channel["id"], ex=ttl
+    )
+    return channel
+
+
+def get_channel(channel_id: str) -> Optional[dict]:
+    data = get_redis_client().get(_channel_key(channel_id))
+    return orjson.loads(data) if data else None
+
+
+def has_active_channel(user_id: str, calendar_id: str) -> bool:
+    return bool(get_redis_client().exists(_watch_key(user_id, calendar_id)))
+
+
+def verify_notification(channel_id: str, token: str) -> Optional[dict]:
+    """Returns the channel of a push notification, None if unknown or forged."""
+    channel = get_channel(channel_id)
+    if channel is None or not secrets.compare_digest(channel["token"], token or ""):
+        return None
+    return channel
+
+
+def sync_channel(channel: dict):
+    """Applies the changes a push notification of `channel` announced."""
+    index = InvitationIndex(channel["user_id"], channel["calendar_id"])
+    index.sync(get_user_calendar_service(channel["user_id"]))
+
+
+def send_local_notification(
+    channel: dict, base_url: str = "http://localhost:8000", resource_state="exists"
+) -> int:
+    """
+    Stand-in for Google delivering a notification of `channel` to the local
+    webhook endpoint, for tests and development. Returns the HTTP status.
+    """
+    request = urllib.request.Request(
+        f"{base_url}/api/v1/webhooks/google-calendar",
+        method="POST",
+        headers={
+            "X-Goog-Channel-ID": channel["id"],
+            "X-Goog-Channel-Token": channel["token"],
+            "X-Goog-Resource-ID": channel.get("resource_id", ""),
+            "X-Goog-Resource-State": resource_state,
+        },
+    )
+    with urllib.request.urlopen(request) as response:
+        return response.status
+
+
+def get_pending_invitations(user_id: str, calendar_id: str, limit: int) -> list[dict]:
+    """
+    Answers from the index. Syncs first when the index was never built, or when
+    no push channel keeps it current and the last poll is older than
+    INVITATIONS_POLL_SECONDS.
+    """
+    index = InvitationIndex(user_id, calendar_id)
+    state = index.state()
+    pushed = has_active_channel(user_id, calendar_id)
+    stale = (
+        time.time() - float(state.get("synced_at", 0))
+        > app_settings.INVITATIONS_POLL_SECONDS
+    )
+    if "sync_token" not in state or (stale and not pushed):
+        service = get_user_calendar_service(user_id)
+        try:
+            index.sync(service)
+        except GoogleApiUnavailableError as e:
+            if "sync_token" not in state:
+                raise
+            # The last synced invitations stand in while Google is degraded
+            logger.warning("Using stale invitations of %s: %s", user_id, e)
+            return index.pending(limit)
+        if not pushed:
+            try:
+                watch_calendar(service, user_id, calendar_id)
+            except (HttpError, GoogleApiUnavailableError) as e:
+                # The index is synced, polling keeps it current without a channel
+                logger.warning(
+                    "Watching calendar %s of %s failed, polling it: %s",
+                    calendar_id,
+                    user_id,
+                    e,
+                )
+    return index.pending(limit)
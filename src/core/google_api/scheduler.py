@@ -0,0 +1,347 @@
+"""
+Shared layer executing the Google API requests: concurrency limits per user
+and per process, jittered exponential backoff, and a circuit breaker per API.
+"""
+
+import hashlib
+import random
+import threading
+import time
+from collections import defaultdict
+from functools import lru_cache
+from typing import Any, Callable, Optional
+
+import orjson
+from googleapiclient.errors import HttpError
+from googleapiclient.http import BatchHttpRequest, HttpRequest
+from langgraph.config import get_config
+from redis import Redis
+
+from database import get_redis_client
+from database.redis import REDIS_KEY_SEPARATOR
+from helpers import get_settings
+
+app_settings = get_settings()
+
+_RATE_LIMIT_REASONS = (b"rateLimitExceeded", b"userRateLimitExceeded")
+_TRANSIENT_STATUSES = {500, 502, 503, 504}
+
+API_NAMES = {"calendar": "Google Calendar", "people": "Google Contacts"}
+
+
+class GoogleApiUnavailableError(Exception):
+    """The API is degraded and no cached or mirrored data can stand in."""
+
+
+def is_rate_limited(error: HttpError) -> bool:
+    if error.resp.status == 429:
+        return True
+    return error.resp.status == 403 and any(
+        reason in (error.content or b"") for reason in _RATE_LIMIT_REASONS
+    )
+
+
+def _is_transient(error: Exception) -> bool:
+    if isinstance(error, HttpError):
+        return error.resp.status in _TRANSIENT_STATUSES
+    return isinstance(error, (TimeoutError, ConnectionError))
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    if isinstance(error, HttpError):
+        try:
+            return float(error.resp.get("retry-after"))
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+def _turn_seconds_left() -> Optional[float]:
+    """Time left before the deadline of the turn calling, None outside of one."""
+    try:
+        deadline = get_config().get("configurable", {}).get("deadline")
+    except RuntimeError:
+        # E.g. the contact and invitation syncs
+        return None
+    return None if deadline is None else max(deadline - time.time(), 0)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failures` consecutive failures, then lets one probe call
+    through every `cooldown_seconds` until one succeeds.
+    """
+
+    def __init__(self, failures: int, cooldown_seconds: float):
+        self.failures = failures
+        self.cooldown_seconds = cooldown_seconds
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.cooldown_seconds:
+                return False
+            # Probe, the others wait for its outcome
+            self.opened_at = time.monotonic()
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.consecutive_failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= self.failures:
+                self.opened_at = time.monotonic()
+
+
+class GoogleApiScheduler:
+    """
+    Executes the requests of all users of the process.
+
+    Reads are retried on rate limiting and on transient errors, writes only on
+    rate limiting, when Google rejected them without applying them. Successful
+    reads can be mirrored, to answer from while the API is degraded.
+
+    Layout:
+    - `google_api_stats`: hash of calls, retries, errors, fallbacks and total
+      latency per API method, counted in process and flushed at most every
+      `stats_flush_seconds`
+    - `google_mirror:{user}:{hash}`: last result of a mirrored read
+    """
+
+    STATS_KEY = "google_api_stats"
+
+    def __init__(
+        self,
+        conn: Redis,
+        max_concurrent_calls: int,
+        user_max_concurrent_calls: int,
+        max_retries: int,
+        backoff_base_seconds: float,
+        backoff_max_seconds: float,
+        breaker_failures: int,
+        breaker_cooldown_seconds: float,
+        mirror_ttl_seconds: int,
+        stats_flush_seconds: float,
+    ):
+        self.conn = conn
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.mirror_ttl_seconds = mirror_ttl_seconds
+        self.slots = threading.BoundedSemaphore(max_concurrent_calls)
+        self.user_slots: defaultdict[str, threading.BoundedSemaphore] = defaultdict(
+            lambda: threading.BoundedSemaphore(user_max_concurrent_calls)
+        )
+        self.user_slots_guard = threading.Lock()
+        self.breakers: defaultdict[str, CircuitBreaker] = defaultdict(
+            lambda: CircuitBreaker(breaker_failures, breaker_cooldown_seconds)
+        )
+        self.breakers_guard = threading.Lock()
+        self.stats_flush_seconds = stats_flush_seconds
+        self.counts: defaultdict[str, float] = defaultdict(float)
+        self.counts_guard = threading.Lock()
+        self.flushed_at = time.monotonic()
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        """
+        Seconds to wait before retrying after `error`: the Retry-After of
+        Google if longer, up to the maximum backoff and the turn's deadline.
+        """
+        # Full jitter, spreading the retries of concurrent callers
+        delay = random.uniform(
+            0, min(self.backoff_max_seconds, self.backoff_base_seconds * 2**attempt)
+        )
+        delay = min(max(delay, _retry_after(error) or 0), self.backoff_max_seconds)
+        seconds_left = _turn_seconds_left()
+        return delay if seconds_left is None else min(delay, seconds_left)
+
+    def _mirror_key(self, user_id: str, request: HttpRequest) -> str:
+        digest = hashlib.sha256(
+            f"{request.uri}\n{request.body or ''}".encode()
+        ).hexdigest()
+        return REDIS_KEY_SEPARATOR.join(["google_mirror", user_id, digest])
+
+    def _count(self, counts: dict[str, float]):
+        with self.counts_guard:
+            for field, value in counts.items():
+                self.counts[field] += value
+            due = time.monotonic() - self.flushed_at >= self.stats_flush_seconds
+        if due:
+            self.flush_stats()
+
+    def _record(self, method: str, latency_ms: float, retries: int, outcome: str):
+        counts = {f"{method}:calls": 1, f"{method}:latency_ms": latency_ms}
+        if retries:
+            counts[f"{method}:retries"] = retries
+        if outcome != "ok":
+            counts[f"{method}:{outcome}"] = 1
+        self._count(counts)
+
+    def flush_stats(self):
+        """Adds the counts of the process to the shared stats."""
+        with self.counts_guard:
+            counts, self.counts = self.counts, defaultdict(float)
+            self.flushed_at = time.monotonic()
+        if not counts:
+            return
+        pipeline = self.conn.pipeline(transaction=False)
+        for field, value in counts.items():
+            if field.endswith(":latency_ms"):
+                pipeline.hincrbyfloat(self.STATS_KEY, field, value)
+            else:
+                pipeline.hincrby(self.STATS_KEY, field, int(value))
+        pipeline.execute()
+
+    def _call(self, request, user_id: str):
+        with self.user_slots_guard:
+            user_slots = self.user_slots[user_id]
+        # The user's slot first: a user at its cap doesn't hold a global one
+        with user_slots, self.slots:
+            return request.execute()
+
+    def execute(
+        self,
+        request: HttpRequest | BatchHttpRequest,
+        user_id: str,
+        write: bool = False,
+        mirror: bool = False,
+        fallback: Optional[Callable[[], Any]] = None,
+    ) -> Any:
+        """
+        Executes `request` for `user_id`. While the API is degraded, answers
+        from `fallback`, or from the mirror of the read if `mirror`, and raises
+        GoogleApiUnavailableError when there is neither.
+        """
+        method = getattr(request, "methodId", None) or "batch"
+        api = method.split(".")[0] if method != "batch" else "calendar"
+        with self.breakers_guard:
+            breaker = self.breakers[api]
+
+        def degraded(error: Optional[Exception]):
+            if fallback is not None:
+                result = fallback()
+            elif mirror and (data := self.conn.get(self._mirror_key(user_id, request))):
+                result = orjson.loads(data)
+            else:
+                result = None
+            if result is None:
+                raise GoogleApiUnavailableError(
+                    f"{API_NAMES.get(api, api)} is temporarily unavailable, "
+                    "please try again in a few minutes."
+                ) from error
+            self._count({f"{method}:fallbacks": 1})
+            return result
+
+        if not breaker.allow():
+            return degraded(None)
+
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                result = self._call(request, user_id)
+                break
+            except Exception as e:
+                rate_limited = isinstance(e, HttpError) and is_rate_limited(e)
+                degraded_api = rate_limited or _is_transient(e)
+                # Other failed writes may have been applied, they aren't retried
+                retryable = rate_limited or (degraded_api and not write)
+                if retryable and attempt < self.max_retries:
+                    time.sleep(self.backoff(attempt, e))
+                    attempt += 1
+                    continue
+                # A 304 answers a conditional read
+                not_modified = isinstance(e, HttpError) and e.resp.status == 304
+                self._record(
+                    method,
+                    (time.perf_counter() - start) * 1000,
+                    attempt,
+                    "ok" if not_modified else "errors",
+                )
+                if not degraded_api:
+                    # The request itself failed, e.g. 404 or 412, not the API
+                    raise
+                breaker.record_failure()
+                if write:
+                    raise
+                return degraded(e)
+
+        breaker.record_success()
+        self._record(method, (time.perf_counter() - start) * 1000, attempt, "ok")
+        if mirror:
+            self.conn.set(
+                self._mirror_key(user_id, request),
+                orjson.dumps(result),
+                ex=self.mirror_ttl_seconds,
+            )
+        return result
+
+    def stats(self) -> dict:
+        self.flush_stats()
+        methods: defaultdict[str, dict[str, float]] = defaultdict(dict)
+        for field, value in self.conn.hgetall(self.STATS_KEY).items():
+            method, counter = field.decode().rsplit(":", 1)
+            methods[method][counter] = float(value)
+        return {
+            "methods": {
+                method: {
+                    "calls": int(counts.get("calls", 0)),
+                    "retries": int(counts.get("retries", 0)),
+                    "errors": int(counts.get("errors", 0)),
+                    "fallbacks": int(counts.get("fallbacks", 0)),
+                    "avg_latency_ms": (
+                        round(counts.get("latency_ms", 0) / counts["calls"], 1)
+                        if counts.get("calls")
+                        else 0.0
+                    ),
+                }
+                for method, counts in methods.items()
+            },
+            # Per process
+            "breakers": {api: breaker.state for api, breaker in self.breakers.items()},
+        }
+
+
+@lru_cache()
+def get_google_api_scheduler() -> GoogleApiScheduler:
+    return GoogleApiScheduler(
+        get_redis_client(),
+        max_concurrent_calls=app_settings.GOOGLE_MAX_CONCURRENT_CALLS,
+        user_max_concurrent_calls=app_settings.GOOGLE_USER_MAX_CONCURRENT_CALLS,
+        max_retries=app_settings.GOOGLE_MAX_RETRIES,
+        backoff_base_seconds=app_settings.GOOGLE_BACKOFF_BASE_SECONDS,
+        backoff_max_seconds=app_settings.GOOGLE_BACKOFF_MAX_SECONDS,
+        breaker_failures=app_settings.GOOGLE_BREAKER_FAILURES,
+        breaker_cooldown_seconds=app_settings.GOOGLE_BREAKER_COOLDOWN_SECONDS,
+        mirror_ttl_seconds=app_settings.GOOGLE_MIRROR_TTL_SECONDS,
+        stats_flush_seconds=app_settings.GOOGLE_STATS_FLUSH_SECONDS,
+    )
+
+
+def execute(
+    request: HttpRequest | BatchHttpRequest,
+    user_id: str,
+    write: bool = False,
+    mirror: bool = False,
+    fallback: Optional[Callable[[], Any]] = None,
+) -> Any:
+    """Executes `request` through the shared scheduler, see GoogleApiScheduler."""
+    return get_google_api_scheduler().execute(
+        request, user_id, write=write, mirror=mirror, fallback=fallback
+    )
@@ -1,12 +1,26 @@
+import asyncio
+import time
+from functools import lru_cache
+from typing import Any, Awaitable, TypeVar
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain_core.embeddings import Embeddings
 from langchain_core.language_models import BaseChatModel
+from langchain_core.outputs import LLMResult
 from langchain_openai.chat_models import ChatOpenAI
 from langchain_openai.embeddings import OpenAIEmbeddings
 
+from database import get_llm_cache
 from helpers import get_settings
+from helpers.metrics import LLM_SECONDS, LLM_TOKENS
+
+from .embeddings import HashingEmbeddings
 
 app_settings = get_settings()
 
+T = TypeVar("T")
+
 
 def get_embedder(
     embedding_model_name: str = app_settings.EMBEDDING_MODEL,
@@ -16,10 +30,54 @@ def get_embedder(
             api_key=app_settings.OPENAI_API_KEY,
             model=embedding_model_name[len("openai__") :],
         )
+    if embedding_model_name.startswith("hashing__"):
+        return HashingEmbeddings(size=int(embedding_model_name[len("hashing__") :]))
 
     raise ValueError(f"Unsupported Embedding model: {embedding_model_name}")
 
 
+def get_llm_cascade() -> list[str]:
+    """Models to try in order, from the cheapest to the most capable."""
+    if app_settings.LLM_CASCADE_ENABLED:
+        return [app_settings.SMALL_LLM_MODEL, app_settings.LLM_MODEL]
+    return [app_settings.LLM_MODEL]
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """Latency and tokens of the calls of a model, see helpers.metrics."""
+
+    # Records a timestamp, no need for an executor
+    run_inline = True
+
+    def __init__(self, model: str):
+        self.model = model
+        self.seconds = LLM_SECONDS.labels(model)
+        self.starts: dict[UUID, float] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs):
+        self.starts[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any):
+        start = self.starts.pop(run_id, None)
+        if start is not None:
+            self.seconds.observe(time.perf_counter() - start)
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(generation, "message", None)
+                usage = getattr(usage, "usage_metadata", None) or {}
+                for kind in ("input_tokens", "output_tokens"):
+                    if usage.get(kind):
+                        LLM_TOKENS.labels(self.model, kind).inc(usage[kind])
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self.starts.pop(run_id, None)
+
+
+@lru_cache()
+def get_llm_metrics_handler(model: str) -> LLMMetricsHandler:
+    return LLMMetricsHandler(model)
+
+
 def get_llm_model(llm_model_name: str = app_settings.LLM_MODEL) -> BaseChatModel:
     if llm_model_name.startswith("openai__"):
         return ChatOpenAI(
@@ -27,6 +85,21 @@ def get_llm_model(llm_model_name: str = app_settings.LLM_MODEL) -> BaseChatModel
             model=llm_model_name[len("openai__") :],
             temperature=0,
             verbose=True,
+            # Usage of the streamed responses too, charged to the rate limits
+            stream_usage=True,
+            cache=get_llm_cache() if app_settings.LLM_CACHE_ENABLED else None,
+            callbacks=[get_llm_metrics_handler(llm_model_name)],
         )
 
     raise ValueError(f"Unsupported LLM model: {llm_model_name}")
+
+
+@lru_cache()
+def get_llm_slots() -> asyncio.Semaphore:
+    return asyncio.Semaphore(app_settings.LLM_MAX_CONCURRENT_CALLS)
+
+
+async def limit_llm_call(call: Awaitable[T]) -> T:
+    """Awaits `call` once one of the LLM call slots of the process is free."""
+    async with get_llm_slots():
+        return await call
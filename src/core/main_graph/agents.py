@@ -1,17 +1,44 @@
+import math
+import re
+import time
 from datetime import datetime
+from typing import Optional
 
 import orjson
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 from langchain_core.output_parsers import PydanticOutputParser
+from langgraph.config import get_config
 
-from core.llm_factories import get_llm_model
+from core.llm_factories import get_llm_cascade, get_llm_model, limit_llm_call
+from helpers import get_settings
 
-from .formatted_responses import MainAgentResponse, ValidatorDecision
+from .cancellation import with_deadline
+from .formatted_responses import (ExecutionPlan, MainAgentResponse,
+                                  ValidatorDecision)
 from .prompts import PromptsEnums
 from .states import OverallState
-from .tools import (create_event_tool, delete_event_tool, edit_event_tool,
-                    find_similar_contacts_tool, get_all_events_tool,
-                    get_calendar_invitations_tool)
+from .tool_selection import select_tools
+
+app_settings = get_settings()
+
+# Tag of the LLM calls whose output is kept as the response, the only ones whose
+# tokens are streamed
+RESPONSE_TAG = "response"
+
+# Scheduling constraints in a user message, several of them need the large model
+_CONSTRAINT_PATTERN = re.compile(
+    r"\b(?:\d{1,2}(?::\d{2})?\s*(?:am|pm)|\d{1,2}:\d{2}|before|after|between|"
+    r"except|unless|not|no later than|at least|at most|only|every|each|both|avoid|"
+    r"conflicts?|free|available|reschedule|move|monday|tuesday|wednesday|thursday|"
+    r"friday|saturday|sunday)\b",
+    re.IGNORECASE,
+)
+
+
+def _response_message(parsed: MainAgentResponse) -> AIMessage:
+    return AIMessage(
+        content=orjson.dumps(parsed.model_dump(), option=orjson.OPT_INDENT_2).decode()
+    )
 
 
 async def validator_agent(state: OverallState):
@@ -25,10 +52,14 @@ async def validator_agent(state: OverallState):
 
     messages.append(HumanMessage(content=state.user_message))
 
-    llm = get_llm_model()
-    output = await llm.with_structured_output(
-        schema=ValidatorDecision, include_raw=True, strict=True
-    ).ainvoke(messages)
+    llm = get_llm_model(app_settings.VALIDATOR_LLM_MODEL)
+    output = await with_deadline(
+        limit_llm_call(
+            llm.with_structured_output(
+                schema=ValidatorDecision, include_raw=True, strict=True
+            ).ainvoke(messages)
+        )
+    )
     parsed: ValidatorDecision = output["parsed"]
     messages.append(
         AIMessage(
@@ -46,53 +77,173 @@ async def validator_agent(state: OverallState):
     }
 
 
+def _main_agent_system_prompt() -> SystemMessage:
+    return SystemMessage(
+        content=PromptsEnums.MAIN_AGENT_SYSTEM_PROMPT.value.strip().format(
+            # To the minute, so the prompt repeats and responses can be cached
+            today_date=datetime.now()
+            .astimezone()
+            .isoformat(timespec="minutes")
+        )
+    )
+
+
+def _describe_tools(tools) -> str:
+    return "\n".join(
+        f"  - {tool.name}: {tool.description} Arguments: "
+        + orjson.dumps(tool.tool_call_schema.model_json_schema()["properties"]).decode()
+        for tool in tools
+    )
+
+
+def _is_hard_request(user_message: str) -> bool:
+    constraints = {match.lower() for match in _CONSTRAINT_PATTERN.findall(user_message)}
+    return len(constraints) >= app_settings.CASCADE_HARD_CONSTRAINTS
+
+
+def _confidence(output: AIMessage) -> Optional[float]:
+    """Geometric mean of the token probabilities of the content, if returned."""
+    tokens = (output.response_metadata.get("logprobs") or {}).get("content") or []
+    if not tokens:
+        return None
+    return math.exp(sum(token["logprob"] for token in tokens) / len(tokens))
+
+
+def _escalation_reason(output: AIMessage) -> Optional[str]:
+    if output.invalid_tool_calls:
+        return "invalid_tool_call"
+    if output.tool_calls:
+        return None
+    try:
+        PydanticOutputParser(pydantic_object=MainAgentResponse).parse(output.content)
+    except Exception:
+        return "parse_failure"
+    confidence = _confidence(output)
+    if confidence is not None and confidence < app_settings.CASCADE_MIN_CONFIDENCE:
+        return "low_confidence"
+    return None
+
+
+async def _invoke_cascade(
+    messages: list, user_message: str
+) -> tuple[AIMessage, list[dict]]:
+    """
+    Tries the models of the cascade in order, escalating while the output of a
+    model is unusable or uncertain. Hard requests go to the last model directly.
+    Returns the output and one record per model call. Only the last model is
+    tagged with RESPONSE_TAG: the others' outputs may be discarded.
+    """
+    models = get_llm_cascade()
+    # Only the schemas of the relevant tools are sent
+    tools = select_tools(user_message)
+    reason = None
+    if len(models) > 1 and _is_hard_request(user_message):
+        models, reason = models[-1:], "hard_request"
+    steps = []
+    for index, model_name in enumerate(models):
+        is_last = index == len(models) - 1
+        llm_with_tools = get_llm_model(model_name).bind_tools(
+            tools, **({} if is_last else {"logprobs": True})
+        )
+        if is_last:
+            llm_with_tools = llm_with_tools.with_config(tags=[RESPONSE_TAG])
+        start = time.perf_counter()
+        output: AIMessage = await with_deadline(
+            limit_llm_call(llm_with_tools.ainvoke(messages))
+        )
+        usage = output.usage_metadata or {}
+        steps.append(
+            {
+                "node": "main_agent",
+                "model": model_name,
+                "reason": reason,
+                "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+                "input_tokens": usage.get("input_tokens", 0),
+                "output_tokens": usage.get("output_tokens", 0),
+            }
+        )
+        if is_last:
+            break
+        reason = _escalation_reason(output)
+        if reason is None:
+            break
+    return output, steps
+
+
 async def main_agent(state: OverallState):
     if state.main_agent_messages == []:
-        system_prompt = SystemMessage(
-            content=PromptsEnums.MAIN_AGENT_SYSTEM_PROMPT.value.strip().format(
-                today_date=datetime.now().astimezone().isoformat()
-            )
-        )
-        messages = [system_prompt]
+        messages = [_main_agent_system_prompt()]
     else:
         messages = state.main_agent_messages
-        messages[0] = SystemMessage(
-            content=PromptsEnums.MAIN_AGENT_SYSTEM_PROMPT.value.strip().format(
-                today_date=datetime.now().astimezone().isoformat()
-            )
-        )
+        messages[0] = _main_agent_system_prompt()
 
-    messages.append(
-        HumanMessage(
-            content=state.user_message
-            + f"\n\n --- \n\n Only {state.tool_calls_left} tool calls left."
+    tool_calls_note = f"Only {state.tool_calls_left} tool calls left."
+    if "plan_executor" in get_config()["metadata"].get("langgraph_triggers", ()):
+        # The planner already added the user message, before the executed plan
+        messages.append(HumanMessage(content=tool_calls_note))
+    else:
+        messages.append(
+            HumanMessage(content=f"{state.user_message}\n\n --- \n\n {tool_calls_note}")
         )
-    )
 
-    llm = get_llm_model()
-    llm_with_tools = llm.bind_tools(
-        [
-            create_event_tool,
-            delete_event_tool,
-            get_all_events_tool,
-            edit_event_tool,
-            # find_free_time_tool,
-            find_similar_contacts_tool,
-            get_calendar_invitations_tool,
-        ],
-    )
-    output: AIMessage = await llm_with_tools.ainvoke(messages)
+    output, model_steps = await _invoke_cascade(messages, state.user_message)
     messages.append(output)
     if not output.tool_calls:
         try:
             parser = PydanticOutputParser(pydantic_object=MainAgentResponse)
             parsed = await parser.aparse(output.content)
         except Exception as e:
-            parsed = MainAgentResponse(response=output.content)
+            parsed = MainAgentResponse(response=output.content, events=[])
     return {
         "main_agent_messages": (
             messages if state.main_agent_messages == [] else messages[-2:]
         ),
         "response": parsed.response if not output.tool_calls else "",
         "tool_calls_left": (state.tool_calls_left - 1 if output.tool_calls else 5),
+        "model_steps": model_steps,
+    }
+
+
+async def planner_agent(state: OverallState):
+    """
+    Plans every tool call of the turn at once, for the plan executor to run.
+    Answers directly when no tool is needed, and leaves the turn to the main
+    agent when it returned neither steps nor a response.
+    """
+    system_prompt = _main_agent_system_prompt()
+    planning_prompt = SystemMessage(
+        content=PromptsEnums.PLANNER_PROMPT.value.strip().format(
+            tools=_describe_tools(select_tools(state.user_message))
+        )
+    )
+    user_message = HumanMessage(content=state.user_message)
+
+    llm = get_llm_model()
+    plan: ExecutionPlan = await with_deadline(
+        limit_llm_call(
+            llm.with_structured_output(
+                schema=ExecutionPlan, method="function_calling"
+            ).ainvoke(
+                [
+                    system_prompt,
+                    *state.main_agent_messages[1:],
+                    planning_prompt,
+                    user_message,
+                ]
+            )
+        )
+    )
+    if not plan.steps and not plan.response:
+        # The main agent adds the user message itself
+        return {"plan": [], "response": ""}
+    messages = [system_prompt] if state.main_agent_messages == [] else []
+    messages.append(user_message)
+    if not plan.steps:
+        messages.append(
+            _response_message(MainAgentResponse(response=plan.response, events=[]))
+        )
+    return {
+        "main_agent_messages": messages,
+        "plan": [step.model_dump() for step in plan.steps],
+        "response": plan.response if not plan.steps else "",
     }
@@ -0,0 +1,113 @@
+"""
+Deadlines and cancellation of the turns.
+
+A turn stops at the next safe point, the start of a node, once its deadline
+passed, its client cancelled it, or nobody has followed its stream for a
+while. A node only starts after
+the previous step was checkpointed, so a stopped turn never loses a Google
+write it made.
+"""
+
+import asyncio
+import time
+from functools import wraps
+from typing import Awaitable, Optional, TypeVar
+
+from langchain_core.runnables import Runnable, RunnableConfig
+from langgraph.config import get_config
+
+from database import get_turn_stream
+from helpers import get_settings
+from helpers.metrics import NODE_SECONDS
+
+app_settings = get_settings()
+
+# Floor of the timeouts derived from a deadline, so a call started just before
+# the deadline isn't doomed to fail
+MIN_TIMEOUT_SECONDS = 1.0
+
+T = TypeVar("T")
+
+
+class TurnCancelledError(Exception):
+    """The turn was cancelled or abandoned by its client."""
+
+
+class DeadlineExceededError(Exception):
+    """The turn ran out of its time budget."""
+
+
+def remaining_seconds(config: Optional[RunnableConfig] = None) -> Optional[float]:
+    """Time left before the turn's deadline, None if it has none."""
+    if config is None:
+        try:
+            config = get_config()
+        except RuntimeError:
+            # Called outside of a graph run
+            return None
+    deadline = config.get("configurable", {}).get("deadline")
+    if deadline is None:
+        return None
+    return max(deadline - time.time(), MIN_TIMEOUT_SECONDS)
+
+
+async def with_deadline(call: Awaitable[T]) -> T:
+    """Awaits `call`, e.g. an LLM call, within the time left to the turn."""
+    try:
+        return await asyncio.wait_for(call, timeout=remaining_seconds())
+    except asyncio.TimeoutError:
+        raise DeadlineExceededError("The turn ran out of time waiting for the LLM")
+
+
+async def check_safe_point(config: RunnableConfig, check_abandoned: bool = True):
+    """
+    Raises if the turn must stop. Whether it was abandoned costs a Redis round
+    trip, the other checks are local.
+    """
+    configurable = config.get("configurable", {})
+    deadline = configurable.get("deadline")
+    if deadline is not None and time.time() >= deadline:
+        raise DeadlineExceededError("The turn ran out of time")
+    # Set by the connection running the turn, e.g. a WebSocket session
+    cancelled = configurable.get("cancelled")
+    if cancelled is not None and cancelled.is_set():
+        raise TurnCancelledError("The turn was cancelled by its client")
+    turn_id = configurable.get("turn_id")
+    if (
+        check_abandoned
+        and app_settings.CANCEL_ABANDONED_TURNS
+        and turn_id is not None
+        and not await get_turn_stream(turn_id).is_followed()
+    ):
+        raise TurnCancelledError(f"Turn {turn_id} was abandoned")
+
+
+def at_safe_point(node, check_abandoned: bool = True):
+    """
+    Wraps a node, or a runnable like ToolNode, to check the turn first. Also
+    times the node, see helpers.metrics. Nodes cheaper than the Redis round
+    trip, e.g. without LLM calls, skip the `check_abandoned`.
+    """
+    if isinstance(node, Runnable):
+
+        async def run_runnable(state, config: RunnableConfig):
+            with _node_timer(config):
+                await check_safe_point(config, check_abandoned)
+                return await node.ainvoke(state, config)
+
+        return run_runnable
+
+    # Same signature as the node, for it to get the same arguments
+    @wraps(node)
+    async def run_node(state, **kwargs):
+        config = get_config()
+        with _node_timer(config):
+            await check_safe_point(config, check_abandoned)
+            return await node(state, **kwargs)
+
+    return run_node
+
+
+def _node_timer(config: RunnableConfig):
+    node = config.get("metadata", {}).get("langgraph_node", "unknown")
+    return NODE_SECONDS.labels(node).time()
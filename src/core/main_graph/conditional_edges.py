@@ -16,3 +16,14 @@ def continue_with_tool_call(state: OverallState, writer: StreamWriter):
             writer(TOOLS_MESSAGES[last_message.tool_calls[0]["name"]])
         return "TOOL"
     return "NO_TOOL"
+
+
+def continue_with_plan(state: OverallState) -> str:
+    if state.plan:
+        return "PLAN"
+    # Answered by the planner, or by the validator rejecting the input
+    return "NO_PLAN" if state.response else "AGENT"
+
+
+def continue_with_fast_path(state: OverallState) -> str:
+    return "ANSWERED" if state.fast_path else "AGENT"
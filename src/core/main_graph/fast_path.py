@@ -0,0 +1,158 @@
+"""
+Deterministic handling of common read-only requests, without the LLM.
+
+Only whole messages matching one of the patterns below are handled, anything
+else (names, conditions, follow-ups) goes to the agent.
+"""
+
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+import orjson
+from dateutil.relativedelta import FR, MO, SA, SU, TH, TU, WE, relativedelta
+
+from .formatted_responses import EventModel, MainAgentResponse
+from .projections import project_event
+
+WEEKDAYS = {
+    "monday": MO,
+    "tuesday": TU,
+    "wednesday": WE,
+    "thursday": TH,
+    "friday": FR,
+    "saturday": SA,
+    "sunday": SU,
+}
+
+_DATE = (
+    r"(?P<date>today|tonight|tomorrow|this week|next week|this weekend"
+    r"|(?:next )?(?:" + "|".join(WEEKDAYS) + "))"
+)
+_AGENDA_PATTERNS = [
+    re.compile(pattern.format(date=_DATE))
+    for pattern in [
+        r"(?:what'?s|what is|what do i have|anything|is there anything) (?:on |in )?(?:my )?(?:calendar|schedule|agenda)?\s*(?:for |on )?{date}",
+        r"(?:what do i have|what have i got|what'?s happening|what is happening)(?: going on)? (?:on |for )?{date}",
+        r"(?:show|list|get|check)(?: me)?(?: all)? (?:my )?(?:events|meetings|calendar|schedule|agenda)(?: for| on)? {date}",
+        r"(?:do i have |are there )?any (?:events|meetings)(?: for| on)? {date}",
+        r"(?:my )?(?:events|meetings|calendar|schedule|agenda) (?:for |on )?{date}",
+        r"{date}'?s? (?:events|meetings|calendar|schedule|agenda)",
+    ]
+]
+_INVITATIONS_PATTERN = re.compile(
+    r"(?:(?:do i have|are there|show|list|check|get|what are)(?: me)? )?(?:any |my |all )?(?:my )?"
+    r"(?:pending |new |open |unanswered )?(?:calendar |meeting |event )?(?:invitations|invites)"
+    r"(?: pending| waiting| to answer)?"
+)
+
+
+@dataclass
+class FastPathIntent:
+    tool: str
+    args: dict
+    label: str = ""
+
+
+def _normalize(message: str) -> str:
+    message = message.lower().replace("’", "'")
+    message = re.sub(r"[?!.,]+", " ", message)
+    message = re.sub(r"^(?:hi|hey|hello|please|so|ok|okay)\s+", "", message.strip())
+    message = re.sub(r"\s+please$", "", message)
+    return " ".join(message.split())
+
+
+def _date_range(date: str, now: datetime) -> tuple[datetime, datetime, str]:
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if date in ("today", "tonight"):
+        return today, today, "today"
+    if date == "tomorrow":
+        tomorrow = today + timedelta(days=1)
+        return tomorrow, tomorrow, "tomorrow"
+    if date in ("this week", "next week"):
+        monday = today + relativedelta(weekday=MO(-1))
+        if date == "next week":
+            monday += timedelta(days=7)
+            return monday, monday + timedelta(days=6), "next week"
+        # The rest of this week
+        return today, monday + timedelta(days=6), "this week"
+    if date == "this weekend":
+        saturday = today + relativedelta(weekday=SA(+1))
+        if today.weekday() == 6:
+            saturday = today
+        return saturday, today + relativedelta(weekday=SU(+1)), "this weekend"
+    # The coming weekday, "next" included, never today
+    name = date.removeprefix("next ")
+    day = today + relativedelta(days=1, weekday=WEEKDAYS[name](+1))
+    return day, day, f"on {name.capitalize()} {day.strftime('%B %-d')}"
+
+
+def match_intent(message: str, now: datetime) -> Optional[FastPathIntent]:
+    """Returns the tool call answering `message`, None if it isn't recognized."""
+    message = _normalize(message)
+    for pattern in _AGENDA_PATTERNS:
+        match = pattern.fullmatch(message)
+        if match:
+            start, end, label = _date_range(match["date"], now)
+            return FastPathIntent(
+                tool="get_all_events_tool",
+                args={
+                    "time_min": start.isoformat(),
+                    "time_max": end.isoformat(),
+                    "limit": 50,
+                },
+                label=label,
+            )
+    if _INVITATIONS_PATTERN.fullmatch(message):
+        return FastPathIntent(tool="get_calendar_invitations_tool", args={})
+    return None
+
+
+def _events(output) -> list[dict]:
+    if isinstance(output, str):
+        try:
+            output = orjson.loads(output)
+        except orjson.JSONDecodeError:
+            # "No events" messages
+            return []
+    return output if isinstance(output, list) else []
+
+
+def _event_metadata(event: dict) -> dict:
+    """What the client displays of an event, from its projection or payload."""
+    if isinstance(event.get("start"), dict):
+        # Raw payload, in verbose mode
+        event = project_event(event)
+    return {
+        "event_id": event.get("id", ""),
+        "title": event.get("title", ""),
+        "start": event.get("start", ""),
+        "end": event.get("end", ""),
+        # "email:responseStatus[:me]"
+        "attendees": [attendee.split(":", 1)[0] for attendee in event.get("att", [])],
+    }
+
+
+def render_response(intent: FastPathIntent, output) -> MainAgentResponse:
+    """The response the agent would give for the tool output, from templates."""
+    events = _events(output)
+    if intent.tool == "get_calendar_invitations_tool":
+        response = (
+            f"- You have {len(events)} pending invitation{'s' * (len(events) != 1)}:"
+            if events
+            else "- You have no pending invitations."
+        )
+    else:
+        response = (
+            f"- Here are your events {intent.label}:"
+            if events
+            else f"- You have no events {intent.label}."
+        )
+    return MainAgentResponse(
+        response=response,
+        events=[
+            EventModel(type="existing", metadata=_event_metadata(event))
+            for event in events
+        ],
+    )
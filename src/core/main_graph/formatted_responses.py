@@ -16,3 +16,24 @@ class MainAgentResponse(BaseModel):
     events: list[EventModel] = Field(
         ..., description="List of events to be displayed to the user"
     )
+
+
+class PlanStep(BaseModel):
+    id: str = Field(..., description="Unique step id, e.g. 's1'")
+    tool: str = Field(..., description="Name of the tool to call")
+    args: dict = Field(
+        ...,
+        description="Tool arguments. A value '$<step id>' or '$<step id>.<key or index>...' is replaced with the output of that step",
+    )
+    depends_on: list[str] = Field(
+        default_factory=list, description="Ids of the steps whose output is needed"
+    )
+
+
+class ExecutionPlan(BaseModel):
+    steps: list[PlanStep] = Field(
+        ..., description="Tool calls to run, empty if no tool is needed"
+    )
+    response: str = Field(
+        None, description="Response to the user message when no tool is needed"
+    )
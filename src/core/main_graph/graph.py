@@ -11,47 +11,74 @@ from langgraph.prebuilt import ToolNode
 from database import get_redis_saver
 from helpers import get_settings
 
-from .agents import main_agent, validator_agent
-from .conditional_edges import (continue_with_tool_call,
-                                continue_with_validator_decision)
+from .agents import main_agent, planner_agent
+from .cancellation import at_safe_point
+from .conditional_edges import (continue_with_fast_path, continue_with_plan,
+                                continue_with_tool_call)
+from .nodes import fast_path_router, plan_executor, with_speculative_validation
 from .states import InputState, OutputState, OverallState
-from .tools import (create_event_tool, delete_event_tool, edit_event_tool,
-                    find_similar_contacts_tool, get_all_events_tool,
-                    get_calendar_invitations_tool)
+from .tools import MAIN_AGENT_TOOLS
 
 app_settings = get_settings()
 
 
 builder = StateGraph(state_schema=OverallState, input=InputState, output=OutputState)
 
-# Nodes
-# builder.add_node("validator_agent", validator_agent)
-builder.add_node("main_agent", main_agent)
+# The first agent call of a turn runs alongside the input validator
+entry_agent = (
+    "planner_agent"
+    if app_settings.GRAPH_MODE == "plan_execute"
+    else "validated_main_agent"
+)
+validated = (
+    with_speculative_validation
+    if app_settings.VALIDATOR_ENABLED
+    else lambda agent: agent
+)
+
+# Nodes, each first checking the turn wasn't abandoned nor is past its deadline.
+# The router answers from a regex match and at most one read, it isn't worth
+# checking that its client is still there.
+builder.add_node(
+    "fast_path_router", at_safe_point(fast_path_router, check_abandoned=False)
+)
+builder.add_node("main_agent", at_safe_point(main_agent))
 builder.add_node(
     "tools",
-    ToolNode(
-        [
-            create_event_tool,
-            delete_event_tool,
-            get_all_events_tool,
-            edit_event_tool,
-            find_similar_contacts_tool,
-            get_calendar_invitations_tool,
-        ],
-        messages_key="main_agent_messages",
-    ),
+    at_safe_point(ToolNode(MAIN_AGENT_TOOLS, messages_key="main_agent_messages")),
 )
+if app_settings.GRAPH_MODE == "plan_execute":
+    builder.add_node("planner_agent", at_safe_point(validated(planner_agent)))
+    builder.add_node("plan_executor", at_safe_point(plan_executor))
+else:
+    builder.add_node("validated_main_agent", at_safe_point(validated(main_agent)))
 
 # Edges
-builder.add_edge(START, "main_agent")
-# builder.add_conditional_edges(
-#     "validator_agent",
-#     continue_with_validator_decision,
-#     {
-#         True: "main_agent",
-#         False: END,
-#     },
-# )
+# Common read-only requests are answered without the LLM
+builder.add_edge(START, "fast_path_router")
+builder.add_conditional_edges(
+    "fast_path_router",
+    continue_with_fast_path,
+    {
+        "ANSWERED": END,
+        "AGENT": entry_agent,
+    },
+)
+if app_settings.GRAPH_MODE == "plan_execute":
+    # One LLM call plans the tool calls, the main agent writes the response
+    builder.add_conditional_edges(
+        "planner_agent",
+        continue_with_plan,
+        {"PLAN": "plan_executor", "NO_PLAN": END, "AGENT": "main_agent"},
+    )
+    builder.add_edge("plan_executor", "main_agent")
+else:
+    # A rejected input ends with a response and no tool calls
+    builder.add_conditional_edges(
+        "validated_main_agent",
+        continue_with_tool_call,
+        {"TOOL": "tools", "NO_TOOL": END},
+    )
 builder.add_conditional_edges(
     "main_agent", continue_with_tool_call, {"TOOL": "tools", "NO_TOOL": END}
 )
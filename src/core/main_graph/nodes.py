@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime
+from typing import Any
+
+import orjson
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.prebuilt.tool_node import (TOOL_CALL_ERROR_TEMPLATE,
+                                          msg_content_output)
+from langgraph.types import StreamWriter
+
+from helpers import get_settings
+
+from .agents import (_main_agent_system_prompt, _response_message,
+                     validator_agent)
+from .cancellation import DeadlineExceededError, TurnCancelledError
+from .fast_path import match_intent, render_response
+from .formatted_responses import MainAgentResponse
+from .states import OverallState
+from .tools import MAIN_AGENT_TOOLS, TOOLS_MESSAGES
+
+app_settings = get_settings()
+logger = logging.getLogger(__name__)
+
+REFERENCE_PREFIX = "$"
+
+# Custom stream event of a speculatively run agent whose input was accepted:
+# its response can be streamed from then on
+INPUT_VALIDATED = {"input_validated": True}
+
+
+def _call_id() -> str:
+    return f"call_{uuid.uuid4().hex[:24]}"
+
+
+def with_speculative_validation(agent):
+    """
+    Wraps the first agent node of a turn so the validator runs concurrently with
+    it instead of in front of it. A rejection cancels the agent and answers with
+    the validator's response. The node only returns once validation finished, so
+    no tool runs on an input that wasn't validated, and writes INPUT_VALIDATED
+    to the stream once it's accepted.
+    """
+
+    async def validated_agent(state: OverallState, writer: StreamWriter):
+        agent_task = asyncio.create_task(agent(state))
+        try:
+            try:
+                decision = await validator_agent(state)
+            except (DeadlineExceededError, TurnCancelledError):
+                raise
+            except Exception as e:
+                # Failing open, the validator only filters off-topic input
+                logger.warning("Validator failed, accepting the message: %r", e)
+                decision = {"validator_messages": [], "is_valid_user_input": True}
+
+            if decision["is_valid_user_input"]:
+                writer(INPUT_VALIDATED)
+                update = await agent_task
+                return {
+                    **update,
+                    "validator_messages": decision["validator_messages"],
+                    "is_valid_user_input": True,
+                }
+        finally:
+            # Rejected input, or the node itself stopped: cancelled, deadline
+            if not agent_task.done():
+                agent_task.cancel()
+            elif not agent_task.cancelled():
+                # Its error doesn't matter when its output isn't used
+                agent_task.exception()
+
+        response = (
+            decision["response"]
+            or "Sorry, I can only help with managing your calendar and contacts."
+        )
+        messages = (
+            [_main_agent_system_prompt()] if state.main_agent_messages == [] else []
+        )
+        messages += [
+            HumanMessage(content=state.user_message),
+            _response_message(MainAgentResponse(response=response, events=[])),
+        ]
+        return {
+            "main_agent_messages": messages,
+            "validator_messages": decision["validator_messages"],
+            "is_valid_user_input": False,
+            "response": response,
+            "plan": [],
+            "tool_calls_left": 5,
+        }
+
+    return validated_agent
+
+
+async def fast_path_router(
+    state: OverallState, config: RunnableConfig, writer: StreamWriter
+):
+    """
+    Answers recognized read-only requests with a direct tool call and a
+    templated response, recorded like an agent turn so follow-ups keep their
+    context. Anything else, or a failing tool, goes to the agent. Being the
+    first node of every turn, it resets the turn's model steps.
+    """
+    if not app_settings.FAST_PATH_ENABLED:
+        return {"fast_path": False, "model_steps": None}
+    intent = match_intent(state.user_message, datetime.now().astimezone())
+    if intent is None:
+        return {"fast_path": False, "model_steps": None}
+    tool = {tool.name: tool for tool in MAIN_AGENT_TOOLS}[intent.tool]
+    writer(TOOLS_MESSAGES[tool.name])
+    try:
+        output = await tool.ainvoke(intent.args, config=config)
+    except Exception:
+        return {"fast_path": False, "model_steps": None}
+    parsed = render_response(intent, output)
+
+    call_id = _call_id()
+    messages = [_main_agent_system_prompt()] if state.main_agent_messages == [] else []
+    messages += [
+        HumanMessage(content=state.user_message),
+        AIMessage(
+            content="",
+            tool_calls=[{"id": call_id, "name": tool.name, "args": intent.args}],
+        ),
+        ToolMessage(
+            content=msg_content_output(output), name=tool.name, tool_call_id=call_id
+        ),
+        _response_message(parsed),
+    ]
+    return {
+        "main_agent_messages": messages,
+        "response": parsed.response,
+        "fast_path": True,
+        "model_steps": None,
+    }
+
+
+def _select(output: Any, path: list[str]) -> Any:
+    if path and isinstance(output, str):
+        # Tools returning JSON text, e.g. projected events
+        output = orjson.loads(output)
+    for part in path:
+        if isinstance(output, dict):
+            output = output[part]
+        else:
+            output = output[int(part)]
+    return output
+
+
+def _resolve_references(value: Any, outputs: dict[str, Any]) -> Any:
+    """Replaces '$<step id>[.<key or index>...]' strings with step outputs."""
+    if isinstance(value, dict):
+        return {key: _resolve_references(item, outputs) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_resolve_references(item, outputs) for item in value]
+    if isinstance(value, str) and value.startswith(REFERENCE_PREFIX):
+        step_id, *path = value[len(REFERENCE_PREFIX) :].split(".")
+        if step_id in outputs:
+            return _select(outputs[step_id], path)
+    return value
+
+
+async def plan_executor(
+    state: OverallState, config: RunnableConfig, writer: StreamWriter
+):
+    """
+    Runs the planned tool calls, each as soon as the steps it depends on are
+    done, and records them as a single tool calling round for the main agent.
+    A failed step fails the steps depending on it; the main agent sees the
+    errors and can recover with regular tool calls.
+    """
+    tools_by_name = {tool.name: tool for tool in MAIN_AGENT_TOOLS}
+    outputs: dict[str, Any] = {}
+    errors: dict[str, str] = {}
+    called_args = {step["id"]: step["args"] for step in state.plan}
+
+    async def run_step(step: dict):
+        failed = [dep for dep in step["depends_on"] if dep in errors]
+        if failed:
+            errors[step["id"]] = f"Skipped, depends on failed steps {failed}."
+            return
+        tool = tools_by_name.get(step["tool"])
+        if tool is None:
+            errors[step["id"]] = f"Unknown tool {step['tool']}."
+            return
+        try:
+            args = _resolve_references(step["args"], outputs)
+            called_args[step["id"]] = args
+            if tool.name in TOOLS_MESSAGES:
+                writer(TOOLS_MESSAGES[tool.name])
+            outputs[step["id"]] = await tool.ainvoke(args, config=config)
+        except Exception as e:
+            errors[step["id"]] = TOOL_CALL_ERROR_TEMPLATE.format(error=repr(e))
+
+    pending = list(state.plan)
+    while pending:
+        ready = [
+            step
+            for step in pending
+            if all(dep in outputs or dep in errors for dep in step["depends_on"])
+        ]
+        if not ready:
+            # Cyclic or unknown dependencies
+            for step in pending:
+                errors[step["id"]] = "Skipped, its dependencies can't be resolved."
+            break
+        await asyncio.gather(*(run_step(step) for step in ready))
+        pending = [step for step in pending if step not in ready]
+
+    call_ids = {step["id"]: _call_id() for step in state.plan}
+    messages = [
+        AIMessage(
+            content="",
+            tool_calls=[
+                {
+                    "id": call_ids[step["id"]],
+                    "name": step["tool"],
+                    "args": called_args[step["id"]],
+                }
+                for step in state.plan
+            ],
+        )
+    ]
+    for step in state.plan:
+        if step["id"] in errors:
+            content, status = errors[step["id"]], "error"
+        else:
+            content, status = msg_content_output(outputs[step["id"]]), "success"
+        messages.append(
+            ToolMessage(
+                content=content,
+                name=step["tool"],
+                tool_call_id=call_ids[step["id"]],
+                status=status,
+            )
+        )
+    return {
+        "main_agent_messages": messages,
+        "plan": [],
+        "tool_calls_left": state.tool_calls_left - 1,
+    }
@@ -0,0 +1,98 @@
+"""
+Compact projections of Google payloads returned by tools.
+
+Tool outputs are stored in the checkpoint and sent back to the LLM on every
+later turn, so only the fields the agent acts on are kept, under short stable
+keys. Verbose mode (VERBOSE_TOOL_OUTPUT, or `verbose_tool_output` in the graph
+configurable) returns the raw payloads instead.
+"""
+
+from typing import Callable, Optional
+
+import orjson
+from langchain_core.runnables import RunnableConfig
+
+from helpers import get_settings
+
+app_settings = get_settings()
+
+DESCRIPTION_MAX_LENGTH = 300
+
+
+def _time(value: dict) -> Optional[str]:
+    return value.get("dateTime") or value.get("date") if value else None
+
+
+def _description(event: dict) -> Optional[str]:
+    description = event.get("description")
+    if description and len(description) > DESCRIPTION_MAX_LENGTH:
+        return description[:DESCRIPTION_MAX_LENGTH] + "…"
+    return description
+
+
+def _attendees(event: dict) -> Optional[list[str]]:
+    attendees = event.get("attendees")
+    if not attendees:
+        return None
+    return [
+        f"{attendee.get('email', '')}:{attendee.get('responseStatus', 'needsAction')}"
+        + (":me" if attendee.get("self") else "")
+        for attendee in attendees
+    ]
+
+
+def _organizer(event: dict) -> Optional[str]:
+    organizer = event.get("organizer", {})
+    return None if organizer.get("self") else organizer.get("email")
+
+
+def _status(event: dict) -> Optional[str]:
+    status = event.get("status")
+    return None if status == "confirmed" else status
+
+
+# Short key -> extractor, in output order. Empty values are dropped.
+EVENT_PROJECTION: dict[str, Callable[[dict], object]] = {
+    "id": lambda event: event.get("id"),
+    "title": lambda event: event.get("summary"),
+    "start": lambda event: _time(event.get("start")),
+    "end": lambda event: _time(event.get("end")),
+    "loc": lambda event: event.get("location"),
+    "desc": _description,
+    "att": _attendees,
+    "org": _organizer,
+    "rec": lambda event: event.get("recurrence"),
+    "color": lambda event: event.get("colorId"),
+    "status": _status,
+    "cal": lambda event: event.get("calendarId"),
+}
+
+
+def is_verbose(config: Optional[RunnableConfig]) -> bool:
+    configurable = (config or {}).get("configurable", {})
+    return configurable.get("verbose_tool_output", app_settings.VERBOSE_TOOL_OUTPUT)
+
+
+def project_event(event: dict) -> dict:
+    projected = {}
+    for key, extract in EVENT_PROJECTION.items():
+        value = extract(event)
+        if value not in (None, "", []):
+            projected[key] = value
+    return projected
+
+
+def dump(value, config: Optional[RunnableConfig] = None) -> str:
+    if is_verbose(config):
+        return orjson.dumps(value, option=orjson.OPT_INDENT_2).decode()
+    return orjson.dumps(value).decode()
+
+
+def format_event(event: dict, config: Optional[RunnableConfig] = None) -> str:
+    return dump(event if is_verbose(config) else project_event(event), config)
+
+
+def format_events(events: list[dict], config: Optional[RunnableConfig] = None) -> str:
+    if is_verbose(config):
+        return dump(events, config)
+    return dump([project_event(event) for event in events], config)
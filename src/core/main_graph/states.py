@@ -1,10 +1,17 @@
 import operator
-from typing import Annotated
+from typing import Annotated, Optional
 
 from langchain_core.messages import BaseMessage
 from pydantic import BaseModel
 
 
+def add_turn_steps(steps: list[dict], update: Optional[list[dict]]) -> list[dict]:
+    """Appends the model calls of the turn, a None update starts a new turn."""
+    if update is None:
+        return []
+    return steps + update
+
+
 class InputState(BaseModel):
     user_message: str
 
@@ -16,6 +23,10 @@ class OverallState(BaseModel):
     is_valid_user_input: bool = False
     response: str = None
     tool_calls_left: int = 5
+    plan: list[dict] = []
+    fast_path: bool = False
+    # Model calls of the current turn only, reset by its first node
+    model_steps: Annotated[list[dict], add_turn_steps] = []
 
 
 class OutputState(BaseModel):
@@ -0,0 +1,197 @@
+"""
+Memoization of read-only tool calls, scoped to a (user, thread).
+
+Each cached result is keyed by the tool name, its normalized arguments and the
+current version of every scope it read (a calendar, or the contacts). Write
+tools and calendar push notifications bump the versions of the scopes they
+change, which makes the entries that read them unreachable. Entries are only
+served for TOOL_CACHE_TTL_SECONDS, which bounds how stale a read can be when
+the calendar changes on Google's side and no push channel announces it.
+"""
+
+import hashlib
+import inspect
+import time
+from functools import lru_cache, wraps
+from typing import Callable, Iterable, Optional
+
+import orjson
+from langchain_core.runnables import RunnableConfig
+from redis import Redis
+
+from core.google_api import get_user_id
+from database import get_redis_client
+from database.redis import REDIS_KEY_SEPARATOR
+from helpers import get_settings
+
+from .projections import is_verbose
+
+app_settings = get_settings()
+
+CONTACTS_SCOPE = "contacts"
+
+# KEYS: entries of the thread, stats, then the version of each scope read
+# ARGV: entry without the versions, tool name, oldest servable put time
+_LOOKUP_SCRIPT = """
+local entry = ARGV[1]
+for i = 3, #KEYS do
+    entry = entry .. ':' .. (redis.call('get', KEYS[i]) or '0')
+end
+local cached = redis.call('hmget', KEYS[1], entry, entry .. ':at')
+local fresh = cached[1] and (tonumber(cached[2]) or 0) >= tonumber(ARGV[3])
+redis.call('hincrby', KEYS[2], ARGV[2] .. (fresh and ':hits' or ':misses'), 1)
+if fresh then
+    return {entry, cached[1]}
+end
+return {entry}
+"""
+
+
+def calendar_scope(calendar_id: str) -> str:
+    return REDIS_KEY_SEPARATOR.join(["calendar", calendar_id])
+
+
+class ToolResultCache:
+    """
+    Layout:
+    - `tool_cache:{user}:{thread}`: hash entry -> tool result, and
+      `{entry}:at` -> time it was put
+    - `tool_cache_version:{user}:{scope}`: write counter of a scope, no expiry
+    - `tool_cache_stats`: hash `{tool}:hits` / `{tool}:misses` -> count
+    """
+
+    STATS_KEY = "tool_cache_stats"
+
+    def __init__(self, conn: Redis, ttl_seconds: int):
+        self.conn = conn
+        self.ttl_seconds = ttl_seconds
+
+    @staticmethod
+    def _key(user_id: str, thread_id: str) -> str:
+        return REDIS_KEY_SEPARATOR.join(["tool_cache", user_id, thread_id])
+
+    @staticmethod
+    def _version_key(user_id: str, scope: str) -> str:
+        return REDIS_KEY_SEPARATOR.join(["tool_cache_version", user_id, scope])
+
+    def get(
+        self,
+        user_id: str,
+        thread_id: str,
+        tool_name: str,
+        args: dict,
+        scopes: list[str],
+    ) -> tuple[str, Optional[object]]:
+        """
+        Returns the entry of the call and its cached result, if any, in one
+        round trip: the scope versions are read and appended by a script.
+        """
+        digest = hashlib.sha256(
+            orjson.dumps([args, scopes], option=orjson.OPT_SORT_KEYS)
+        ).hexdigest()
+        lookup = self.conn.register_script(_LOOKUP_SCRIPT)
+        entry, *data = lookup(
+            keys=[
+                self._key(user_id, thread_id),
+                self.STATS_KEY,
+                *(self._version_key(user_id, scope) for scope in scopes),
+            ],
+            args=[
+                f"{tool_name}{REDIS_KEY_SEPARATOR}{digest}",
+                tool_name,
+                time.time() - self.ttl_seconds,
+            ],
+        )
+        return entry.decode(), orjson.loads(data[0]) if data else None
+
+    def put(self, user_id: str, thread_id: str, entry: str, result):
+        key = self._key(user_id, thread_id)
+        pipeline = self.conn.pipeline(transaction=False)
+        pipeline.hset(
+            key,
+            mapping={entry: orjson.dumps(result), f"{entry}:at": time.time()},
+        )
+        pipeline.expire(key, self.ttl_seconds)
+        pipeline.execute()
+
+    def invalidate(self, user_id: str, scopes: Iterable[str]):
+        """Bumps the scopes, for every thread of the user."""
+        pipeline = self.conn.pipeline(transaction=False)
+        for scope in scopes:
+            # Never expires: a counter starting over would make the entries
+            # of its earlier versions reachable again
+            pipeline.incr(self._version_key(user_id, scope))
+        pipeline.execute()
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        counts = {
+            field.decode(): int(value)
+            for field, value in self.conn.hgetall(self.STATS_KEY).items()
+        }
+        tools = sorted({field.rsplit(":", 1)[0] for field in counts})
+        stats = {}
+        for tool_name in tools:
+            hits = counts.get(f"{tool_name}:hits", 0)
+            misses = counts.get(f"{tool_name}:misses", 0)
+            stats[tool_name] = {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            }
+        return stats
+
+
+@lru_cache()
+def get_tool_cache() -> ToolResultCache:
+    return ToolResultCache(get_redis_client(), app_settings.TOOL_CACHE_TTL_SECONDS)
+
+
+def memoize_tool(
+    scopes: Callable[[dict], list[str]],
+    normalize: Optional[Callable[[dict], dict]] = None,
+):
+    """
+    Caches the results of a read-only tool function per thread. Goes below
+    `@tool`, which keeps reading the signature and docstring of the function.
+
+    Args:
+        scopes: Maps the call arguments to the scopes the tool reads.
+        normalize: Maps the call arguments to equivalent canonical ones, so calls
+            with the same effect share an entry.
+    """
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            call_args = dict(bound.arguments)
+            config = call_args.pop("config", None)
+            thread_id = (config or {}).get("configurable", {}).get("thread_id")
+            if not app_settings.TOOL_CACHE_ENABLED or thread_id is None:
+                return func(*args, **kwargs)
+            user_id = get_user_id(config)
+            # The output format is part of the result
+            call_args["verbose"] = is_verbose(config)
+            cache = get_tool_cache()
+            entry, result = cache.get(
+                user_id,
+                thread_id,
+                func.__name__,
+                normalize(call_args) if normalize else call_args,
+                scopes(call_args),
+            )
+            if result is None:
+                result = func(*args, **kwargs)
+                cache.put(user_id, thread_id, entry, result)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def invalidate_tool_cache(config: Optional[RunnableConfig], scopes: Iterable[str]):
+    get_tool_cache().invalidate(get_user_id(config), scopes)
@@ -0,0 +1,139 @@
+"""
+Selection of the tools bound to the agent for a user message.
+
+A keyword classifier maps the message to tool families. It leans towards
+recall: a family is included on any of its cues, writes bring the lookups they
+need, and a message without any cue (e.g. "yes, go ahead") gets every tool.
+"""
+
+import re
+from functools import lru_cache
+
+from langchain_core.tools import BaseTool
+
+from helpers import get_settings
+
+from .tools import (MAIN_AGENT_TOOLS, bulk_create_events_tool,
+                    bulk_delete_events_tool, bulk_edit_events_tool,
+                    create_event_tool, delete_event_tool, edit_event_tool,
+                    find_similar_contacts_tool, get_all_events_tool,
+                    get_calendar_invitations_tool, get_event_tool,
+                    resolve_contacts_tool)
+
+app_settings = get_settings()
+
+TOOL_FAMILIES: dict[str, list[BaseTool]] = {
+    "events_read": [get_all_events_tool, get_event_tool],
+    "events_write": [
+        create_event_tool,
+        edit_event_tool,
+        delete_event_tool,
+        bulk_create_events_tool,
+        bulk_edit_events_tool,
+        bulk_delete_events_tool,
+    ],
+    "contacts": [find_similar_contacts_tool, resolve_contacts_tool],
+    "invitations": [get_calendar_invitations_tool],
+}
+
+# Families a family needs, e.g. availability checks and attendees for writes
+FAMILY_DEPENDENCIES = {
+    "events_write": ["events_read", "contacts"],
+}
+
+_FAMILY_CUES = {
+    family: re.compile(r"\b(?:" + "|".join(cues) + r")", re.IGNORECASE)
+    for family, cues in {
+        "events_read": [
+            "what",
+            "when",
+            "show",
+            "list",
+            "check",
+            "see",
+            "free",
+            "busy",
+            "availab",
+            "agenda",
+            "schedule",
+            "calendar",
+            "events?",
+            "meetings?",
+            "anything",
+        ],
+        "events_write": [
+            "create",
+            "add",
+            "schedule",
+            "book",
+            "set up",
+            "arrange",
+            "organi[sz]e",
+            "plan",
+            "make",
+            "put",
+            "block",
+            "move",
+            "reschedul",
+            "push",
+            "postpone",
+            "delay",
+            "shift",
+            "bring forward",
+            "change",
+            "update",
+            "edit",
+            "rename",
+            "extend",
+            "shorten",
+            "cancel",
+            "delete",
+            "remove",
+            "clear",
+            "invite",
+            "repeat",
+            "recurr",
+            "every",
+        ],
+        "contacts": [
+            "contact",
+            "e-?mail",
+            "phone",
+            "number",
+            "address",
+            "who",
+        ],
+        "invitations": [
+            "invit",
+            "rsvp",
+            "request",
+            "respond",
+            "repl",
+            "accept",
+            "decline",
+        ],
+    }.items()
+}
+
+
+@lru_cache(maxsize=4096)
+def _select_families(normalized_message: str) -> tuple[str, ...]:
+    families = {
+        family
+        for family, cues in _FAMILY_CUES.items()
+        if cues.search(normalized_message)
+    }
+    for family in list(families):
+        families.update(FAMILY_DEPENDENCIES.get(family, []))
+    return tuple(sorted(families))
+
+
+def select_tools(user_message: str) -> list[BaseTool]:
+    """The tools relevant to `user_message`, in MAIN_AGENT_TOOLS order."""
+    if not app_settings.TOOL_SELECTION_ENABLED:
+        return MAIN_AGENT_TOOLS
+    families = _select_families(" ".join(user_message.lower().split()))
+    if not families:
+        return MAIN_AGENT_TOOLS
+    selected = {tool.name for family in families for tool in TOOL_FAMILIES[family]}
+    return [tool for tool in MAIN_AGENT_TOOLS if tool.name in selected]
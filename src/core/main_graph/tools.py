@@ -1,71 +1,162 @@
-import os
-import pickle
 from datetime import datetime, timezone
-from difflib import SequenceMatcher
-from typing import List, Optional, Tuple
+from typing import Callable, List, Optional, Tuple
 
-import orjson
-from google.auth.transport.requests import Request
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from googleapiclient.http import HttpRequest
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool
 
-# ---- Helper to get Google Calendar service for the user ----
+from core.google_api import (EventConflictError, execute, execute_batch,
+                             get_contact_embeddings, get_contact_index,
+                             get_event, get_event_cache,
+                             get_pending_invitations,
+                             get_user_calendar_service, get_user_id,
+                             get_user_people_service, invalidate_contact_index,
+                             patch_event, patch_event_request)
+from helpers import get_settings
 
-SCOPES = ["https://www.googleapis.com/auth/calendar"]
-PEOPLE_SCOPES = ["https://www.googleapis.com/auth/contacts.readonly"]
+from .cancellation import remaining_seconds
+from .projections import dump, format_event, format_events
+from .tool_cache import (CONTACTS_SCOPE, calendar_scope, invalidate_tool_cache,
+                         memoize_tool)
 
+app_settings = get_settings()
 
-def get_user_calendar_service():
-    """
-    Returns an authorized Google Calendar API service instance for the user using OAuth2.
-    Requires client_secret.json in the working directory.
-    """
-    creds = None
-    # The file token.pickle stores the user's access and refresh tokens
-    if os.path.exists("token.pickle"):
-        with open("token.pickle", "rb") as token:
-            creds = pickle.load(token)
-    # If there are no (valid) credentials, let the user log in.
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(
-                "assets/OAuth Client ID mcp-test.json", SCOPES
-            )
-            creds = flow.run_local_server(port=0)
-        # Save the credentials for the next run
-        with open("token.pickle", "wb") as token:
-            pickle.dump(creds, token)
-    service = build("calendar", "v3", credentials=creds)
-    return service
-
-
-def get_user_people_service():
+# ---- Helpers ----
+
+
+def _build_event(
+    summary: str,
+    start: str,
+    end: str,
+    description: Optional[str] = None,
+    location: Optional[str] = None,
+    color_id: Optional[str] = None,
+    attendees: Optional[List[str]] = None,
+    recurrence: Optional[str] = None,
+) -> dict:
+    event = {
+        "summary": summary,
+        "start": {"dateTime": start},
+        "end": {"dateTime": end},
+    }
+    if description:
+        event["description"] = description
+    if location:
+        event["location"] = location
+    if color_id:
+        event["colorId"] = color_id
+    if attendees:
+        event["attendees"] = [{"email": email} for email in attendees]
+    if recurrence:
+        event["recurrence"] = [recurrence]
+    return event
+
+
+def _build_event_patch(changes: dict) -> dict:
+    updated_event = {}
+    if "summary" in changes:
+        updated_event["summary"] = changes["summary"]
+    if "description" in changes:
+        updated_event["description"] = changes["description"]
+    if "location" in changes:
+        updated_event["location"] = changes["location"]
+    if "colorId" in changes:
+        updated_event["colorId"] = changes["colorId"]
+    if "start" in changes:
+        updated_event["start"] = {"dateTime": changes["start"]}
+    if "end" in changes:
+        updated_event["end"] = {"dateTime": changes["end"]}
+    if "attendees" in changes:
+        updated_event["attendees"] = [
+            {"email": email} for email in changes["attendees"]
+        ]
+    if "recurrence" in changes:
+        updated_event["recurrence"] = [changes["recurrence"]]
+    return updated_event
+
+
+def _day_range(time_min: Optional[str], time_max: Optional[str]) -> tuple[str, str]:
+    """Widens the range to whole days, today by default."""
+    if not time_min:
+        start = datetime.now(tz=timezone.utc)
+    else:
+        start = datetime.fromisoformat(time_min)
+    start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    if not time_max:
+        end = datetime.now(tz=timezone.utc)
+    else:
+        end = datetime.fromisoformat(time_max)
+    end = end.replace(hour=23, minute=59, second=59, microsecond=999999)
+    return start.isoformat(), end.isoformat()
+
+
+def _bulk_report(
+    action: str, results: list[dict], items: list, config: RunnableConfig
+) -> str:
+    succeeded = sum(result["ok"] for result in results)
+    report = [
+        (
+            {"index": index, "status": "ok", **item}
+            if result["ok"]
+            else {"index": index, "status": "failed", "error": result["error"]}
+        )
+        for index, (result, item) in enumerate(zip(results, items))
+    ]
+    return (
+        f"{succeeded} of {len(results)} events {action} successfully.\n\n"
+        f"{dump(report, config)}"
+    )
+
+
+def _execute_bulk(
+    service, items: list, build_request: Callable, user_id: str
+) -> list[dict]:
     """
-    Returns an authorized Google People API service instance for the user using OAuth2.
-    Requires client_secret.json in the working directory.
+    `execute_batch` of the request built from each item. Items it can't be
+    built from get a failed result instead of failing the whole call.
     """
-    creds = None
-    if os.path.exists("token_people.pickle"):
-        with open("token_people.pickle", "rb") as token:
-            creds = pickle.load(token)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            try:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    "assets/OAuth Client ID mcp-test.json", PEOPLE_SCOPES
-                )
-                creds = flow.run_local_server(port=0)
-            except Exception as e:
-                print(f"Error getting user people service: {e}")
-        with open("token_people.pickle", "wb") as token:
-            pickle.dump(creds, token)
-    service = build("people", "v1", credentials=creds)
-    return service
+    results: list[Optional[dict]] = [None] * len(items)
+    requests = {}
+    for index, item in enumerate(items):
+        try:
+            requests[index] = build_request(item)
+        except (TypeError, ValueError, KeyError, AttributeError) as e:
+            results[index] = {"ok": False, "error": f"Invalid item: {e}"}
+    for index, result in zip(
+        requests, execute_batch(service, list(requests.values()), user_id)
+    ):
+        results[index] = result
+    return results
+
+
+def _edit_event_id(edit) -> Optional[str]:
+    event_id = edit.get("event_id") if isinstance(edit, dict) else None
+    return event_id if isinstance(event_id, str) else None
+
+
+def _events_range_args(args: dict) -> dict:
+    # Times within the same days query the same events
+    time_min, time_max = _day_range(args["time_min"], args["time_max"])
+    return {**args, "time_min": time_min, "time_max": time_max}
+
+
+def _contact_name_args(args: dict) -> dict:
+    return {**args, "name": " ".join(args["name"].lower().split())}
+
+
+def _calendars_scopes(args: dict) -> list[str]:
+    return [
+        calendar_scope(calendar_id)
+        for calendar_id in args["calendar_ids"] or ["primary"]
+    ]
+
+
+def _calendar_scopes(args: dict) -> list[str]:
+    return [calendar_scope(args["calendar_id"])]
+
+
+def _contacts_scopes(args: dict) -> list[str]:
+    return [CONTACTS_SCOPE]
 
 
 # ---- Tool Functions ----
@@ -74,11 +165,15 @@ TOOLS_MESSAGES = {
     "create_event_tool": "Creating event...📝",
     "delete_event_tool": "Deleting event...🗑️",
     "edit_event_tool": "Editing event...✏️",
+    "bulk_create_events_tool": "Creating events...📝",
+    "bulk_delete_events_tool": "Deleting events...🗑️",
+    "bulk_edit_events_tool": "Editing events...✏️",
     "get_all_events_tool": "Checking your calendar...📅",
     "get_all_calendar_ids_tool": "Checking your calendars...📆",
     "get_event_tool": "Checking your calendar...📅",
     "find_free_time_tool": "Looking for free time in your calendars...⏰",
     "find_similar_contacts_tool": "Looking for matching contacts..🔍",
+    "resolve_contacts_tool": "Looking for matching contacts..🔍",
     "get_calendar_invitations_tool": "Fetching your calendar invitations...📅",
 }
 
@@ -94,6 +189,7 @@ def create_event_tool(
     color_id: Optional[str] = None,
     attendees: Optional[List[str]] = None,
     recurrence: Optional[str] = None,
+    config: RunnableConfig = None,
 ):
     """
     Creates a new event in Google Calendar. You should check the user's calendar for availability before creating a new event.
@@ -109,34 +205,27 @@ def create_event_tool(
         attendees (List[str], optional): List of email addresses to invite.
         recurrence (str, optional): RFC5545 recurrence rule (e.g., 'RRULE:FREQ=WEEKLY;COUNT=10').
     """
-    service = get_user_calendar_service()
-    event = {
-        "summary": summary,
-        "start": {"dateTime": start},
-        "end": {"dateTime": end},
-    }
-    if description:
-        event["description"] = description
-    if location:
-        event["location"] = location
-    if color_id:
-        event["colorId"] = color_id
-    if attendees:
-        event["attendees"] = [{"email": email} for email in attendees]
-    if recurrence:
-        event["recurrence"] = [recurrence]
-    created_event = (
-        service.events()
-        .insert(
+    user_id = get_user_id(config)
+    service = get_user_calendar_service(user_id, timeout=remaining_seconds(config))
+    event = _build_event(
+        summary, start, end, description, location, color_id, attendees, recurrence
+    )
+    created_event = execute(
+        service.events().insert(
             calendarId=calendar_id,
             body=event,
             sendUpdates="all" if attendees else "none",
-        )
-        .execute()
+        ),
+        user_id,
+        write=True,
+    )
+    get_event_cache().put(user_id, calendar_id, created_event)
+    invalidate_tool_cache(config, [calendar_scope(calendar_id)])
+    return_message = (
+        f"Event created successfully.\n\n{format_event(created_event, config)}"
     )
-    return_message = f"Event created successfully.\n\n{orjson.dumps(created_event, option=orjson.OPT_INDENT_2)}"
     if attendees:
-        return_message += f"\n\n- Sent email to attendees: {orjson.dumps(created_event['attendees'], option=orjson.OPT_INDENT_2)}"
+        return_message += "\n\n- Sent email to attendees."
     return return_message
 
 
@@ -144,6 +233,7 @@ def create_event_tool(
 def delete_event_tool(
     event_id: str,
     calendar_id: str = "primary",
+    config: RunnableConfig = None,
 ):
     """
     Deletes an event from Google Calendar.
@@ -152,10 +242,17 @@ def delete_event_tool(
         event_id (str): ID of the event to delete.
         calendar_id (str, optional): ID of the calendar containing the event. Defaults to 'primary'.
     """
-    service = get_user_calendar_service()
-    service.events().delete(
-        calendarId=calendar_id, eventId=event_id, sendUpdates="all"
-    ).execute()
+    user_id = get_user_id(config)
+    service = get_user_calendar_service(user_id, timeout=remaining_seconds(config))
+    execute(
+        service.events().delete(
+            calendarId=calendar_id, eventId=event_id, sendUpdates="all"
+        ),
+        user_id,
+        write=True,
+    )
+    get_event_cache().evict(user_id, calendar_id, event_id)
+    invalidate_tool_cache(config, [calendar_scope(calendar_id)])
     return f"Event {event_id} deleted successfully from calendar {calendar_id}"
 
 
@@ -164,55 +261,155 @@ def edit_event_tool(
     event_id: str,
     changes: dict,
     calendar_id: str = "primary",
+    config: RunnableConfig = None,
 ):
     """
-    Updates an existing event in Google Calendar.
+    Updates an existing event in Google Calendar. The edit is rejected if the event changed since it was last read.
 
     Args:
         event_id (str): ID of the event to update.
         changes (dict): Dictionary of fields to update. Keys can include 'summary', 'description', 'start', 'end', 'location', 'colorId', 'attendees', 'recurrence'.
         calendar_id (str, optional): ID of the calendar containing the event. Defaults to 'primary'.
     """
-    service = get_user_calendar_service()
-    current_event = (
-        service.events().get(calendarId=calendar_id, eventId=event_id).execute()
-    )
-    updated_event = {}
-    if "summary" in changes:
-        updated_event["summary"] = changes["summary"]
-    if "description" in changes:
-        updated_event["description"] = changes["description"]
-    if "location" in changes:
-        updated_event["location"] = changes["location"]
-    if "colorId" in changes:
-        updated_event["colorId"] = changes["colorId"]
-    if "start" in changes:
-        updated_event["start"] = {"dateTime": changes["start"]}
-    if "end" in changes:
-        updated_event["end"] = {"dateTime": changes["end"]}
+    user_id = get_user_id(config)
+    service = get_user_calendar_service(user_id, timeout=remaining_seconds(config))
+    updated_event = _build_event_patch(changes)
+    try:
+        result = patch_event(
+            service,
+            user_id,
+            calendar_id,
+            event_id,
+            updated_event,
+            sendUpdates="all",
+        )
+    except EventConflictError as e:
+        # Changed elsewhere, cached reads of the calendar are stale too
+        invalidate_tool_cache(config, [calendar_scope(calendar_id)])
+        return f"{e} Fetch it again with get_event_tool and confirm the edit with the user."
+    invalidate_tool_cache(config, [calendar_scope(calendar_id)])
+    return_message = f"Event updated successfully: {format_event(result, config)}"
     if "attendees" in changes:
-        updated_event["attendees"] = [
-            {"email": email} for email in changes["attendees"]
-        ]
-    if "recurrence" in changes:
-        updated_event["recurrence"] = [changes["recurrence"]]
-    result = (
-        service.events()
-        .patch(
+        return_message += "\n\n- Sent email to attendees."
+    return return_message
+
+
+@tool(parse_docstring=True)
+def bulk_create_events_tool(
+    events: List[dict],
+    calendar_id: str = "primary",
+    config: RunnableConfig = None,
+):
+    """
+    Creates several events in Google Calendar at once. Prefer it over multiple create_event_tool calls. You should check the user's calendar for availability before creating new events.
+
+    Args:
+        events (List[dict]): Events to create. Each dict takes the arguments of create_event_tool: 'summary', 'start', 'end' and optionally 'description', 'location', 'color_id', 'attendees', 'recurrence'.
+        calendar_id (str, optional): ID of the calendar to create the events in. Defaults to 'primary'.
+    """
+    user_id = get_user_id(config)
+    service = get_user_calendar_service(user_id, timeout=remaining_seconds(config))
+
+    def build_request(event: dict) -> HttpRequest:
+        return service.events().insert(
             calendarId=calendar_id,
-            eventId=event_id,
-            body=updated_event,
+            body=_build_event(**event),
+            sendUpdates="all" if event.get("attendees") else "none",
+        )
+
+    results = _execute_bulk(service, events, build_request, user_id)
+    invalidate_tool_cache(config, [calendar_scope(calendar_id)])
+    get_event_cache().put_many(
+        user_id, calendar_id, [result["result"] for result in results if result["ok"]]
+    )
+    return _bulk_report(
+        "created",
+        results,
+        [
+            {"event_id": result["result"]["id"]} if result["ok"] else {}
+            for result in results
+        ],
+        config,
+    )
+
+
+@tool(parse_docstring=True)
+def bulk_edit_events_tool(
+    edits: List[dict],
+    calendar_id: str = "primary",
+    config: RunnableConfig = None,
+):
+    """
+    Updates several existing events in Google Calendar at once. Prefer it over multiple edit_event_tool calls.
+
+    Args:
+        edits (List[dict]): Edits to apply. Each dict has 'event_id' and 'changes', with the same keys as the changes of edit_event_tool.
+        calendar_id (str, optional): ID of the calendar containing the events. Defaults to 'primary'.
+    """
+    user_id = get_user_id(config)
+    service = get_user_calendar_service(user_id, timeout=remaining_seconds(config))
+
+    def build_request(edit: dict) -> HttpRequest:
+        if _edit_event_id(edit) is None or not isinstance(edit["changes"], dict):
+            raise ValueError("expected a string 'event_id' and a dict of 'changes'")
+        return patch_event_request(
+            service,
+            user_id,
+            calendar_id,
+            edit["event_id"],
+            _build_event_patch(edit["changes"]),
             sendUpdates="all",
         )
-        .execute()
+
+    results = _execute_bulk(service, edits, build_request, user_id)
+    invalidate_tool_cache(config, [calendar_scope(calendar_id)])
+    event_cache = get_event_cache()
+    for edit, result in zip(edits, results):
+        if result["ok"]:
+            event_cache.put(user_id, calendar_id, result["result"])
+        elif _edit_event_id(edit) is not None:
+            event_cache.evict(user_id, calendar_id, _edit_event_id(edit))
+    return _bulk_report(
+        "updated",
+        results,
+        [{"event_id": _edit_event_id(edit)} for edit in edits],
+        config,
     )
-    return_message = f"Event updated successfully: {orjson.dumps(result, option=orjson.OPT_INDENT_2)}"
-    if "attendees" in changes:
-        return_message += f"\n\n- Sent email to attendees: {result['attendees']}"
-    return return_message
 
 
 @tool(parse_docstring=True)
+def bulk_delete_events_tool(
+    event_ids: List[str],
+    calendar_id: str = "primary",
+    config: RunnableConfig = None,
+):
+    """
+    Deletes several events from Google Calendar at once. Prefer it over multiple delete_event_tool calls.
+
+    Args:
+        event_ids (List[str]): IDs of the events to delete.
+        calendar_id (str, optional): ID of the calendar containing the events. Defaults to 'primary'.
+    """
+    user_id = get_user_id(config)
+    service = get_user_calendar_service(user_id, timeout=remaining_seconds(config))
+
+    def build_request(event_id: str) -> HttpRequest:
+        return service.events().delete(
+            calendarId=calendar_id, eventId=event_id, sendUpdates="all"
+        )
+
+    results = _execute_bulk(service, event_ids, build_request, user_id)
+    invalidate_tool_cache(config, [calendar_scope(calendar_id)])
+    event_cache = get_event_cache()
+    for event_id in event_ids:
+        event_cache.evict(user_id, calendar_id, event_id)
+    return _bulk_report(
+        "deleted", results, [{"event_id": event_id} for event_id in event_ids], config
+    )
+
+
+@tool(parse_docstring=True)
+@memoize_tool(_calendars_scopes, normalize=_events_range_args)
 def get_all_events_tool(
     limit: int = 10,
     calendar_ids: Optional[List[str]] = ["primary"],
@@ -220,6 +417,7 @@ def get_all_events_tool(
     time_max: Optional[str] = None,
     q: Optional[str] = None,
     show_deleted: bool = False,
+    config: RunnableConfig = None,
 ):
     """
     Lists events from Google Calendar.
@@ -232,57 +430,57 @@ def get_all_events_tool(
         q (str, optional): Free text search term for events.
         show_deleted (bool, optional): Whether to include deleted events. Defaults to False.
     """
-    service = get_user_calendar_service()
-    if not time_min:
-        time_min = datetime.now(tz=timezone.utc).isoformat()
-    else:
-        time_min = datetime.fromisoformat(time_min)
-    time_min = time_min.replace(hour=0, minute=0, second=0, microsecond=0)
-    if not time_max:
-        time_max = datetime.now(tz=timezone.utc).isoformat()
-    else:
-        time_max = datetime.fromisoformat(time_max)
-    time_max = time_max.replace(hour=23, minute=59, second=59, microsecond=999999)
+    user_id = get_user_id(config)
+    service = get_user_calendar_service(user_id, timeout=remaining_seconds(config))
+    time_min, time_max = _day_range(time_min, time_max)
     if not calendar_ids:
         calendar_ids = ["primary"]
     events = []
     for calendar_id in calendar_ids:
-        events_result = (
-            service.events()
-            .list(
+        events_result = execute(
+            service.events().list(
                 calendarId=calendar_id,
                 maxResults=limit,
-                timeMin=time_min.isoformat(),
-                timeMax=time_max.isoformat(),
+                timeMin=time_min,
+                timeMax=time_max,
                 singleEvents=True,
                 orderBy="startTime",
                 q=q,
                 showDeleted=show_deleted,
-            )
-            .execute()
+            ),
+            user_id,
+            mirror=True,
         )
-        events.extend(events_result.get("items", []))
+        items = events_result.get("items", [])
+        get_event_cache().put_many(user_id, calendar_id, items)
+        if len(calendar_ids) > 1:
+            for event in items:
+                event["calendarId"] = calendar_id
+        events.extend(items)
 
     if not events:
         return "No upcoming events in the given time range and calendars."
-    return events
+    return format_events(events, config)
 
 
 @tool(parse_docstring=True)
-def get_all_calendar_ids_tool():
+def get_all_calendar_ids_tool(config: RunnableConfig = None):
     """
     Retrieves all calendar IDs for the user.
 
     Args:
     """
-    service = get_user_calendar_service()
-    return service.calendarList().list().execute()
+    user_id = get_user_id(config)
+    service = get_user_calendar_service(user_id, timeout=remaining_seconds(config))
+    return execute(service.calendarList().list(), user_id, mirror=True)
 
 
 @tool(parse_docstring=True)
+@memoize_tool(_calendar_scopes)
 def get_event_tool(
     event_id: str,
     calendar_id: str = "primary",
+    config: RunnableConfig = None,
 ):
     """
     Retrieves a single event from Google Calendar by event ID.
@@ -291,13 +489,16 @@ def get_event_tool(
         event_id (str): ID of the event to retrieve.
         calendar_id (str, optional): ID of the calendar containing the event. Defaults to 'primary'.
     """
-    service = get_user_calendar_service()
-    event = service.events().get(calendarId=calendar_id, eventId=event_id).execute()
-    return event
+    user_id = get_user_id(config)
+    service = get_user_calendar_service(user_id, timeout=remaining_seconds(config))
+    return format_event(get_event(service, user_id, calendar_id, event_id), config)
 
 
 @tool(parse_docstring=True)
-def find_similar_contacts_tool(name: str, top_n: int = 2) -> Tuple[List[dict], bool]:
+@memoize_tool(_contacts_scopes, normalize=_contact_name_args)
+def find_similar_contacts_tool(
+    name: str, top_n: int = 2, config: RunnableConfig = None
+) -> Tuple[List[dict], bool]:
     """
     Search for similar names in user's contacts and return top matches.
 
@@ -305,132 +506,43 @@ def find_similar_contacts_tool(name: str, top_n: int = 2) -> Tuple[List[dict], b
         name (str): Name to search for in user's contacts.
         top_n (int, optional): Number of top matches to return. Defaults to 2.
     """
-    print(f"Searching for contacts similar to: {name}")
-    try:
-        service = get_user_people_service()
-        all_contacts = []
-        next_page_token = None
-        page_count = 0
-
-        # Fetch all contacts
-        while True:
-            page_count += 1
-            print(f"\nFetching contacts page {page_count}...")
-            try:
-                results = (
-                    service.people()
-                    .connections()
-                    .list(
-                        resourceName="people/me",
-                        pageSize=1000,
-                        pageToken=next_page_token,
-                        personFields="names,emailAddresses",
-                    )
-                    .execute()
-                )
-
-                connections = results.get("connections", [])
-                print(f"Found {len(connections)} contacts on this page")
-
-                for person in connections:
-                    names = person.get("names", [])
-                    emails = person.get("emailAddresses", [])
-
-                    # Log the raw contact data for debugging
-                    print(f"\nProcessing contact:")
-                    print(f"Names: {names}")
-                    print(f"Emails: {emails}")
-
-                    # Process contact even if it only has a name
-                    if names:
-                        display_name = names[0].get("displayName", "")
-                        email = emails[0].get("value", "") if emails else "No email"
-                        contact_info = {"name": display_name, "email": email}
-                        all_contacts.append(contact_info)
-                        print(f"Added contact: {display_name} <{email}>")
-                    else:
-                        print("Skipping contact: No name found")
-
-                next_page_token = results.get("nextPageToken")
-                if not next_page_token:
-                    print("No more pages to fetch")
-                    break
-
-            except Exception as e:
-                print(f"Error fetching page {page_count}: {str(e)}")
-                break
-
-        print(f"\nTotal contacts fetched: {len(all_contacts)}")
-        print("All contacts:")
-        for contact in all_contacts:
-            print(f"- {contact['name']} <{contact['email']}>")
-
-        if not all_contacts:
-            print("No contacts found in the system")
-            return [], False
-        # Split search name into parts
-        search_parts = [p for p in name.lower().split() if p]
-        print(f"\nSearch name parts: {search_parts}")
-        # Calculate similarity scores with improved matching
-        print("\nCalculating similarity scores:")
-        for contact in all_contacts:
-            contact_name = contact["name"].lower()
-            contact_parts = [p for p in contact_name.split() if p]
-            # Calculate full name similarity
-            full_name_similarity = SequenceMatcher(
-                None, name.lower(), contact_name
-            ).ratio()
-            # Calculate part similarity: only count strong partial matches (substring of at least 3 chars)
-            part_matches = 0
-            for search_part in search_parts:
-                for contact_part in contact_parts:
-                    if search_part == contact_part:
-                        part_matches += 1
-                        break
-                    elif (
-                        len(search_part) >= 3
-                        and len(contact_part) >= 3
-                        and (search_part in contact_part or contact_part in search_part)
-                    ):
-                        part_matches += 0.5  # partial match, but not full
-                        break
-            part_similarity = part_matches / max(
-                len(search_parts), len(contact_parts), 1
-            )
-            # Final similarity: max of full name similarity and part similarity, but only 1 if exact match
-            if name.strip().lower() == contact_name.strip().lower():
-                similarity = 1.0
-            else:
-                similarity = max(full_name_similarity, part_similarity)
-                # Cap similarity to <1 if not exact
-                if similarity > 0.99:
-                    similarity = 0.99
-            contact["similarity"] = similarity
-            print(
-                f"Contact: {contact['name']} - Similarity: {contact['similarity']:.2f}"
-            )
-        # Filter by similarity threshold first
-        matches = [contact for contact in all_contacts if contact["similarity"] > 0.2]
-        # Then sort and get top N matches
-        matches.sort(key=lambda x: x["similarity"], reverse=True)
-        top_matches = matches[:top_n]
-        if not top_matches:
-            print(f"\nNo similar contacts found for: {name}")
-            return [], False
-        print(f"\nFound {len(top_matches)} similar contacts:")
-        for match in top_matches:
-            print(
-                f"- {match['name']} ({match['email']}) - Similarity: {match['similarity']:.2f}"
-            )
-        return top_matches, True
-    except Exception as e:
-        print(f"Error searching contacts: {str(e)}")
-        raise
+    user_id = get_user_id(config)
+    if app_settings.CONTACT_MATCHING_MODE == "embedding":
+        top_matches = get_contact_embeddings(user_id).search(name, top_n=top_n)
+    else:
+        top_matches = get_contact_index(user_id).search(name, top_n=top_n)
+    if not top_matches:
+        return [], False
+    return top_matches, True
+
+
+@tool(parse_docstring=True)
+@memoize_tool(_contacts_scopes)
+def resolve_contacts_tool(
+    names: List[str], top_n: int = 2, config: RunnableConfig = None
+) -> dict[str, List[dict]]:
+    """
+    Search for several names in user's contacts at once, e.g. all attendees of a meeting. Prefer it over multiple find_similar_contacts_tool calls.
+
+    Args:
+        names (List[str]): Names to search for in user's contacts.
+        top_n (int, optional): Number of top matches to return per name. Defaults to 2.
+    """
+    user_id = get_user_id(config)
+    if app_settings.CONTACT_MATCHING_MODE == "embedding":
+        matches = get_contact_embeddings(user_id).search_many(names, top_n=top_n)
+    else:
+        matches = get_contact_index(user_id).search_many(names, top_n=top_n)
+    return dict(zip(names, matches))
 
 
 @tool(parse_docstring=True)
 def add_contact_tool(
-    name: str, email: str, phone: Optional[str] = None, notes: Optional[str] = None
+    name: str,
+    email: str,
+    phone: Optional[str] = None,
+    notes: Optional[str] = None,
+    config: RunnableConfig = None,
 ):
     """
     Adds a new contact to Google Contacts.
@@ -442,7 +554,9 @@ def add_contact_tool(
         notes (Optional[str]): Additional notes about the contact
     """
     try:
-        service = get_user_people_service()
+        service = get_user_people_service(
+            get_user_id(config), timeout=remaining_seconds(config)
+        )
 
         # Create the contact body
         contact_body = {
@@ -457,7 +571,13 @@ def add_contact_tool(
             contact_body["biographies"] = [{"value": notes}]
 
         # Create the contact
-        result = service.people().createContact(body=contact_body).execute()
+        result = execute(
+            service.people().createContact(body=contact_body),
+            get_user_id(config),
+            write=True,
+        )
+        invalidate_contact_index(get_user_id(config))
+        invalidate_tool_cache(config, [CONTACTS_SCOPE])
 
         return f"Contact added successfully: {result['names'][0]['givenName']} ({result['emailAddresses'][0]['value']})"
 
@@ -466,7 +586,7 @@ def add_contact_tool(
 
 
 @tool(parse_docstring=True)
-def edit_contact_tool(resource_name: str, changes: dict):
+def edit_contact_tool(resource_name: str, changes: dict, config: RunnableConfig = None):
     """
     Edits an existing contact in Google Contacts.
 
@@ -475,16 +595,17 @@ def edit_contact_tool(resource_name: str, changes: dict):
         changes (dict): Dictionary of fields to update. Keys can include 'name', 'email', 'phone', 'notes'
     """
     try:
-        service = get_user_people_service()
+        service = get_user_people_service(
+            get_user_id(config), timeout=remaining_seconds(config)
+        )
 
         # Get current contact
-        contact = (
-            service.people()
-            .get(
+        contact = execute(
+            service.people().get(
                 resourceName=resource_name,
                 personFields="names,emailAddresses,phoneNumbers,biographies",
-            )
-            .execute()
+            ),
+            get_user_id(config),
         )
 
         # Prepare update mask and body
@@ -508,15 +629,17 @@ def edit_contact_tool(resource_name: str, changes: dict):
             update_person_fields.append("biographies")
 
         # Update the contact
-        result = (
-            service.people()
-            .updateContact(
+        result = execute(
+            service.people().updateContact(
                 resourceName=resource_name,
                 updatePersonFields=",".join(update_person_fields),
                 body=contact_body,
-            )
-            .execute()
+            ),
+            get_user_id(config),
+            write=True,
         )
+        invalidate_contact_index(get_user_id(config))
+        invalidate_tool_cache(config, [CONTACTS_SCOPE])
 
         return f"Contact updated successfully: {result['names'][0]['givenName']}"
 
@@ -525,9 +648,11 @@ def edit_contact_tool(resource_name: str, changes: dict):
 
 
 @tool(parse_docstring=True)
+@memoize_tool(_calendar_scopes)
 def get_calendar_invitations_tool(
     calendar_id: str = "primary",
     limit: int = 10,
+    config: RunnableConfig = None,
 ):
     """
     Gets pending calendar invitations from Google Calendar.
@@ -536,52 +661,26 @@ def get_calendar_invitations_tool(
         calendar_id (str, optional): ID of the calendar to check. Defaults to 'primary'.
         limit (int, optional): Maximum number of invitations to return. Defaults to 10.
     """
-    service = get_user_calendar_service()
-    time_min = datetime.now(tz=timezone.utc).isoformat()
-
-    # Get all events including invitations
-    events_result = (
-        service.events()
-        .list(
-            calendarId=calendar_id,
-            maxResults=limit,
-            timeMin=time_min,
-            singleEvents=True,
-            orderBy="startTime",
-            showDeleted=False,
-        )
-        .execute()
+    pending_invitations = get_pending_invitations(
+        get_user_id(config), calendar_id, limit
     )
-
-    invitations = events_result.get("items", [])
-
-    if not invitations:
-        return "No calendar events or invitations found."
-
-    # Filter to find pending invitations
-    pending_invitations = []
-    for event in invitations:
-        # Check if user is an attendee and hasn't responded
-        attendees = event.get("attendees", [])
-        for attendee in attendees:
-            if attendee.get("self", False) and attendee.get("responseStatus") in [
-                "needsAction",
-                "tentative",
-            ]:
-                pending_invitations.append(event)
-                break
-
-        # Also include events where user is the organizer and others haven't responded
-        if event.get("organizer", {}).get("self", False):
-            for attendee in attendees:
-                if (
-                    not attendee.get("self", False)
-                    and attendee.get("responseStatus") == "needsAction"
-                ):
-                    pending_invitations.append(event)
-                    break
-
     if not pending_invitations:
         return "No pending calendar invitations found."
 
-    return pending_invitations
+    return format_events(pending_invitations, config)
+
+
+# Tools bound to the main agent and executed by the graph's tools node
+MAIN_AGENT_TOOLS = [
+    create_event_tool,
+    delete_event_tool,
+    get_all_events_tool,
+    get_event_tool,
+    edit_event_tool,
+    bulk_create_events_tool,
+    bulk_edit_events_tool,
+    bulk_delete_events_tool,
+    find_similar_contacts_tool,
+    resolve_contacts_tool,
+    get_calendar_invitations_tool,
+]
@@ -0,0 +1,408 @@
+"""
+Event generators of the chat turns, run by the API or by the job workers, and
+published to the turn's stream (see TurnStream).
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import AsyncGenerator, Awaitable, Callable, Optional
+
+from langchain_core.callbacks import UsageMetadataCallbackHandler
+from langchain_core.messages import AIMessageChunk
+from langgraph.graph.state import CompiledStateGraph
+from langgraph.types import StateSnapshot
+
+from core.main_graph.agents import RESPONSE_TAG
+from core.main_graph.cancellation import (DeadlineExceededError,
+                                          TurnCancelledError)
+from core.main_graph.nodes import INPUT_VALIDATED
+from core.main_graph.states import InputState
+from database import (LangfuseHandler, StaleFencingTokenError, get_job_queue,
+                      get_rate_limiter, get_turn_stream)
+from database.thread_lease import ThreadLease
+from database.turn_stream import TurnStream
+from helpers import get_settings
+from helpers.metrics import TURNS_IN_FLIGHT, get_tool_metrics_handler
+
+app_settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Node running the agent while its input is validated, see
+# with_speculative_validation
+SPECULATIVE_NODE = "validated_main_agent"
+
+
+@dataclass
+class TurnAdmission:
+    """
+    Slot of a turn admitted by the rate limiter, freed when the turn ends,
+    charging the LLM tokens it used.
+    """
+
+    user_id: str
+    slot_id: str
+    usage: UsageMetadataCallbackHandler = field(
+        default_factory=UsageMetadataCallbackHandler
+    )
+
+    async def finish(self):
+        llm_tokens = sum(
+            usage["total_tokens"] for usage in self.usage.usage_metadata.values()
+        )
+        await get_rate_limiter().finish(self.user_id, self.slot_id, llm_tokens)
+
+
+async def admit_user_turn(user_id: str) -> Optional[TurnAdmission]:
+    """
+    Admits a turn of the user against the rate limits, None when they are
+    disabled. Raises RateLimitExceededError when over one of them.
+    """
+    if not app_settings.RATE_LIMIT_ENABLED:
+        return None
+    admission = TurnAdmission(user_id=user_id, slot_id=str(uuid.uuid4()))
+    await get_rate_limiter().admit(user_id, admission.slot_id)
+    return admission
+
+
+def turn_deadline(deadline_seconds: Optional[float] = None) -> float:
+    """Timestamp by which a turn starting now must end, at most TURN_DEADLINE_SECONDS."""
+    budget = app_settings.TURN_DEADLINE_SECONDS
+    if deadline_seconds is not None:
+        budget = min(deadline_seconds, budget)
+    return time.time() + budget
+
+
+def make_trace_callbacks(sample_key: Optional[str] = None) -> list:
+    """
+    Callbacks tracing graph runs to a new Langfuse trace, none when tracing is
+    off or the conversation `sample_key` isn't sampled.
+    """
+    langfuse_handler = LangfuseHandler()
+    if not langfuse_handler.is_sampled(sample_key):
+        return []
+    trace, callback_handler = langfuse_handler.get_callback_handler()
+    return [callback_handler]
+
+
+def make_graph_config(
+    thread_id: str,
+    user_id: str,
+    turn_id: Optional[str],
+    deadline: float,
+    admission: Optional[TurnAdmission] = None,
+    callbacks: Optional[list] = None,
+) -> dict:
+    """
+    Config of a turn. `callbacks` defaults to a new trace; turns without
+    `turn_id` have no stream, nobody can abandon them.
+    """
+    if callbacks is None:
+        callbacks = make_trace_callbacks(thread_id)
+    # Durations of the tool calls, served at /metrics
+    callbacks = [*callbacks, get_tool_metrics_handler()]
+    if admission is not None:
+        callbacks.append(admission.usage)
+    return {
+        "configurable": {
+            "thread_id": thread_id,
+            "user_id": user_id,
+            "turn_id": turn_id,
+            "deadline": deadline,
+        },
+        "callbacks": callbacks,
+    }
+
+
+# Turns run in the background, independent of the connections following them
+_turn_tasks: set[asyncio.Task] = set()
+
+
+async def open_turn() -> TurnStream:
+    stream = get_turn_stream(str(uuid.uuid4()))
+    # Published before returning, so readers never see a missing stream
+    await stream.publish({"op": "turn_id", "turn_id": stream.turn_id})
+    # Followed until its first reader takes over
+    await stream.mark_followed()
+    return stream
+
+
+def run_turn(
+    stream: TurnStream,
+    events: AsyncGenerator[dict, None],
+    admission: Optional[TurnAdmission] = None,
+):
+    """Runs the turn in this process, publishing its events to `stream`."""
+    spawn_turn(publish_turn(stream, events, admission))
+
+
+def spawn_turn(turn: Awaitable) -> asyncio.Task:
+    task = asyncio.create_task(turn)
+    _turn_tasks.add(task)
+    task.add_done_callback(_turn_tasks.discard)
+    return task
+
+
+def final_error(message: str, error: str = "error") -> dict:
+    """
+    The last event of a turn that didn't get an answer: clients show `message`
+    in place of the answer, and tell it apart by its `error`.
+    """
+    return {"op": "final_generated", "message": message, "error": error}
+
+
+async def deliver_turn(
+    turn_id: str,
+    events: AsyncGenerator[dict, None],
+    send: Callable[[dict], Awaitable],
+    admission: Optional[TurnAdmission] = None,
+) -> bool:
+    """Sends the events of the turn, then how it ended, False if it failed."""
+    TURNS_IN_FLIGHT.inc()
+    try:
+        async for event in events:
+            await send(event)
+        return True
+    except TurnCancelledError as e:
+        logger.info("Turn %s cancelled: %s", turn_id, e)
+        await send(final_error("The message was cancelled.", "cancelled"))
+        return False
+    except DeadlineExceededError as e:
+        logger.info("Turn %s timed out: %s", turn_id, e)
+        await send(final_error("This is taking too long, please try again."))
+        return False
+    except Exception:
+        logger.exception("Turn %s failed", turn_id)
+        await send(final_error("Something went wrong, please try again."))
+        return False
+    finally:
+        TURNS_IN_FLIGHT.dec()
+        if admission is not None:
+            await admission.finish()
+
+
+async def publish_turn(
+    stream: TurnStream,
+    events: AsyncGenerator[dict, None],
+    admission: Optional[TurnAdmission] = None,
+) -> bool:
+    """Publishes the events of the turn to its stream, False if it failed."""
+    try:
+        return await deliver_turn(stream.turn_id, events, stream.publish, admission)
+    finally:
+        await stream.close()
+
+
+async def enqueue_turn(stream: TurnStream, job: dict):
+    """Queues the turn for the job workers, which publish its events to `stream`."""
+    await stream.publish(
+        {"op": "info", "message": "Waiting for an available worker...⏳"}
+    )
+    await get_job_queue().enqueue({**job, "turn_id": stream.turn_id})
+
+
+def thread_turn(
+    lease: ThreadLease,
+    acquired: bool,
+    user_message: str,
+    graph_config: dict,
+    graph: CompiledStateGraph,
+    stream_tokens: bool = False,
+) -> AsyncGenerator[dict, None]:
+    """
+    The turn of a thread, depending on whether its lease was `acquired`.
+    With `stream_tokens`, the tokens of the response are streamed as written.
+    """
+    if acquired:
+        return locked_turns(lease, user_message, graph_config, graph, stream_tokens)
+    if app_settings.THREAD_LOCK_POLICY == "reject":
+        return rejected_turn()
+    if app_settings.THREAD_LOCK_POLICY == "merge":
+        return merged_turn(lease, user_message, graph_config, graph, stream_tokens)
+    return queued_turn(lease, user_message, graph_config, graph, stream_tokens)
+
+
+async def rejected_turn() -> AsyncGenerator[dict, None]:
+    yield final_error("A message of this conversation is already being answered.")
+
+
+async def locked_turns(
+    lease: ThreadLease,
+    user_message: str,
+    graph_config: dict,
+    graph: CompiledStateGraph,
+    stream_tokens: bool = False,
+) -> AsyncGenerator[dict, None]:
+    """
+    Runs the turn under the thread's lease, then one more turn per batch of
+    messages merged into it meanwhile.
+    """
+    graph_config["configurable"]["fencing_token"] = lease.token
+    try:
+        async for response in followup_graph(
+            user_message, graph_config, graph, stream_tokens
+        ):
+            yield response
+        while merged := await lease.take_pending():
+            async for response in followup_graph(
+                "\n\n".join(merged), graph_config, graph, stream_tokens
+            ):
+                yield response
+    except StaleFencingTokenError:
+        yield final_error("This conversation was taken over by another request.")
+    finally:
+        await lease.release()
+
+
+async def queued_turn(
+    lease: ThreadLease,
+    user_message: str,
+    graph_config: dict,
+    graph: CompiledStateGraph,
+    stream_tokens: bool = False,
+) -> AsyncGenerator[dict, None]:
+    response = {
+        "op": "info",
+        "message": "Waiting for the previous message to be answered...⏳",
+    }
+    yield response
+
+    if not await lease.wait_acquire(
+        user_message, app_settings.THREAD_LOCK_WAIT_SECONDS
+    ):
+        yield final_error("The previous message is taking too long, please try again.")
+        return
+    async for response in locked_turns(
+        lease, user_message, graph_config, graph, stream_tokens
+    ):
+        yield response
+
+
+async def merged_turn(
+    lease: ThreadLease,
+    user_message: str,
+    graph_config: dict,
+    graph: CompiledStateGraph,
+    stream_tokens: bool = False,
+) -> AsyncGenerator[dict, None]:
+    """
+    Hands the message to the turn in flight, which answers it in a follow-up
+    turn, and responds with the thread's final answer. A duplicate of the
+    message in flight just gets its answer.
+    """
+    merged = await lease.merge(user_message)
+    response = {"op": "info", "message": "Adding your message to the conversation..."}
+    yield response
+
+    await lease.wait_released(app_settings.THREAD_LOCK_WAIT_SECONDS)
+    if merged and await lease.withdraw(user_message):
+        # The turn ended before picking it up
+        async for response in queued_turn(
+            lease, user_message, graph_config, graph, stream_tokens
+        ):
+            yield response
+        return
+    final_state = await graph.aget_state(config=graph_config)
+    async for response in generate_response(final_state):
+        yield response
+
+
+async def start_graph_execution(
+    graph_config: dict,
+    graph: CompiledStateGraph,
+    user_message: str,
+) -> AsyncGenerator[dict, None]:
+
+    response = {
+        "op": "trace_id",
+        "trace_id": graph_config["configurable"]["thread_id"],
+    }
+    yield response
+
+    response = {
+        "op": "info",
+        "message": "Thinking...",
+    }
+    yield response
+
+    async for response in graph_events(user_message, graph_config, graph):
+        yield response
+
+    final_state = await graph.aget_state(config=graph_config)
+    async for response in generate_response(final_state):
+        yield response
+
+
+# Extracts the response from the final state
+async def generate_response(final_state: StateSnapshot) -> AsyncGenerator[dict, None]:
+    response = {
+        "op": "final_generated",
+        "message": final_state.values["main_agent_messages"][-1].content,
+    }
+    yield response
+
+
+async def graph_events(
+    user_message: str,
+    graph_config: dict,
+    graph: CompiledStateGraph,
+    stream_tokens: bool = False,
+) -> AsyncGenerator[dict, None]:
+    """
+    Runs the graph, yielding the info events its nodes write and, if
+    `stream_tokens`, the tokens of the response. The tokens of the agent run
+    while its input is validated are held until INPUT_VALIDATED, and dropped if
+    it's rejected.
+    """
+    held: list[dict] = []
+    validated = not app_settings.VALIDATOR_ENABLED
+    async for mode, update in graph.astream(
+        input=InputState(user_message=user_message),
+        config=graph_config,
+        stream_mode=["custom", "messages"] if stream_tokens else ["custom"],
+    ):
+        if mode == "messages":
+            message, metadata = update
+            # Tool calls and structured outputs have no text, the LLM calls
+            # whose output may be discarded aren't tagged
+            if (
+                isinstance(message, AIMessageChunk)
+                and RESPONSE_TAG in (metadata.get("tags") or ())
+                and isinstance(message.content, str)
+                and message.content
+            ):
+                token = {"op": "token", "text": message.content}
+                if metadata.get("langgraph_node") == SPECULATIVE_NODE and not validated:
+                    held.append(token)
+                else:
+                    yield token
+            continue
+        if update == INPUT_VALIDATED:
+            validated = True
+            for token in held:
+                yield token
+            held.clear()
+            continue
+        yield {"op": "info", "message": update}
+
+
+async def followup_graph(
+    user_input: str,
+    graph_config: dict,
+    graph: CompiledStateGraph,
+    stream_tokens: bool = False,
+) -> AsyncGenerator[dict, None]:
+    response = {
+        "op": "info",
+        "message": "Thinking...",
+    }
+    yield response
+
+    async for response in graph_events(user_input, graph_config, graph, stream_tokens):
+        yield response
+
+    final_state = await graph.aget_state(config=graph_config, subgraphs=True)
+    async for response in generate_response(final_state):
+        yield response
@@ -1,2 +1,9 @@
+from .credential_store import get_credential_store
+from .job_queue import get_job_queue
 from .langfuse_handler import LangfuseHandler
-from .redis import get_redis_saver
+from .llm_cache import get_llm_cache
+from .rate_limiter import RateLimitExceededError, get_rate_limiter
+from .redis import (StaleFencingTokenError, get_async_redis_client,
+                    get_redis_client, get_redis_saver)
+from .thread_lease import get_thread_lease
+from .turn_stream import get_turn_stream
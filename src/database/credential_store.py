@@ -0,0 +1,137 @@
+"""Per-user storage of Google OAuth credentials."""
+
+import os
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Iterator, Optional
+
+import orjson
+from cryptography.fernet import Fernet
+from google.oauth2.credentials import Credentials
+from redis import Redis
+
+from helpers import get_settings
+
+from .redis import REDIS_KEY_SEPARATOR, get_redis_client
+
+app_settings = get_settings()
+
+
+class CredentialStore(ABC):
+    """Stores OAuth credentials keyed by (user_id, service).
+
+    `service` identifies the token set (e.g. "calendar" or "people"), since each
+    Google API is authorized with its own scopes.
+    """
+
+    def __init__(self, encryption_key: str = ""):
+        self.fernet = Fernet(encryption_key.encode()) if encryption_key else None
+
+    @abstractmethod
+    def get(self, user_id: str, service: str) -> Optional[Credentials]: ...
+
+    @abstractmethod
+    def put(self, user_id: str, service: str, creds: Credentials) -> None: ...
+
+    @abstractmethod
+    def delete(self, user_id: str, service: str) -> None: ...
+
+    @abstractmethod
+    def refresh_lock(self, user_id: str, service: str):
+        """Context manager held while refreshing, so only one refresh is in flight."""
+
+    def _dumps(self, creds: Credentials) -> bytes:
+        data = creds.to_json().encode()
+        return self.fernet.encrypt(data) if self.fernet else data
+
+    def _loads(self, data: bytes) -> Credentials:
+        if self.fernet:
+            data = self.fernet.decrypt(data)
+        info = orjson.loads(data)
+        return Credentials.from_authorized_user_info(info, scopes=info.get("scopes"))
+
+
+class RedisCredentialStore(CredentialStore):
+    """Encrypted credential store shared by all workers through Redis."""
+
+    def __init__(self, conn: Redis, encryption_key: str):
+        if not encryption_key:
+            raise ValueError(
+                "CREDENTIALS_ENCRYPTION_KEY must be set to store credentials in Redis."
+            )
+        super().__init__(encryption_key)
+        self.conn = conn
+
+    @staticmethod
+    def _key(user_id: str, service: str) -> str:
+        return REDIS_KEY_SEPARATOR.join(["credentials", user_id, service])
+
+    def get(self, user_id: str, service: str) -> Optional[Credentials]:
+        data = self.conn.get(self._key(user_id, service))
+        return self._loads(data) if data else None
+
+    def put(self, user_id: str, service: str, creds: Credentials) -> None:
+        self.conn.set(self._key(user_id, service), self._dumps(creds))
+
+    def delete(self, user_id: str, service: str) -> None:
+        self.conn.delete(self._key(user_id, service))
+
+    @contextmanager
+    def refresh_lock(self, user_id: str, service: str) -> Iterator[None]:
+        lock = self.conn.lock(
+            REDIS_KEY_SEPARATOR.join(["credentials_refresh", user_id, service]),
+            timeout=app_settings.CREDENTIAL_REFRESH_LOCK_SECONDS,
+            blocking_timeout=app_settings.CREDENTIAL_REFRESH_LOCK_SECONDS,
+        )
+        with lock:
+            yield
+
+
+class FileCredentialStore(CredentialStore):
+    """Single-node credential store for local development."""
+
+    def __init__(self, directory: str, encryption_key: str = ""):
+        super().__init__(encryption_key)
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def _path(self, user_id: str, service: str) -> str:
+        return os.path.join(self.directory, f"{user_id}_{service}.json")
+
+    def get(self, user_id: str, service: str) -> Optional[Credentials]:
+        path = self._path(user_id, service)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return self._loads(f.read())
+
+    def put(self, user_id: str, service: str, creds: Credentials) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path(user_id, service), "wb") as f:
+            f.write(self._dumps(creds))
+
+    def delete(self, user_id: str, service: str) -> None:
+        path = self._path(user_id, service)
+        if os.path.exists(path):
+            os.remove(path)
+
+    @contextmanager
+    def refresh_lock(self, user_id: str, service: str) -> Iterator[None]:
+        with self._lock:
+            yield
+
+
+@lru_cache()
+def get_credential_store() -> CredentialStore:
+    if app_settings.CREDENTIAL_STORE == "redis":
+        return RedisCredentialStore(
+            get_redis_client(), app_settings.CREDENTIALS_ENCRYPTION_KEY
+        )
+    if app_settings.CREDENTIAL_STORE == "file":
+        return FileCredentialStore(
+            app_settings.CREDENTIAL_STORE_DIR, app_settings.CREDENTIALS_ENCRYPTION_KEY
+        )
+
+    raise ValueError(f"Unsupported credential store: {app_settings.CREDENTIAL_STORE}")
@@ -0,0 +1,152 @@
+"""Redis queue of the chat turns run by the job workers (see worker.py)."""
+
+import time
+import uuid
+from functools import lru_cache
+from typing import Optional
+
+import orjson
+from redis.asyncio import Redis as AsyncRedis
+
+from .redis import REDIS_KEY_SEPARATOR, get_async_redis_client
+
+_UNLOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class JobQueue:
+    """
+    Reliable queue: a worker moves each job it claims to its own processing
+    list, and removes it once done. The jobs of a worker whose heartbeat
+    expired, e.g. killed mid-turn, are put back in front of the queue.
+
+    Layout:
+    - `turn_jobs`: queued jobs, oldest on the right
+    - `turn_jobs_processing:{worker}`: jobs claimed by the worker
+    - `turn_jobs_worker:{worker}`: heartbeat of the worker, its running jobs
+    - `turn_jobs_workers`: set of the workers
+    - `turn_jobs_requeue_lock`: held by the worker requeueing orphans, expiring
+    - `turn_jobs_stats`: hash of enqueued, completed, failed and requeued jobs,
+      and total queueing time
+    """
+
+    QUEUE_KEY = "turn_jobs"
+    WORKERS_KEY = "turn_jobs_workers"
+    STATS_KEY = "turn_jobs_stats"
+    REQUEUE_LOCK_KEY = "turn_jobs_requeue_lock"
+    REQUEUE_LOCK_SECONDS = 30
+
+    def __init__(self, conn: AsyncRedis):
+        self.conn = conn
+
+    def _processing_key(self, worker_id: str) -> str:
+        return REDIS_KEY_SEPARATOR.join(["turn_jobs_processing", worker_id])
+
+    def _heartbeat_key(self, worker_id: str) -> str:
+        return REDIS_KEY_SEPARATOR.join(["turn_jobs_worker", worker_id])
+
+    async def enqueue(self, job: dict):
+        pipeline = self.conn.pipeline(transaction=False)
+        pipeline.lpush(
+            self.QUEUE_KEY, orjson.dumps({**job, "enqueued_at": time.time()})
+        )
+        pipeline.hincrby(self.STATS_KEY, "enqueued")
+        await pipeline.execute()
+
+    async def claim(
+        self, worker_id: str, timeout_seconds: float
+    ) -> Optional[tuple[bytes, dict]]:
+        """Blocks until a job is available, returns the raw job and the job."""
+        raw = await self.conn.blmove(
+            self.QUEUE_KEY,
+            self._processing_key(worker_id),
+            timeout_seconds,
+            "RIGHT",
+            "LEFT",
+        )
+        if raw is None:
+            return None
+        job = orjson.loads(raw)
+        waited_ms = (time.time() - job["enqueued_at"]) * 1000
+        await self.conn.hincrbyfloat(self.STATS_KEY, "waited_ms", waited_ms)
+        return raw, job
+
+    async def complete(self, worker_id: str, raw: bytes, failed: bool = False):
+        pipeline = self.conn.pipeline(transaction=False)
+        pipeline.lrem(self._processing_key(worker_id), 1, raw)
+        pipeline.hincrby(self.STATS_KEY, "failed" if failed else "completed")
+        await pipeline.execute()
+
+    async def heartbeat(self, worker_id: str, running: int, ttl_seconds: int):
+        pipeline = self.conn.pipeline(transaction=False)
+        pipeline.set(self._heartbeat_key(worker_id), running, ex=ttl_seconds)
+        pipeline.sadd(self.WORKERS_KEY, worker_id)
+        await pipeline.execute()
+
+    async def leave(self, worker_id: str):
+        """Unregisters a worker stopping, its unfinished jobs are requeued."""
+        await self.conn.delete(self._heartbeat_key(worker_id))
+        await self.requeue_orphans()
+
+    async def requeue_orphans(self) -> int:
+        """
+        Requeues the jobs of the workers whose heartbeat expired, returns how
+        many. One worker at a time: the others skip it while it's locked.
+        """
+        token = uuid.uuid4().hex
+        if not await self.conn.set(
+            self.REQUEUE_LOCK_KEY, token, nx=True, ex=self.REQUEUE_LOCK_SECONDS
+        ):
+            return 0
+        try:
+            requeued = 0
+            for worker_id in await self.conn.smembers(self.WORKERS_KEY):
+                worker_id = worker_id.decode()
+                if await self.conn.exists(self._heartbeat_key(worker_id)):
+                    continue
+                # Newest first to the right, so the oldest runs first
+                while await self.conn.lmove(
+                    self._processing_key(worker_id), self.QUEUE_KEY, "LEFT", "RIGHT"
+                ):
+                    requeued += 1
+                await self.conn.srem(self.WORKERS_KEY, worker_id)
+            if requeued:
+                await self.conn.hincrby(self.STATS_KEY, "requeued", requeued)
+            return requeued
+        finally:
+            unlock = self.conn.register_script(_UNLOCK_SCRIPT)
+            await unlock(keys=[self.REQUEUE_LOCK_KEY], args=[token])
+
+    async def stats(self) -> dict[str, float]:
+        counts = {
+            field.decode(): float(value)
+            for field, value in (await self.conn.hgetall(self.STATS_KEY)).items()
+        }
+        running, workers = 0, 0
+        for worker_id in await self.conn.smembers(self.WORKERS_KEY):
+            heartbeat = await self.conn.get(self._heartbeat_key(worker_id.decode()))
+            if heartbeat is not None:
+                workers += 1
+                running += int(heartbeat)
+        claimed = counts.get("completed", 0) + counts.get("failed", 0) + running
+        return {
+            "queued": await self.conn.llen(self.QUEUE_KEY),
+            "running": running,
+            "workers": workers,
+            "enqueued": int(counts.get("enqueued", 0)),
+            "completed": int(counts.get("completed", 0)),
+            "failed": int(counts.get("failed", 0)),
+            "requeued": int(counts.get("requeued", 0)),
+            "avg_wait_ms": (
+                round(counts.get("waited_ms", 0.0) / claimed, 1) if claimed else 0.0
+            ),
+        }
+
+
+@lru_cache()
+def get_job_queue() -> JobQueue:
+    return JobQueue(get_async_redis_client())
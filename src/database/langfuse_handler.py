@@ -1,3 +1,11 @@
+import hashlib
+import logging
+import queue
+import random
+import threading
+from typing import Any, Callable, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
 from langfuse import Langfuse
 from langfuse.callback import CallbackHandler
 from langfuse.client import StatefulTraceClient
@@ -5,6 +13,86 @@ from langfuse.client import StatefulTraceClient
 from helpers import get_settings
 
 app_settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class TraceExporter:
+    """
+    Runs the callback events of the traced turns in order, on its own thread.
+    Past `max_size` events waiting, new ones are dropped rather than slowing
+    down the turns.
+    """
+
+    def __init__(self, max_size: int):
+        self.queue: queue.Queue = queue.Queue(max_size)
+        self.exported = 0
+        # Events the Langfuse handler doesn't trace
+        self.unsupported = 0
+        self.failed = 0
+        self.dropped = 0
+        self.thread = threading.Thread(
+            target=self._run, name="trace-exporter", daemon=True
+        )
+        self.thread.start()
+
+    def submit(self, call: Callable, args: tuple, kwargs: dict):
+        try:
+            self.queue.put_nowait((call, args, kwargs))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            call, args, kwargs = self.queue.get()
+            try:
+                call(*args, **kwargs)
+                self.exported += 1
+            except NotImplementedError:
+                self.unsupported += 1
+                logger.debug("Trace export of %s is not supported", call.__name__)
+            except Exception:
+                self.failed += 1
+                logger.exception("Trace export of %s failed", call.__name__)
+            finally:
+                self.queue.task_done()
+
+    def join(self):
+        self.queue.join()
+
+
+def _snapshot(value: Any) -> Any:
+    # The lists of messages passed to the callbacks are appended to afterwards
+    if isinstance(value, list):
+        return [_snapshot(item) for item in value]
+    return value
+
+
+class QueuedCallbackHandler(BaseCallbackHandler):
+    """
+    Hands the LangChain events to `handler` through the exporter. Runs inline:
+    LangChain would otherwise run it in an executor and wait for it.
+    """
+
+    run_inline = True
+
+    def __init__(self, handler: CallbackHandler, exporter: TraceExporter):
+        self.handler = handler
+        self.exporter = exporter
+
+
+def _forward(name: str):
+    def forward(self: QueuedCallbackHandler, *args, **kwargs):
+        self.exporter.submit(
+            getattr(self.handler, name), _snapshot(args), _snapshot(kwargs)
+        )
+
+    forward.__name__ = name
+    return forward
+
+
+for _name in dir(BaseCallbackHandler):
+    if _name.startswith("on_"):
+        setattr(QueuedCallbackHandler, _name, _forward(_name))
 
 
 class LangfuseHandler:
@@ -13,24 +101,70 @@ class LangfuseHandler:
     def __new__(cls):
         if cls.__instance is None:
             cls.__instance = super(LangfuseHandler, cls).__new__(cls)
-            cls.langfuse_client = Langfuse(
-                secret_key=app_settings.LANGFUSE_SK,
-                public_key=app_settings.LANGFUSE_PK,
-                host=app_settings.LANGFUSE_HOST,
+            # Without keys too: no client, and no callbacks on the turns
+            cls.enabled = bool(
+                app_settings.LANGFUSE_ENABLED
+                and app_settings.LANGFUSE_PK
+                and app_settings.LANGFUSE_SK
+            )
+            cls.sample_rate = app_settings.LANGFUSE_SAMPLE_RATE
+            cls.langfuse_client = (
+                Langfuse(
+                    secret_key=app_settings.LANGFUSE_SK,
+                    public_key=app_settings.LANGFUSE_PK,
+                    host=app_settings.LANGFUSE_HOST,
+                )
+                if cls.enabled
+                else None
+            )
+            cls.exporter = (
+                TraceExporter(app_settings.LANGFUSE_QUEUE_SIZE) if cls.enabled else None
             )
         return cls.__instance
 
+    def is_sampled(self, key: Optional[str] = None) -> bool:
+        """
+        Head sampling of the traces, decided before any callback runs. All
+        the turns of a conversation, with the same `key`, get the same answer.
+        """
+        if not self.enabled or self.sample_rate <= 0:
+            return False
+        if self.sample_rate >= 1:
+            return True
+        if key is None:
+            return random.random() < self.sample_rate
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big") / 2**64 < self.sample_rate
+
     def get_callback_handler(
         self, trace_id: str = None
-    ) -> tuple[StatefulTraceClient, CallbackHandler]:
+    ) -> tuple[Optional[StatefulTraceClient], Optional[QueuedCallbackHandler]]:
+        if not self.enabled:
+            return None, None
         trace = self.langfuse_client.trace(
             id=trace_id if trace_id is not None else None
         )
         langfuse_handler = trace.get_langchain_handler(update_parent=True)
-        return trace, langfuse_handler
+        return trace, QueuedCallbackHandler(langfuse_handler, self.exporter)
 
-    def create_trace(self) -> StatefulTraceClient:
+    def create_trace(self) -> Optional[StatefulTraceClient]:
+        if not self.enabled:
+            return None
         return self.langfuse_client.trace()
 
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "queued": self.exporter.queue.qsize() if self.exporter else 0,
+            "exported": self.exporter.exported if self.exporter else 0,
+            "unsupported": self.exporter.unsupported if self.exporter else 0,
+            "failed": self.exporter.failed if self.exporter else 0,
+            "dropped": self.exporter.dropped if self.exporter else 0,
+        }
+
     def flush(self):
+        if not self.enabled:
+            return
+        self.exporter.join()
         self.langfuse_client.flush()
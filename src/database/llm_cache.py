@@ -0,0 +1,201 @@
+"""Exact-match cache of LLM responses in Redis."""
+
+import ast
+import hashlib
+import re
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional
+
+import orjson
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+from redis import Redis
+
+from helpers import get_settings
+
+from .redis import REDIS_KEY_SEPARATOR, get_redis_client
+
+app_settings = get_settings()
+
+# Pending misses kept to measure latency, beyond that the oldest are dropped
+MAX_PENDING_MISSES = 10_000
+
+# Fields that differ between identical conversations, left out of the key: the
+# ids of the messages and of the tool calls, which tool messages refer to
+_VOLATILE_FIELDS = {"id", "tool_call_id", "response_metadata", "usage_metadata"}
+
+_TIMESTAMP_PATTERN = re.compile(
+    r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:?\d{2})?"
+)
+
+
+def _strip_volatile(value):
+    if isinstance(value, dict):
+        return {
+            key: _strip_volatile(item)
+            for key, item in value.items()
+            # The id of a serialized object is its class, e.g. AIMessage
+            if key not in _VOLATILE_FIELDS or (key == "id" and "lc" in value)
+        }
+    if isinstance(value, list):
+        return [_strip_volatile(item) for item in value]
+    return value
+
+
+def _canonical_llm_string(llm_string: str):
+    """
+    The model and its call kwargs. The kwargs are the repr of their sorted
+    items, whose nested dicts, e.g. the schemas of bound tools, keep their
+    insertion order: they are parsed back for the key to sort them too.
+    """
+    model, separator, kwargs = llm_string.partition("---")
+    if not separator:
+        return llm_string
+    try:
+        return [model, ast.literal_eval(kwargs)]
+    except (ValueError, SyntaxError):
+        return llm_string
+
+
+def contains_current_time(prompt: str, window_seconds: int) -> bool:
+    """
+    True if the prompt has a timestamp down to the second within
+    `window_seconds` of now: the prompt can't repeat, nor its answer be reused.
+    """
+    now = time.time()
+    for match in _TIMESTAMP_PATTERN.finditer(prompt):
+        try:
+            timestamp = datetime.fromisoformat(match.group().replace(" ", "T"))
+        except ValueError:
+            continue
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.astimezone()
+        if abs(timestamp.timestamp() - now) <= window_seconds:
+            return True
+    return False
+
+
+class RedisLLMCache(BaseCache):
+    """
+    LLM responses keyed by a hash of the canonicalized messages and the model
+    parameters, bound tools included.
+
+    Layout:
+    - `llm_cache:{hash}`: serialized generations and generation latency
+    - `llm_cache_index`: sorted set of the entries by insertion time, trimmed
+      to `max_entries`
+    - `llm_cache_stats`: hash of hits, misses, bypasses and saved milliseconds
+    """
+
+    INDEX_KEY = "llm_cache_index"
+    STATS_KEY = "llm_cache_stats"
+
+    def __init__(
+        self,
+        conn: Redis,
+        ttl_seconds: int,
+        max_entries: int,
+        max_entry_bytes: int,
+        now_window_seconds: int,
+    ):
+        self.conn = conn
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_entry_bytes = max_entry_bytes
+        self.now_window_seconds = now_window_seconds
+        # Start of the LLM call following each miss, to measure what a hit saves
+        self._misses: dict[str, float] = {}
+        self._misses_lock = threading.Lock()
+
+    def _key(self, prompt: str, llm_string: str) -> Optional[str]:
+        """None when the response must not be cached."""
+        if contains_current_time(prompt, self.now_window_seconds):
+            return None
+        canonical = orjson.dumps(
+            [_strip_volatile(orjson.loads(prompt)), _canonical_llm_string(llm_string)],
+            option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS,
+            default=repr,
+        )
+        digest = hashlib.sha256(canonical).hexdigest()
+        return REDIS_KEY_SEPARATOR.join(["llm_cache", digest])
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = self._key(prompt, llm_string)
+        if key is None:
+            self.conn.hincrby(self.STATS_KEY, "bypassed")
+            return None
+        data = self.conn.get(key)
+        if data is None:
+            self.conn.hincrby(self.STATS_KEY, "misses")
+            with self._misses_lock:
+                if len(self._misses) >= MAX_PENDING_MISSES:
+                    del self._misses[next(iter(self._misses))]
+                self._misses[key] = time.perf_counter()
+            return None
+        entry = orjson.loads(data)
+        pipeline = self.conn.pipeline(transaction=False)
+        pipeline.hincrby(self.STATS_KEY, "hits")
+        pipeline.hincrbyfloat(self.STATS_KEY, "saved_ms", entry["latency_ms"])
+        pipeline.execute()
+        return [loads(generation) for generation in entry["generations"]]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE):
+        key = self._key(prompt, llm_string)
+        if key is None:
+            return
+        with self._misses_lock:
+            started = self._misses.pop(key, None)
+        latency_ms = (time.perf_counter() - started) * 1000 if started else 0.0
+        data = orjson.dumps(
+            {
+                "generations": [dumps(generation) for generation in return_val],
+                "latency_ms": round(latency_ms, 1),
+            }
+        )
+        if len(data) > self.max_entry_bytes:
+            return
+        pipeline = self.conn.pipeline(transaction=False)
+        pipeline.set(key, data, ex=self.ttl_seconds)
+        pipeline.zadd(self.INDEX_KEY, {key: time.time()})
+        # Oldest entries beyond the limit, and index members already expired
+        pipeline.zremrangebyscore(self.INDEX_KEY, 0, time.time() - self.ttl_seconds)
+        pipeline.zrange(self.INDEX_KEY, 0, -self.max_entries - 1)
+        pipeline.zremrangebyrank(self.INDEX_KEY, 0, -self.max_entries - 1)
+        evicted = pipeline.execute()[3]
+        if evicted:
+            self.conn.delete(*evicted)
+
+    def clear(self, **kwargs):
+        keys = self.conn.zrange(self.INDEX_KEY, 0, -1)
+        if keys:
+            self.conn.delete(*keys)
+        self.conn.delete(self.INDEX_KEY, self.STATS_KEY)
+
+    def stats(self) -> dict[str, float]:
+        counts = {
+            field.decode(): float(value)
+            for field, value in self.conn.hgetall(self.STATS_KEY).items()
+        }
+        hits, misses = counts.get("hits", 0), counts.get("misses", 0)
+        return {
+            "hits": int(hits),
+            "misses": int(misses),
+            "bypassed": int(counts.get("bypassed", 0)),
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "saved_ms": round(counts.get("saved_ms", 0.0), 1),
+            "entries": self.conn.zcard(self.INDEX_KEY),
+        }
+
+
+@lru_cache()
+def get_llm_cache() -> RedisLLMCache:
+    return RedisLLMCache(
+        get_redis_client(),
+        ttl_seconds=app_settings.LLM_CACHE_TTL_SECONDS,
+        max_entries=app_settings.LLM_CACHE_MAX_ENTRIES,
+        max_entry_bytes=app_settings.LLM_CACHE_MAX_ENTRY_BYTES,
+        now_window_seconds=app_settings.LLM_CACHE_NOW_WINDOW_SECONDS,
+    )
@@ -0,0 +1,261 @@
+"""Per-user and global admission control of the chat turns in Redis."""
+
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+from redis.asyncio import Redis as AsyncRedis
+
+from helpers import get_settings
+
+from .redis import REDIS_KEY_SEPARATOR, get_async_redis_client
+
+app_settings = get_settings()
+
+_REFILL = """
+local function refill(key, rate, capacity, now)
+    local bucket = redis.call('hmget', key, 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    return math.min(capacity, tokens + math.max(now - ts, 0) * rate)
+end
+"""
+
+# KEYS: request buckets, LLM token buckets, turn sets (user then global), stats
+# ARGV: now, rate and capacity of the 4 buckets, max turns of the 2 sets, slot
+# id and slot expiry
+_ADMIT_SCRIPT = (
+    _REFILL
+    + """
+local now = tonumber(ARGV[1])
+local names = {'user_requests', 'global_requests', 'user_llm_tokens', 'global_llm_tokens'}
+local levels = {}
+for i = 1, 4 do
+    local rate = tonumber(ARGV[2 * i])
+    levels[i] = refill(KEYS[i], rate, tonumber(ARGV[2 * i + 1]), now)
+    -- A request per turn, and LLM tokens left: the spent ones are charged after
+    if levels[i] < 1 then
+        redis.call('hincrby', KEYS[7], 'rejected:' .. names[i], 1)
+        return {names[i], tostring((1 - levels[i]) / rate)}
+    end
+end
+for i = 5, 6 do
+    redis.call('zremrangebyscore', KEYS[i], '-inf', now)
+    if redis.call('zcard', KEYS[i]) >= tonumber(ARGV[5 + i]) then
+        local name = i == 5 and 'user_turns' or 'global_turns'
+        redis.call('hincrby', KEYS[7], 'rejected:' .. name, 1)
+        return {name, '1'}
+    end
+end
+for i = 1, 2 do
+    local rate, capacity = tonumber(ARGV[2 * i]), tonumber(ARGV[2 * i + 1])
+    redis.call('hset', KEYS[i], 'tokens', levels[i] - 1, 'ts', now)
+    redis.call('expire', KEYS[i], math.ceil(capacity / rate) + 1)
+end
+for i = 5, 6 do
+    redis.call('zadd', KEYS[i], ARGV[13], ARGV[12])
+    redis.call('expireat', KEYS[i], math.ceil(tonumber(ARGV[13])))
+end
+redis.call('hincrby', KEYS[7], 'admitted', 1)
+return {}
+"""
+)
+
+# KEYS: LLM token buckets. ARGV: now, cost, then rate and capacity per bucket
+_CHARGE_SCRIPT = (
+    _REFILL
+    + """
+local now, cost = tonumber(ARGV[1]), tonumber(ARGV[2])
+for i = 1, #KEYS do
+    local rate, capacity = tonumber(ARGV[2 * i + 1]), tonumber(ARGV[2 * i + 2])
+    -- Debt of up to a full bucket, paid back before the next admission
+    local tokens = math.max(refill(KEYS[i], rate, capacity, now) - cost, -capacity)
+    redis.call('hset', KEYS[i], 'tokens', tokens, 'ts', now)
+    redis.call('expire', KEYS[i], math.ceil(2 * capacity / rate) + 1)
+end
+return 1
+"""
+)
+
+
+@dataclass
+class Budget:
+    """`capacity` units, refilled at `capacity` per minute."""
+
+    capacity: int
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / 60
+
+
+class RateLimitExceededError(Exception):
+    def __init__(self, limit: str, retry_after: float):
+        super().__init__(f"Rate limit exceeded: {limit}")
+        self.limit = limit
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """
+    Token buckets on the requests and on the LLM tokens, and counts of the
+    turns in flight, per user and for the whole deployment. A turn is admitted
+    against all of them at once, atomically.
+
+    Layout:
+    - `rate_limit:requests:{user|global}`: bucket hash of tokens and timestamp
+    - `rate_limit:llm_tokens:{user|global}`: same, charged after each turn
+    - `rate_limit:turns:{user|global}`: sorted set of the turns in flight by
+      expiry, so the turns of a crashed process don't hold their slot forever
+    - `rate_limit_stats`: hash of admitted turns and rejections per limit
+    """
+
+    STATS_KEY = "rate_limit_stats"
+    GLOBAL = "global"
+
+    def __init__(
+        self,
+        conn: AsyncRedis,
+        user_requests: Budget,
+        global_requests: Budget,
+        user_llm_tokens: Budget,
+        global_llm_tokens: Budget,
+        user_max_turns: int,
+        global_max_turns: int,
+        slot_seconds: int,
+    ):
+        self.conn = conn
+        self.user_requests = user_requests
+        self.global_requests = global_requests
+        self.user_llm_tokens = user_llm_tokens
+        self.global_llm_tokens = global_llm_tokens
+        self.user_max_turns = user_max_turns
+        self.global_max_turns = global_max_turns
+        self.slot_seconds = slot_seconds
+
+    @staticmethod
+    def _key(kind: str, owner: str) -> str:
+        return REDIS_KEY_SEPARATOR.join(["rate_limit", kind, owner])
+
+    async def admit(self, user_id: str, slot_id: str):
+        """Takes a turn slot for `slot_id`, or raises RateLimitExceededError."""
+        now = time.time()
+        budgets = [
+            self.user_requests,
+            self.global_requests,
+            self.user_llm_tokens,
+            self.global_llm_tokens,
+        ]
+        admit = self.conn.register_script(_ADMIT_SCRIPT)
+        rejection = await admit(
+            keys=[
+                self._key("requests", user_id),
+                self._key("requests", self.GLOBAL),
+                self._key("llm_tokens", user_id),
+                self._key("llm_tokens", self.GLOBAL),
+                self._key("turns", user_id),
+                self._key("turns", self.GLOBAL),
+                self.STATS_KEY,
+            ],
+            args=[
+                now,
+                *[
+                    value
+                    for budget in budgets
+                    for value in (budget.rate, budget.capacity)
+                ],
+                self.user_max_turns,
+                self.global_max_turns,
+                slot_id,
+                now + self.slot_seconds,
+            ],
+        )
+        if rejection:
+            limit, retry_after = (value.decode() for value in rejection)
+            raise RateLimitExceededError(limit, float(retry_after))
+
+    async def finish(self, user_id: str, slot_id: str, llm_tokens: int):
+        """Frees the turn slot and charges the LLM tokens the turn used."""
+        pipeline = self.conn.pipeline(transaction=False)
+        pipeline.zrem(self._key("turns", user_id), slot_id)
+        pipeline.zrem(self._key("turns", self.GLOBAL), slot_id)
+        await pipeline.execute()
+        if not llm_tokens:
+            return
+        charge = self.conn.register_script(_CHARGE_SCRIPT)
+        await charge(
+            keys=[
+                self._key("llm_tokens", user_id),
+                self._key("llm_tokens", self.GLOBAL),
+            ],
+            args=[
+                time.time(),
+                llm_tokens,
+                self.user_llm_tokens.rate,
+                self.user_llm_tokens.capacity,
+                self.global_llm_tokens.rate,
+                self.global_llm_tokens.capacity,
+            ],
+        )
+
+    async def _level(self, key: str, budget: Budget) -> float:
+        tokens, ts = await self.conn.hmget(key, "tokens", "ts")
+        if tokens is None:
+            return budget.capacity
+        elapsed = max(time.time() - float(ts), 0)
+        return min(budget.capacity, float(tokens) + elapsed * budget.rate)
+
+    async def _utilization(
+        self, owner: str, requests: Budget, llm_tokens: Budget, max_turns: int
+    ) -> dict[str, float]:
+        turns_key = self._key("turns", owner)
+        await self.conn.zremrangebyscore(turns_key, "-inf", time.time())
+        turns = await self.conn.zcard(turns_key)
+        requests_left = await self._level(self._key("requests", owner), requests)
+        tokens_left = await self._level(self._key("llm_tokens", owner), llm_tokens)
+        return {
+            "turns": turns,
+            "turns_utilization": round(turns / max_turns, 3),
+            "requests_utilization": round(1 - requests_left / requests.capacity, 3),
+            "llm_tokens_utilization": round(1 - tokens_left / llm_tokens.capacity, 3),
+        }
+
+    async def stats(self, user_id: Optional[str] = None) -> dict:
+        counts = {
+            field.decode(): int(value)
+            for field, value in (await self.conn.hgetall(self.STATS_KEY)).items()
+        }
+        stats = {
+            "admitted": counts.pop("admitted", 0),
+            "rejected": {
+                field.split(":", 1)[1]: value for field, value in counts.items()
+            },
+            "global": await self._utilization(
+                self.GLOBAL,
+                self.global_requests,
+                self.global_llm_tokens,
+                self.global_max_turns,
+            ),
+        }
+        if user_id is not None:
+            stats["user"] = await self._utilization(
+                user_id, self.user_requests, self.user_llm_tokens, self.user_max_turns
+            )
+        return stats
+
+
+@lru_cache()
+def get_rate_limiter() -> RateLimiter:
+    return RateLimiter(
+        get_async_redis_client(),
+        user_requests=Budget(app_settings.USER_REQUESTS_PER_MINUTE),
+        global_requests=Budget(app_settings.GLOBAL_REQUESTS_PER_MINUTE),
+        user_llm_tokens=Budget(app_settings.USER_LLM_TOKENS_PER_MINUTE),
+        global_llm_tokens=Budget(app_settings.GLOBAL_LLM_TOKENS_PER_MINUTE),
+        user_max_turns=app_settings.USER_MAX_CONCURRENT_TURNS,
+        global_max_turns=app_settings.GLOBAL_MAX_CONCURRENT_TURNS,
+        # Longest a turn holds its slot: waiting for its thread, then running
+        slot_seconds=app_settings.THREAD_LOCK_WAIT_SECONDS
+        + app_settings.TURN_DEADLINE_SECONDS,
+    )
@@ -1,6 +1,9 @@
 """Implementation of a langgraph async checkpoint saver using Redis."""
 
+import inspect
+import time
 from contextlib import asynccontextmanager
+from functools import lru_cache, wraps
 from typing import Any, AsyncGenerator, AsyncIterator, List, Optional, Tuple
 
 from langchain_core.runnables import RunnableConfig
@@ -9,17 +12,66 @@ from langgraph.checkpoint.base import (BaseCheckpointSaver, ChannelVersions,
                                        CheckpointTuple, PendingWrite,
                                        get_checkpoint_id)
 from langgraph.checkpoint.serde.base import SerializerProtocol
+from redis import Redis, WatchError
 from redis.asyncio import Redis as AsyncRedis
 
 from helpers import get_settings
+from helpers.metrics import CHECKPOINTER_SECONDS
 
 REDIS_KEY_SEPARATOR = ":"
 
 app_settings = get_settings()
 
+
+class StaleFencingTokenError(Exception):
+    """A write was made under a thread lease that has since been lost."""
+
+
+def _timed(op: str):
+    """Times a checkpointer operation, see helpers.metrics."""
+    histogram = CHECKPOINTER_SECONDS.labels(op)
+
+    def decorator(method):
+        if inspect.isasyncgenfunction(method):
+
+            @wraps(method)
+            async def list_timed(*args, **kwargs):
+                # Time spent listing, not in the consumer between the items
+                elapsed = 0.0
+                items = method(*args, **kwargs)
+                try:
+                    while True:
+                        start = time.perf_counter()
+                        try:
+                            item = await items.__anext__()
+                        except StopAsyncIteration:
+                            return
+                        finally:
+                            elapsed += time.perf_counter() - start
+                        yield item
+                finally:
+                    histogram.observe(elapsed)
+                    await items.aclose()
+
+            return list_timed
+
+        @wraps(method)
+        async def timed(*args, **kwargs):
+            with histogram.time():
+                return await method(*args, **kwargs)
+
+        return timed
+
+    return decorator
+
+
 # Utilities shared by both RedisSaver and AsyncRedisSaver
 
 
+def make_thread_lease_key(thread_id: str) -> str:
+    return REDIS_KEY_SEPARATOR.join(["thread_lease", thread_id])
+
+
 def _make_redis_checkpoint_key(
     thread_id: str, checkpoint_ns: str, checkpoint_id: str
 ) -> str:
@@ -192,6 +244,7 @@ class AsyncRedisSaver(BaseCheckpointSaver):
             if conn:
                 await conn.aclose()
 
+    @_timed("aput")
     async def aput(
         self,
         config: RunnableConfig,
@@ -231,8 +284,7 @@ class AsyncRedisSaver(BaseCheckpointSaver):
             ),
         }
 
-        await self.conn.hset(key, mapping=data)
-        await self.conn.expire(key, app_settings.REDIS_TTL_SECONDS)
+        await self._afenced_hset(config, key, data)
         return {
             "configurable": {
                 "thread_id": thread_id,
@@ -241,6 +293,7 @@ class AsyncRedisSaver(BaseCheckpointSaver):
             }
         }
 
+    @_timed("aput_writes")
     async def aput_writes(
         self,
         config: RunnableConfig,
@@ -264,10 +317,39 @@ class AsyncRedisSaver(BaseCheckpointSaver):
             key = _make_redis_checkpoint_writes_key(
                 thread_id, checkpoint_ns, checkpoint_id, task_id, idx
             )
-            await self.conn.hset(key, mapping=data)
-            await self.conn.expire(key, app_settings.REDIS_TTL_SECONDS)
+            await self._afenced_hset(config, key, data)
         return config
 
+    async def _afenced_hset(self, config: RunnableConfig, key: str, data: dict):
+        """
+        Writes `data` to `key`. When the config carries the fencing token of a
+        thread lease, the write only happens while that lease is still held.
+        """
+        token = config["configurable"].get("fencing_token")
+        if token is None:
+            await self.conn.hset(key, mapping=data)
+            await self.conn.expire(key, app_settings.REDIS_TTL_SECONDS)
+            return
+        lease_key = make_thread_lease_key(config["configurable"]["thread_id"])
+        async with self.conn.pipeline(transaction=True) as pipeline:
+            while True:
+                await pipeline.watch(lease_key)
+                holder = await pipeline.get(lease_key)
+                if holder is None or int(holder) != token:
+                    raise StaleFencingTokenError(
+                        f"Lease {token} of thread {config['configurable']['thread_id']} was lost."
+                    )
+                pipeline.multi()
+                pipeline.hset(key, mapping=data)
+                pipeline.expire(key, app_settings.REDIS_TTL_SECONDS)
+                try:
+                    await pipeline.execute()
+                    return
+                except WatchError:
+                    # Renewed or taken over meanwhile, check again
+                    continue
+
+    @_timed("aget_tuple")
     async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
         """Get a checkpoint tuple from Redis asynchronously.
 
@@ -318,6 +400,7 @@ class AsyncRedisSaver(BaseCheckpointSaver):
             self.serde, checkpoint_key, checkpoint_data, pending_writes=pending_writes
         )
 
+    @_timed("alist")
     async def alist(
         self,
         config: Optional[RunnableConfig],
@@ -404,3 +487,25 @@ async def get_redis_manager():
         password=app_settings.REDIS_PASSWORD,
     ) as manager:
         yield manager
+
+
+@lru_cache()
+def get_async_redis_client() -> AsyncRedis:
+    """Shared asynchronous client for code running in the event loop (e.g. routes)."""
+    return AsyncRedis(
+        host=app_settings.REDIS_HOST,
+        port=app_settings.REDIS_PORT,
+        db=app_settings.REDIS_DB,
+        password=app_settings.REDIS_PASSWORD,
+    )
+
+
+@lru_cache()
+def get_redis_client() -> Redis:
+    """Shared synchronous client for code running in worker threads (e.g. tools)."""
+    return Redis(
+        host=app_settings.REDIS_HOST,
+        port=app_settings.REDIS_PORT,
+        db=app_settings.REDIS_DB,
+        password=app_settings.REDIS_PASSWORD,
+    )
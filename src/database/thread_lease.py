@@ -0,0 +1,133 @@
+"""Leases serializing the turns of a conversation thread across workers."""
+
+import asyncio
+from typing import Optional
+
+from redis.asyncio import Redis as AsyncRedis
+
+from helpers import get_settings
+
+from .redis import (REDIS_KEY_SEPARATOR, get_async_redis_client,
+                    make_thread_lease_key)
+
+app_settings = get_settings()
+
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1], KEYS[2])
+end
+return 0
+"""
+
+
+class ThreadLease:
+    """
+    Exclusive, expiring right to run turns of a thread.
+
+    Each acquisition gets a fencing token, increasing per thread, stored as the
+    value of the lease. The holder renews the lease while it runs; checkpoint
+    writes carrying an older token are refused (see AsyncRedisSaver), so a
+    holder that lost its lease can't fork the state.
+
+    Layout:
+    - `thread_lease:{thread}`: fencing token of the holder, expiring
+    - `thread_lease:{thread}:message`: user message of the turn in flight
+    - `thread_fence:{thread}`: last fencing token handed out
+    - `thread_pending:{thread}`: messages merged into the next turn
+    """
+
+    def __init__(self, conn: AsyncRedis, thread_id: str, lease_seconds: int):
+        self.conn = conn
+        self.thread_id = thread_id
+        self.lease_ms = lease_seconds * 1000
+        self.key = make_thread_lease_key(thread_id)
+        self.message_key = f"{self.key}{REDIS_KEY_SEPARATOR}message"
+        self.fence_key = REDIS_KEY_SEPARATOR.join(["thread_fence", thread_id])
+        self.pending_key = REDIS_KEY_SEPARATOR.join(["thread_pending", thread_id])
+        self.token: Optional[int] = None
+        self._renewal: Optional[asyncio.Task] = None
+
+    async def acquire(self, message: str) -> bool:
+        token = await self.conn.incr(self.fence_key)
+        if not await self.conn.set(self.key, token, nx=True, px=self.lease_ms):
+            return False
+        self.token = token
+        await self.conn.set(self.message_key, message, px=self.lease_ms)
+        self._renewal = asyncio.create_task(self._renew())
+        return True
+
+    async def wait_acquire(self, message: str, timeout_seconds: float) -> bool:
+        deadline = asyncio.get_running_loop().time() + timeout_seconds
+        delay = 0.05
+        while not await self.acquire(message):
+            if asyncio.get_running_loop().time() + delay > deadline:
+                return False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+        return True
+
+    async def _renew(self):
+        renew = self.conn.register_script(_RENEW_SCRIPT)
+        while True:
+            await asyncio.sleep(self.lease_ms / 3000)
+            if not await renew(keys=[self.key], args=[self.token, self.lease_ms]):
+                # Lost, the checkpointer refuses the remaining writes
+                return
+            await self.conn.pexpire(self.message_key, self.lease_ms)
+
+    async def release(self):
+        if self._renewal:
+            self._renewal.cancel()
+        if self.token is not None:
+            release = self.conn.register_script(_RELEASE_SCRIPT)
+            await release(keys=[self.key, self.message_key], args=[self.token])
+            self.token = None
+
+    async def is_held(self) -> bool:
+        return bool(await self.conn.exists(self.key))
+
+    async def wait_released(self, timeout_seconds: float) -> bool:
+        deadline = asyncio.get_running_loop().time() + timeout_seconds
+        while await self.is_held():
+            if asyncio.get_running_loop().time() >= deadline:
+                return False
+            await asyncio.sleep(0.1)
+        return True
+
+    # ---- Merging ----
+
+    async def merge(self, message: str) -> bool:
+        """
+        Adds `message` to the next turn. Returns False for a duplicate of the
+        message in flight, e.g. a double submit, which is dropped.
+        """
+        in_flight = await self.conn.get(self.message_key)
+        if in_flight is not None and in_flight.decode() == message:
+            return False
+        await self.conn.rpush(self.pending_key, message)
+        await self.conn.pexpire(self.pending_key, self.lease_ms * 10)
+        return True
+
+    async def withdraw(self, message: str) -> bool:
+        """Removes a merged message, True if it wasn't picked up by a turn."""
+        return bool(await self.conn.lrem(self.pending_key, 1, message))
+
+    async def take_pending(self) -> list[str]:
+        pipeline = self.conn.pipeline(transaction=True)
+        pipeline.lrange(self.pending_key, 0, -1)
+        pipeline.delete(self.pending_key)
+        messages, _ = await pipeline.execute()
+        return [message.decode() for message in messages]
+
+
+def get_thread_lease(thread_id: str) -> ThreadLease:
+    return ThreadLease(
+        get_async_redis_client(), thread_id, app_settings.THREAD_LEASE_SECONDS
+    )
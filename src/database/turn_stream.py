@@ -0,0 +1,93 @@
+"""Events of a chat turn in a Redis Stream, replayable by id."""
+
+from typing import AsyncGenerator, Optional
+
+import orjson
+from redis.asyncio import Redis as AsyncRedis
+
+from helpers import get_settings
+
+from .redis import REDIS_KEY_SEPARATOR, get_async_redis_client
+
+app_settings = get_settings()
+
+
+class TurnStream:
+    """
+    `turn_stream:{turn_id}`: one entry per event, then an end marker. Readers
+    can start after any entry id, e.g. the `Last-Event-ID` of a reconnection.
+
+    `turn_stream:{turn_id}:followed`: set by the readers before each blocking
+    read, expires `grace_seconds` after the last reader went away.
+    """
+
+    # Blocking read timeout, the readers check the stream still exists after it
+    READ_BLOCK_MS = 5_000
+
+    def __init__(
+        self,
+        conn: AsyncRedis,
+        turn_id: str,
+        ttl_seconds: int,
+        maxlen: int,
+        grace_seconds: int,
+    ):
+        self.conn = conn
+        self.turn_id = turn_id
+        self.ttl_seconds = ttl_seconds
+        self.maxlen = maxlen
+        self.grace_ms = grace_seconds * 1000
+        self.key = REDIS_KEY_SEPARATOR.join(["turn_stream", turn_id])
+        self.followed_key = f"{self.key}{REDIS_KEY_SEPARATOR}followed"
+
+    async def _add(self, fields: dict) -> str:
+        pipeline = self.conn.pipeline(transaction=False)
+        pipeline.xadd(self.key, fields, maxlen=self.maxlen, approximate=True)
+        pipeline.expire(self.key, self.ttl_seconds)
+        event_id, _ = await pipeline.execute()
+        return event_id.decode()
+
+    async def publish(self, event: dict) -> str:
+        return await self._add({"event": orjson.dumps(event)})
+
+    async def close(self):
+        await self._add({"end": 1})
+
+    async def exists(self) -> bool:
+        return bool(await self.conn.exists(self.key))
+
+    async def mark_followed(self):
+        await self.conn.set(self.followed_key, 1, px=self.READ_BLOCK_MS + self.grace_ms)
+
+    async def is_followed(self) -> bool:
+        return bool(await self.conn.exists(self.followed_key))
+
+    async def read(
+        self, last_event_id: Optional[str] = None
+    ) -> AsyncGenerator[tuple[str, dict], None]:
+        """Yields (event id, event) after `last_event_id` until the end marker."""
+        last_event_id = last_event_id or "0"
+        while True:
+            await self.mark_followed()
+            entries = await self.conn.xread(
+                {self.key: last_event_id}, block=self.READ_BLOCK_MS, count=100
+            )
+            if not entries:
+                if not await self.exists():
+                    return
+                continue
+            for event_id, fields in entries[0][1]:
+                if b"end" in fields:
+                    return
+                last_event_id = event_id.decode()
+                yield last_event_id, orjson.loads(fields[b"event"])
+
+
+def get_turn_stream(turn_id: str) -> TurnStream:
+    return TurnStream(
+        get_async_redis_client(),
+        turn_id,
+        app_settings.TURN_STREAM_TTL_SECONDS,
+        app_settings.TURN_STREAM_MAXLEN,
+        app_settings.TURN_ABANDON_GRACE_SECONDS,
+    )
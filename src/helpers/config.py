@@ -8,7 +8,17 @@ from pydantic_settings import BaseSettings
 class Settings(BaseSettings):
     OPENAI_API_KEY: str
     LLM_MODEL: str = "openai__gpt-4.1"
-    EMBEDDING_MODEL: str = "openai__text-embedding-3-small"
+    SMALL_LLM_MODEL: str = "openai__gpt-4.1-mini"
+    LLM_CASCADE_ENABLED: bool = False
+    CASCADE_MIN_CONFIDENCE: float = 0.75
+    CASCADE_HARD_CONSTRAINTS: int = 3
+    LLM_CACHE_ENABLED: bool = False
+    LLM_CACHE_TTL_SECONDS: int = 60 * 60  # 1 hour
+    LLM_CACHE_MAX_ENTRIES: int = 10_000
+    LLM_CACHE_MAX_ENTRY_BYTES: int = 256 * 1024
+    LLM_CACHE_NOW_WINDOW_SECONDS: int = 5 * 60
+    VALIDATOR_LLM_MODEL: str = "openai__gpt-4.1-nano"
+    EMBEDDING_MODEL: str = "openai__text-embedding-3-small"  # or hashing__256
     EMBEDDING_LENGTH: int = 1536
     # PG_VECTOR_DB_URL: str = ""
 
@@ -21,10 +31,70 @@ class Settings(BaseSettings):
     REDIS_DB: int = 1
     REDIS_PASSWORD: str = ""
     REDIS_TTL_SECONDS: int = 60 * 10  # 10 minutes
+    THREAD_LOCK_POLICY: str = "queue"  # reject | queue | merge
+    THREAD_LEASE_SECONDS: int = 30
+    THREAD_LOCK_WAIT_SECONDS: int = 120
+    TURN_STREAM_TTL_SECONDS: int = 60 * 10  # 10 minutes
+    TURN_STREAM_MAXLEN: int = 1000
+    TURN_DEADLINE_SECONDS: int = 120  # default and maximum time budget of a turn
+    CANCEL_ABANDONED_TURNS: bool = True
+    TURN_ABANDON_GRACE_SECONDS: int = 10
+    RATE_LIMIT_ENABLED: bool = True
+    USER_REQUESTS_PER_MINUTE: int = 20
+    GLOBAL_REQUESTS_PER_MINUTE: int = 600
+    USER_MAX_CONCURRENT_TURNS: int = 2
+    GLOBAL_MAX_CONCURRENT_TURNS: int = 50
+    USER_LLM_TOKENS_PER_MINUTE: int = 200_000
+    GLOBAL_LLM_TOKENS_PER_MINUTE: int = 2_000_000
+    JOB_MODE_ENABLED: bool = False  # graph runs on the job workers (worker.py)
+    WORKER_CONCURRENCY: int = 4
+    WORKER_HEARTBEAT_SECONDS: int = 10
+    WORKER_METRICS_PORT: int = 0  # serves the worker's /metrics when set
+    LLM_MAX_CONCURRENT_CALLS: int = 64  # per process
+    BATCH_MAX_CONCURRENT_THREADS: int = 8
+    BATCH_OUTPUT_DIR: str = "output/batches"
+
+    DEFAULT_USER_ID: str = "default"
+    USER_TOKEN_SECRET: str = ""  # signs the user tokens, single-user app if unset
+    GOOGLE_CLIENT_SECRETS_FILE: str = "assets/OAuth Client ID mcp-test.json"
+    GOOGLE_LOCAL_OAUTH_FLOW: bool = False  # browser flow, local development only
+    CREDENTIAL_STORE: str = "redis"  # redis | file
+    CREDENTIAL_STORE_DIR: str = "tokens"
+    CREDENTIALS_ENCRYPTION_KEY: str = ""  # Fernet key
+    CREDENTIAL_REFRESH_LOCK_SECONDS: int = 30
+
+    CONTACTS_SYNC_INTERVAL_SECONDS: int = 60
+    CONTACTS_CACHE_TTL_SECONDS: int = 60 * 60 * 24  # 1 day
+    CONTACT_MATCHING_MODE: str = "fuzzy"  # fuzzy | embedding
+    CONTACT_EMBEDDING_THRESHOLD: float = 0.35
+    CONTACT_EMBEDDINGS_DIR: str = "contact_embeddings"
+    EVENT_CACHE_TTL_SECONDS: int = 60 * 60  # 1 hour
+    CALENDAR_WEBHOOK_URL: str = ""  # public URL of /api/v1/webhooks/google-calendar
+    CALENDAR_WATCH_TTL_SECONDS: int = 60 * 60 * 24 * 7  # 7 days
+    INVITATIONS_POLL_SECONDS: int = 60
+    GOOGLE_MAX_CONCURRENT_CALLS: int = 16  # per process
+    GOOGLE_USER_MAX_CONCURRENT_CALLS: int = 4
+    GOOGLE_MAX_RETRIES: int = 4
+    GOOGLE_BACKOFF_BASE_SECONDS: float = 0.5
+    GOOGLE_BACKOFF_MAX_SECONDS: float = 8
+    GOOGLE_BREAKER_FAILURES: int = 5
+    GOOGLE_BREAKER_COOLDOWN_SECONDS: int = 30
+    GOOGLE_MIRROR_TTL_SECONDS: int = 60 * 60 * 24  # 1 day
+    GOOGLE_STATS_FLUSH_SECONDS: int = 10
+    VERBOSE_TOOL_OUTPUT: bool = False
+    TOOL_CACHE_ENABLED: bool = True
+    TOOL_CACHE_TTL_SECONDS: int = 60  # bounds staleness without a push channel
+    GRAPH_MODE: str = "react"  # react | plan_execute
+    FAST_PATH_ENABLED: bool = True
+    VALIDATOR_ENABLED: bool = True
+    TOOL_SELECTION_ENABLED: bool = True
 
     LANGFUSE_PK: str = ""
     LANGFUSE_SK: str = ""
     LANGFUSE_HOST: str = ""
+    LANGFUSE_ENABLED: bool = True  # off as well without keys
+    LANGFUSE_SAMPLE_RATE: float = 1.0  # share of the conversations traced
+    LANGFUSE_QUEUE_SIZE: int = 10_000  # events waiting for export, dropped past it
 
     model_config = ConfigDict(
         env_file=".env" if os.getenv("ENVIRONMENT") != "production" else None,
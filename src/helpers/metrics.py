@@ -0,0 +1,116 @@
+"""
+Prometheus metrics of the turns, served at `/metrics`. With several processes,
+set PROMETHEUS_MULTIPROC_DIR for the values of all of them to be served.
+"""
+
+import os
+import time
+from functools import lru_cache
+from typing import Any
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+
+NAMESPACE = "calendar_agent"
+
+# Nodes, tools and LLM calls, up to the turn's deadline
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Redis round trips
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+NODE_SECONDS = Histogram(
+    "graph_node_seconds",
+    "Duration of the graph nodes",
+    ["node"],
+    namespace=NAMESPACE,
+    buckets=LATENCY_BUCKETS,
+)
+TOOL_SECONDS = Histogram(
+    "tool_call_seconds",
+    "Duration of the tool calls",
+    ["tool", "outcome"],
+    namespace=NAMESPACE,
+    buckets=LATENCY_BUCKETS,
+)
+CHECKPOINTER_SECONDS = Histogram(
+    "checkpointer_op_seconds",
+    "Duration of the Redis checkpointer operations",
+    ["op"],
+    namespace=NAMESPACE,
+    buckets=FAST_BUCKETS,
+)
+LLM_SECONDS = Histogram(
+    "llm_call_seconds",
+    "Duration of the LLM calls",
+    ["model"],
+    namespace=NAMESPACE,
+    buckets=LATENCY_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "llm_tokens",
+    "Tokens of the LLM calls",
+    ["model", "kind"],
+    namespace=NAMESPACE,
+)
+SSE_FIRST_BYTE_SECONDS = Histogram(
+    "sse_time_to_first_byte_seconds",
+    "Time from the route handler to the first event sent on its stream",
+    ["route"],
+    namespace=NAMESPACE,
+    buckets=LATENCY_BUCKETS,
+)
+TURNS_IN_FLIGHT = Gauge(
+    "turns_in_flight",
+    "Turns running",
+    namespace=NAMESPACE,
+    multiprocess_mode="livesum",
+)
+
+
+class ToolMetricsHandler(BaseCallbackHandler):
+    """Duration of the tool calls of the runs it's a callback of, by outcome."""
+
+    # Records a timestamp, no need for an executor
+    run_inline = True
+    # Only the tool events, which LangChain skips on `ignore_agent`
+    ignore_llm = True
+    ignore_chat_model = True
+    ignore_chain = True
+    ignore_retriever = True
+    ignore_retry = True
+    ignore_custom_event = True
+
+    def __init__(self):
+        self.starts: dict[UUID, tuple[str, float]] = {}
+
+    def on_tool_start(self, serialized, input_str, *, run_id: UUID, **kwargs):
+        self.starts[run_id] = (serialized.get("name", "unknown"), time.perf_counter())
+
+    def _observe(self, run_id: UUID, outcome: str):
+        started = self.starts.pop(run_id, None)
+        if started is not None:
+            name, start = started
+            TOOL_SECONDS.labels(name, outcome).observe(time.perf_counter() - start)
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any):
+        self._observe(run_id, "ok")
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._observe(run_id, "error")
+
+
+@lru_cache()
+def get_tool_metrics_handler() -> ToolMetricsHandler:
+    return ToolMetricsHandler()
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """The metrics in the Prometheus text format, and its content type."""
+    registry = REGISTRY
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
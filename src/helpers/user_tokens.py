@@ -0,0 +1,26 @@
+"""
+Signed user tokens, binding a client to the user whose Google credentials its
+turns use. A token is `<user_id>.<signature>`, the signature being the
+HMAC-SHA256 of the user id with USER_TOKEN_SECRET.
+"""
+
+import hashlib
+import hmac
+from typing import Optional
+
+
+def _signature(user_id: str, secret: str) -> str:
+    return hmac.new(secret.encode(), user_id.encode(), hashlib.sha256).hexdigest()
+
+
+def sign_user_id(user_id: str, secret: str) -> str:
+    """Token of `user_id`, handed to its client once authenticated."""
+    return f"{user_id}.{_signature(user_id, secret)}"
+
+
+def verify_user_token(token: str, secret: str) -> Optional[str]:
+    """The user id of `token`, None if it isn't signed with `secret`."""
+    user_id, _, signature = token.rpartition(".")
+    if not user_id or not hmac.compare_digest(signature, _signature(user_id, secret)):
+        return None
+    return user_id
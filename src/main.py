@@ -5,9 +5,10 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import ORJSONResponse
 
+from core.google_api import get_google_api_scheduler
 from core.main_graph import compile_graph
 from database import LangfuseHandler, get_redis_saver
-from routes.v1 import base, chat
+from routes.v1 import base, batches, chat, metrics, webhooks
 
 
 @asynccontextmanager
@@ -19,6 +20,7 @@ async def lifespan(app: FastAPI):
             yield
     finally:
         langfuse.flush()
+        get_google_api_scheduler().flush_stats()
 
 
 app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
@@ -35,6 +37,9 @@ app.add_middleware(
 
 app.include_router(base.base_router)
 app.include_router(chat.chat_router)
+app.include_router(batches.batches_router)
+app.include_router(webhooks.webhooks_router)
+app.include_router(metrics.metrics_router)
 
 
 # Suppress logging warnings from gRPC underlying gemini api library
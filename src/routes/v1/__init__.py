@@ -1,2 +1,5 @@
 from .base import base_router
+from .batches import batches_router
 from .chat import chat_router
+from .metrics import metrics_router
+from .webhooks import webhooks_router
@@ -1,6 +1,13 @@
+from typing import Optional
+
 from fastapi import APIRouter, status
 from fastapi.responses import ORJSONResponse
 
+from core.google_api import get_google_api_scheduler
+from core.main_graph.tool_cache import get_tool_cache
+from database import (LangfuseHandler, get_job_queue, get_llm_cache,
+                      get_rate_limiter)
+
 base_router = APIRouter(
     prefix="/api/v1",
     tags=["api_v1"],
@@ -19,3 +26,69 @@ async def welcome():
         "app_name": "Simple Calender Agent",
         "version": "0.0.1",
     }
+
+
+@base_router.get(
+    "/tool-cache/stats",
+    response_class=ORJSONResponse,
+    status_code=status.HTTP_200_OK,
+)
+def tool_cache_stats():
+    """Hits, misses and hit rate of the read-only tool result cache, per tool."""
+    return get_tool_cache().stats()
+
+
+@base_router.get(
+    "/llm-cache/stats",
+    response_class=ORJSONResponse,
+    status_code=status.HTTP_200_OK,
+)
+def llm_cache_stats():
+    """Hits, misses, bypasses, hit rate and saved latency of the LLM response cache."""
+    return get_llm_cache().stats()
+
+
+@base_router.get(
+    "/google-api/stats",
+    response_class=ORJSONResponse,
+    status_code=status.HTTP_200_OK,
+)
+def google_api_stats():
+    """
+    Calls, retries, errors, fallbacks and latency per Google API method, and the
+    state of the circuit breakers of this process.
+    """
+    return get_google_api_scheduler().stats()
+
+
+@base_router.get(
+    "/jobs/stats",
+    response_class=ORJSONResponse,
+    status_code=status.HTTP_200_OK,
+)
+async def job_queue_stats():
+    """Queue depth, running jobs, live workers and throughput of the job workers."""
+    return await get_job_queue().stats()
+
+
+@base_router.get(
+    "/rate-limits/stats",
+    response_class=ORJSONResponse,
+    status_code=status.HTTP_200_OK,
+)
+async def rate_limit_stats(user_id: Optional[str] = None):
+    """
+    Admitted turns, rejections per limit, and utilization of the global limits,
+    and of the limits of `user_id` if given.
+    """
+    return await get_rate_limiter().stats(user_id)
+
+
+@base_router.get(
+    "/tracing/stats",
+    response_class=ORJSONResponse,
+    status_code=status.HTTP_200_OK,
+)
+def tracing_stats():
+    """Sampling and export queue of the Langfuse traces of this process."""
+    return LangfuseHandler().stats()
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import os
+import uuid
+from typing import Optional
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import FileResponse
+from langgraph.graph.state import CompiledStateGraph
+
+from controllers import BatchController
+from core.main_graph import get_compiled_graph
+from helpers import get_settings
+
+from .dependencies import current_user_id
+
+app_settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+batches_router = APIRouter(
+    prefix="/api/v1/batches",
+    tags=["api_v1", "batches"],
+)
+
+# Batches running in this process
+_batches: dict[str, tuple[BatchController, asyncio.Task]] = {}
+
+
+def batch_paths(batch_id: str) -> tuple[str, str, str]:
+    """Input, output and report files of the batch."""
+    try:
+        batch_id = str(uuid.UUID(batch_id))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Unknown batch."
+        )
+    base = os.path.join(app_settings.BATCH_OUTPUT_DIR, batch_id)
+    return f"{base}.input.jsonl", f"{base}.output.jsonl", f"{base}.report.json"
+
+
+def start_batch(
+    batch_id: str,
+    graph: CompiledStateGraph,
+    max_concurrent_threads: Optional[int],
+    user_id: str,
+) -> int:
+    """
+    Runs the batch, whose turns must all be of `user_id`, in the background.
+    Returns its number of turns.
+    """
+    input_path, output_path, report_path = batch_paths(batch_id)
+    controller = BatchController(
+        graph, max_concurrent_threads or app_settings.BATCH_MAX_CONCURRENT_THREADS
+    )
+    try:
+        threads = controller.read_turns(input_path, output_path, user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    async def run():
+        try:
+            report = await controller.run(input_path, output_path, threads)
+        except Exception as e:
+            logger.exception("Batch %s failed", batch_id)
+            # Resumable like an interrupted batch
+            report = {**controller.progress, "error": repr(e)}
+        with open(report_path, "wb") as report_file:
+            report_file.write(orjson.dumps(report))
+
+    _batches[batch_id] = (controller, asyncio.create_task(run()))
+    return sum(len(turns) for turns in threads.values())
+
+
+@batches_router.post("/", status_code=status.HTTP_202_ACCEPTED)
+async def create_batch(
+    request: Request,
+    max_concurrent_threads: Optional[int] = None,
+    user_id: str = Depends(current_user_id),
+    graph: CompiledStateGraph = Depends(get_compiled_graph),
+):
+    """
+    Runs the JSONL turns of the body, see BatchController. The turns are the
+    user's, its token's: any other `user_id` is refused.
+    """
+    batch_id = str(uuid.uuid4())
+    input_path, _, _ = batch_paths(batch_id)
+    os.makedirs(app_settings.BATCH_OUTPUT_DIR, exist_ok=True)
+    with open(input_path, "wb") as input_file:
+        input_file.write(await request.body())
+    try:
+        turns = start_batch(batch_id, graph, max_concurrent_threads, user_id)
+    except HTTPException:
+        os.remove(input_path)
+        raise
+    return {"batch_id": batch_id, "turns": turns}
+
+
+@batches_router.post("/{batch_id}/resume", status_code=status.HTTP_202_ACCEPTED)
+async def resume_batch(
+    batch_id: str,
+    max_concurrent_threads: Optional[int] = None,
+    user_id: str = Depends(current_user_id),
+    graph: CompiledStateGraph = Depends(get_compiled_graph),
+):
+    """Runs the turns of the batch which didn't succeed, e.g. after a crash."""
+    input_path, _, report_path = batch_paths(batch_id)
+    if not os.path.exists(input_path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Unknown batch."
+        )
+    if batch_id in _batches and not _batches[batch_id][1].done():
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="The batch is running."
+        )
+    turns = start_batch(batch_id, graph, max_concurrent_threads, user_id)
+    # Before the batch starts running, kept if it's refused
+    if os.path.exists(report_path):
+        os.remove(report_path)
+    return {"batch_id": batch_id, "turns": turns}
+
+
+@batches_router.get("/{batch_id}")
+async def get_batch(batch_id: str):
+    input_path, _, report_path = batch_paths(batch_id)
+    if batch_id in _batches and not _batches[batch_id][1].done():
+        return {"status": "running", "progress": _batches[batch_id][0].progress}
+    if os.path.exists(report_path):
+        with open(report_path, "rb") as report_file:
+            report = orjson.loads(report_file.read())
+        return {"status": "failed" if "error" in report else "done", "report": report}
+    if os.path.exists(input_path):
+        # Stopped with its process
+        return {"status": "interrupted"}
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown batch.")
+
+
+@batches_router.get("/{batch_id}/results")
+async def get_batch_results(batch_id: str):
+    """Results so far, one JSON object per line."""
+    _, output_path, _ = batch_paths(batch_id)
+    if not os.path.exists(output_path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="No results yet."
+        )
+    return FileResponse(output_path, media_type="application/x-ndjson")
@@ -1,16 +1,24 @@
+import time
 import uuid
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Optional
 
 import orjson
-from fastapi import APIRouter, Depends, Header, status
+from fastapi import (APIRouter, Depends, Header, HTTPException, WebSocket,
+                     WebSocketDisconnect, status)
 from fastapi.responses import ORJSONResponse, StreamingResponse
 from langgraph.graph.state import CompiledStateGraph
-from langgraph.types import StateSnapshot
 
+from core.chat_session import ChatSession
 from core.main_graph import get_compiled_graph
-from core.main_graph.states import InputState
-from database import LangfuseHandler
+from core.turns import (TurnAdmission, enqueue_turn, make_graph_config,
+                        open_turn, run_turn, start_graph_execution,
+                        thread_turn, turn_deadline)
+from database import get_thread_lease, get_turn_stream
+from database.turn_stream import TurnStream
 from helpers import get_settings
+from helpers.metrics import SSE_FIRST_BYTE_SECONDS
+
+from .dependencies import admit_turn, current_user_id, websocket_user_id
 
 app_settings = get_settings()
 
@@ -24,23 +32,44 @@ chat_router = APIRouter(
 @chat_router.post("/start-chat")
 async def start_chat(
     user_message: str,
+    user_id: str = Depends(current_user_id),
+    deadline_seconds: Optional[float] = Header(default=None),
     graph: CompiledStateGraph = Depends(get_compiled_graph),
+    admission: Optional[TurnAdmission] = Depends(admit_turn),
 ):
+    started = time.perf_counter()
     conversation_id = str(uuid.uuid4())
-    langfuse_handler = LangfuseHandler()
-    trace, callback_handler = langfuse_handler.get_callback_handler()
-    graph_config = {
-        "configurable": {"thread_id": conversation_id},
-        "callbacks": [callback_handler],
-    }
+    deadline = turn_deadline(deadline_seconds)
+    stream = await open_turn()
+    if app_settings.JOB_MODE_ENABLED:
+        await enqueue_turn(
+            stream,
+            {
+                "kind": "start",
+                "thread_id": conversation_id,
+                "user_id": user_id,
+                "user_message": user_message,
+                "deadline": deadline,
+                "slot_id": admission and admission.slot_id,
+            },
+        )
+    else:
+        run_turn(
+            stream,
+            start_graph_execution(
+                graph_config=make_graph_config(
+                    conversation_id, user_id, stream.turn_id, deadline, admission
+                ),
+                graph=graph,
+                user_message=user_message,
+            ),
+            admission,
+        )
     return StreamingResponse(
         status_code=status.HTTP_200_OK,
-        content=start_graph_execution(
-            graph_config=graph_config,
-            graph=graph,
-            user_message=user_message,
-        ),
+        content=sse_events(stream, "start_chat", started),
         media_type="text/event-stream",
+        headers={"X-Turn-ID": stream.turn_id},
     )
 
 
@@ -48,92 +77,160 @@ async def start_chat(
 async def chat(
     user_message: str,
     thread_id: str = Header(),
+    user_id: str = Depends(current_user_id),
+    deadline_seconds: Optional[float] = Header(default=None),
     graph: CompiledStateGraph = Depends(get_compiled_graph),
+    admission: Optional[TurnAdmission] = Depends(admit_turn),
 ):
-    langfuse_handler = LangfuseHandler()
-    trace, callback_handler = langfuse_handler.get_callback_handler()
-    graph_config = {
-        "configurable": {"thread_id": thread_id},
-        "callbacks": [callback_handler],
-    }
+    started = time.perf_counter()
+    deadline = turn_deadline(deadline_seconds)
+    # One turn at a time per thread, across workers
+    lease = get_thread_lease(thread_id)
+    if app_settings.JOB_MODE_ENABLED:
+        # The job worker takes the lease, refuse early what it would reject
+        if app_settings.THREAD_LOCK_POLICY == "reject" and await lease.is_held():
+            if admission is not None:
+                await admission.finish()
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A message of this conversation is already being answered.",
+            )
+        stream = await open_turn()
+        await enqueue_turn(
+            stream,
+            {
+                "kind": "chat",
+                "thread_id": thread_id,
+                "user_id": user_id,
+                "user_message": user_message,
+                "deadline": deadline,
+                "slot_id": admission and admission.slot_id,
+            },
+        )
+    else:
+        acquired = await lease.acquire(user_message)
+        if not acquired and app_settings.THREAD_LOCK_POLICY == "reject":
+            if admission is not None:
+                await admission.finish()
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A message of this conversation is already being answered.",
+            )
+        stream = await open_turn()
+        run_turn(
+            stream,
+            thread_turn(
+                lease,
+                acquired,
+                user_message,
+                make_graph_config(
+                    thread_id, user_id, stream.turn_id, deadline, admission
+                ),
+                graph,
+            ),
+            admission,
+        )
 
     return StreamingResponse(
         status_code=status.HTTP_200_OK,
-        content=followup_graph(
-            user_input=user_message,
-            graph_config=graph_config,
-            graph=graph,
-        ),
+        content=sse_events(stream, "chat", started),
         media_type="text/event-stream",
+        headers={"X-Turn-ID": stream.turn_id},
     )
 
 
-async def start_graph_execution(
-    graph_config: dict,
-    graph: CompiledStateGraph,
-    user_message: str,
-) -> AsyncGenerator[str, None]:
+@chat_router.get("/turns/{turn_id}/events")
+async def turn_events(
+    turn_id: str,
+    last_event_id: Optional[str] = Header(default=None),
+):
+    """
+    Replays the events of a turn after `Last-Event-ID`, then follows the turn
+    until it ends. Lets clients resume a stream after a disconnection.
+    """
+    started = time.perf_counter()
+    stream = get_turn_stream(turn_id)
+    if not await stream.exists():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Unknown or expired turn."
+        )
+    return StreamingResponse(
+        status_code=status.HTTP_200_OK,
+        content=sse_events(stream, "turn_events", started, last_event_id),
+        media_type="text/event-stream",
+        headers={"X-Turn-ID": turn_id},
+    )
+
 
-    response = {
-        "op": "trace_id",
-        "trace_id": graph_config["configurable"]["thread_id"],
-    }
-    print(response)
-    yield f"data: {orjson.dumps(response).decode('utf-8')}\n\n"
-
-    response = {
-        "op": "info",
-        "message": "Thinking...",
-    }
-    yield f"data: {orjson.dumps(response).decode('utf-8')}\n\n"
-
-    async for update in graph.astream(
-        input=InputState(user_message=user_message),
-        config=graph_config,
-        stream_mode=["custom"],
-    ):
-        response = {
-            "op": "info",
-            "message": update[1],
-        }
-        print(response)
-        if response:
-            yield f"data: {orjson.dumps(response).decode('utf-8')}\n\n"
-
-    final_state = await graph.aget_state(config=graph_config)
-    async for response in generate_response(final_state):
-        yield response
-
-
-# Extracts the response from the final state
-async def generate_response(final_state: StateSnapshot) -> AsyncGenerator[str, None]:
-    response = {
-        "op": "final_generated",
-        "message": final_state.values["main_agent_messages"][-1].content,
-    }
-    yield f"data: {orjson.dumps(response).decode('utf-8')}\n\n"
-
-
-async def followup_graph(
-    user_input: str,
-    graph_config: dict,
-    graph: CompiledStateGraph,
+@chat_router.websocket("/ws")
+async def chat_ws(
+    websocket: WebSocket,
+    thread_id: Optional[str] = None,
+    binary: bool = False,
+    user_id: str = Depends(websocket_user_id),
+    graph: CompiledStateGraph = Depends(get_compiled_graph),
+):
+    """
+    One conversation per connection, a new one without `thread_id`, of the
+    user of the `token` query parameter (see current_user_id). Frames
+    are compact JSON, binary ones with `binary`, the same events as the SSE
+    streams plus `token` events with the text of the response as it's
+    written. The client sends:
+    - `{"op": "message", "message": ..., "deadline_seconds": ...}`
+    - `{"op": "cancel"}`, stopping the turn in flight at its next safe point
+    - `{"op": "state"}`, answered with the last response of the thread
+    """
+    await websocket.accept()
+
+    async def send(event: dict):
+        frame = orjson.dumps(event)
+        try:
+            if binary:
+                await websocket.send_bytes(frame)
+            else:
+                await websocket.send_text(frame.decode("utf-8"))
+        except (WebSocketDisconnect, RuntimeError):
+            # Gone, the turn goes on until its next safe point
+            pass
+
+    session = ChatSession(graph, send, user_id, thread_id)
+    await send({"op": "thread_id", "thread_id": session.thread_id})
+    try:
+        while True:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                break
+            try:
+                request = orjson.loads(frame.get("bytes") or frame.get("text") or "")
+                op = request["op"]
+            except (orjson.JSONDecodeError, KeyError, TypeError):
+                await send({"op": "error", "message": "Invalid frame."})
+                continue
+            if op == "message" and request.get("message"):
+                await session.start_turn(
+                    request["message"], request.get("deadline_seconds")
+                )
+            elif op == "cancel":
+                session.cancel()
+            elif op == "state":
+                await send({"op": "state", "message": await session.last_response()})
+            else:
+                await send({"op": "error", "message": f"Unsupported frame: {op}."})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        session.close()
+
+
+async def sse_events(
+    stream: TurnStream,
+    route: str,
+    started: float,
+    last_event_id: Optional[str] = None,
 ) -> AsyncGenerator[str, None]:
-    response = {
-        "op": "info",
-        "message": "Thinking...",
-    }
-    yield f"data: {orjson.dumps(response).decode('utf-8')}\n\n"
-
-    async for update in graph.astream(
-        input=InputState(user_message=user_input),
-        config=graph_config,
-        stream_mode=["custom"],
-    ):
-        response = {"op": "info", "message": update[1]}
-        if response:
-            yield f"data: {orjson.dumps(response).decode('utf-8')}\n\n"
-
-    final_state = await graph.aget_state(config=graph_config, subgraphs=True)
-    async for response in generate_response(final_state):
-        yield response
+    first = True
+    async for event_id, event in stream.read(last_event_id):
+        yield f"id: {event_id}\ndata: {orjson.dumps(event).decode('utf-8')}\n\n"
+        if first:
+            SSE_FIRST_BYTE_SECONDS.labels(route).observe(time.perf_counter() - started)
+            first = False
@@ -0,0 +1,64 @@
+import math
+from typing import Optional
+
+from fastapi import Depends, Header, HTTPException, WebSocketException, status
+
+from core.turns import TurnAdmission, admit_user_turn
+from database import RateLimitExceededError
+from helpers import get_settings
+from helpers.user_tokens import verify_user_token
+
+app_settings = get_settings()
+
+
+def _token_user_id(token: Optional[str]) -> Optional[str]:
+    # Without a secret the app is single-user, every client is the default user
+    if not app_settings.USER_TOKEN_SECRET:
+        return app_settings.DEFAULT_USER_ID
+    if not token:
+        return None
+    return verify_user_token(token, app_settings.USER_TOKEN_SECRET)
+
+
+async def current_user_id(authorization: Optional[str] = Header(default=None)) -> str:
+    """
+    The user of the request, from its `Authorization: Bearer <user token>`
+    header, see helpers.user_tokens. Answers 401 without a valid token.
+    """
+    scheme, _, token = (authorization or "").partition(" ")
+    user_id = _token_user_id(token if scheme.lower() == "bearer" else None)
+    if user_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or missing user token.",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user_id
+
+
+async def websocket_user_id(token: Optional[str] = None) -> str:
+    """The user of a WebSocket, from its `token` query parameter."""
+    user_id = _token_user_id(token)
+    if user_id is None:
+        raise WebSocketException(
+            code=status.WS_1008_POLICY_VIOLATION,
+            reason="Invalid or missing user token.",
+        )
+    return user_id
+
+
+async def admit_turn(
+    user_id: str = Depends(current_user_id),
+) -> Optional[TurnAdmission]:
+    """
+    Admits a turn of the user against the per-user and global rate limits,
+    answering 429 right away when over one of them.
+    """
+    try:
+        return await admit_user_turn(user_id)
+    except RateLimitExceededError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Too many requests ({e.limit}), please try again later.",
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
@@ -0,0 +1,13 @@
+from fastapi import APIRouter, Response
+
+from helpers.metrics import render_metrics
+
+# Unversioned, where Prometheus scrapes by default
+metrics_router = APIRouter(tags=["metrics"])
+
+
+@metrics_router.get("/metrics")
+def metrics():
+    """Latency histograms, LLM tokens and in-flight turns, see helpers.metrics."""
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
@@ -0,0 +1,37 @@
+from fastapi import APIRouter, BackgroundTasks, Header, HTTPException, status
+
+from core.google_api import sync_channel, verify_notification
+from core.main_graph.tool_cache import calendar_scope, get_tool_cache
+
+webhooks_router = APIRouter(
+    prefix="/api/v1/webhooks",
+    tags=["api_v1", "webhooks"],
+)
+
+
+@webhooks_router.post("/google-calendar", status_code=status.HTTP_200_OK)
+def google_calendar_notification(
+    background_tasks: BackgroundTasks,
+    x_goog_channel_id: str = Header(),
+    x_goog_resource_state: str = Header(),
+    x_goog_channel_token: str = Header(default=""),
+):
+    """
+    Receives Google Calendar push notifications registered with `events.watch`.
+    The changes are synced after responding, so Google isn't kept waiting.
+    """
+    channel = verify_notification(x_goog_channel_id, x_goog_channel_token)
+    if channel is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Unknown channel."
+        )
+    # The first "sync" message only confirms the channel
+    if x_goog_resource_state != "sync":
+        background_tasks.add_task(sync_channel, channel)
+        # Tool results cached by the user's threads may predate the change
+        background_tasks.add_task(
+            get_tool_cache().invalidate,
+            channel["user_id"],
+            [calendar_scope(channel["calendar_id"])],
+        )
+    return {}
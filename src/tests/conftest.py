@@ -0,0 +1,88 @@
+import os
+
+# Settings from the defaults, not from a developer's .env
+os.environ["ENVIRONMENT"] = "production"
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import fakeredis  # noqa: E402
+import pytest  # noqa: E402
+from fakeredis import aioredis  # noqa: E402
+
+from helpers import get_settings  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def app_settings(monkeypatch):
+    """The settings, restored after the test."""
+    settings = get_settings()
+    original = settings.model_dump()
+    yield settings
+    for name, value in original.items():
+        setattr(settings, name, value)
+
+
+@pytest.fixture
+def redis_server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def redis_client(redis_server):
+    return fakeredis.FakeRedis(server=redis_server)
+
+
+@pytest.fixture
+def async_redis_client(redis_server):
+    return aioredis.FakeRedis(server=redis_server)
+
+
+@pytest.fixture
+def event_cache(redis_client, monkeypatch):
+    from core.google_api import event_cache as event_cache_module
+    from core.main_graph import tools
+
+    cache = event_cache_module.EventCache(redis_client, 3600)
+    monkeypatch.setattr(event_cache_module, "get_event_cache", lambda: cache)
+    monkeypatch.setattr(tools, "get_event_cache", lambda: cache)
+    return cache
+
+
+@pytest.fixture
+def tool_cache(redis_client, monkeypatch):
+    from core.main_graph import tool_cache as tool_cache_module
+
+    cache = tool_cache_module.ToolResultCache(redis_client, 900)
+    monkeypatch.setattr(tool_cache_module, "get_tool_cache", lambda: cache)
+    return cache
+
+
+@pytest.fixture
+def google_api_scheduler(redis_client, monkeypatch):
+    """The Google API scheduler, retrying without sleeping: see `.sleeps`."""
+    import time
+
+    from core.google_api import batch as batch_module
+    from core.google_api import scheduler as scheduler_module
+
+    scheduler = scheduler_module.GoogleApiScheduler(
+        redis_client,
+        max_concurrent_calls=1,
+        user_max_concurrent_calls=1,
+        max_retries=2,
+        backoff_base_seconds=0.001,
+        backoff_max_seconds=5,
+        breaker_failures=5,
+        breaker_cooldown_seconds=30,
+        mirror_ttl_seconds=60,
+        stats_flush_seconds=60,
+    )
+    monkeypatch.setattr(scheduler_module, "get_google_api_scheduler", lambda: scheduler)
+    monkeypatch.setattr(batch_module, "get_google_api_scheduler", lambda: scheduler)
+    scheduler.sleeps = []
+    monkeypatch.setattr(time, "sleep", scheduler.sleeps.append)
+    return scheduler
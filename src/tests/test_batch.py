@@ -0,0 +1,119 @@
+from types import SimpleNamespace
+
+import orjson
+import pytest
+
+from controllers import BatchController
+from controllers import chat_controller as chat_controller_module
+from core import turns
+from database.rate_limiter import Budget, RateLimiter
+from database.thread_lease import ThreadLease
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeGraph:
+    """Answers each message, failing the ones in `failing`."""
+
+    def __init__(self, failing: set[str] = frozenset()):
+        self.failing = failing
+        self.answered = []
+        self.configs = []
+        self.response = None
+
+    async def astream(self, input, config):
+        self.configs.append(config)
+        if input["user_message"] in self.failing:
+            raise RuntimeError("LLM down")
+        self.answered.append(input["user_message"])
+        self.response = f"Answer to {input['user_message']}"
+        yield {}
+
+    async def aget_state(self, config):
+        return SimpleNamespace(values={"response": self.response})
+
+
+@pytest.fixture
+def batch_env(monkeypatch, app_settings, async_redis_client, tmp_path):
+    app_settings.RATE_LIMIT_ENABLED = True
+    limiter = RateLimiter(
+        async_redis_client,
+        user_requests=Budget(100),
+        global_requests=Budget(100),
+        user_llm_tokens=Budget(1000),
+        global_llm_tokens=Budget(1000),
+        user_max_turns=10,
+        global_max_turns=10,
+        slot_seconds=60,
+    )
+    monkeypatch.setattr(turns, "get_rate_limiter", lambda: limiter)
+    monkeypatch.setattr(
+        chat_controller_module,
+        "get_thread_lease",
+        lambda thread_id: ThreadLease(async_redis_client, thread_id, 30),
+    )
+    input_path = tmp_path / "turns.jsonl"
+    input_path.write_bytes(
+        b"".join(
+            orjson.dumps(turn) + b"\n"
+            for turn in [
+                {"id": "1", "thread_id": "a", "message": "first"},
+                {"id": "2", "thread_id": "a", "message": "second"},
+                {"id": "3", "thread_id": "b", "message": "other"},
+            ]
+        )
+    )
+    return limiter, str(input_path), str(tmp_path / "results.jsonl")
+
+
+def read_results(output_path: str) -> list[dict]:
+    with open(output_path, "rb") as output_file:
+        return [orjson.loads(line) for line in output_file]
+
+
+async def test_resume_runs_only_what_did_not_succeed(batch_env):
+    limiter, input_path, output_path = batch_env
+
+    graph = FakeGraph(failing={"first"})
+    report = await BatchController(graph, 2).run(input_path, output_path)
+    assert report["succeeded"] == 1 and report["failed"] == 1
+    # The next turn of a failed thread builds on it, it doesn't run
+    assert graph.answered == ["other"]
+
+    graph = FakeGraph()
+    report = await BatchController(graph, 2).run(input_path, output_path)
+    assert report["skipped"] == 1
+    assert report["succeeded"] == 2 and report["failed"] == 0
+    assert graph.answered == ["first", "second"]
+    results = read_results(output_path)
+    assert [result["id"] for result in results if "response" in result] == [
+        "3",
+        "1",
+        "2",
+    ]
+
+
+async def test_turns_are_admitted_and_fenced(batch_env):
+    limiter, input_path, output_path = batch_env
+    graph = FakeGraph()
+
+    await BatchController(graph, 2).run(input_path, output_path)
+
+    assert (await limiter.stats())["admitted"] == 3
+    # Every slot freed, every lease released
+    assert (await limiter.stats())["global"]["turns"] == 0
+    assert not await limiter.conn.exists("thread_lease:a", "thread_lease:b")
+    assert all(config["configurable"]["fencing_token"] for config in graph.configs)
+
+
+def test_turns_of_another_user_are_refused(tmp_path):
+    input_path = tmp_path / "turns.jsonl"
+    input_path.write_bytes(b'{"message": "hi", "user_id": "mallory"}\n')
+    controller = BatchController(FakeGraph(), 1)
+
+    with pytest.raises(ValueError):
+        controller.read_turns(str(input_path), str(tmp_path / "out"), "alice")
+    turns = controller.read_turns(str(input_path), str(tmp_path / "out"), "mallory")
+    assert [turn["user_id"] for turns in turns.values() for turn in turns] == [
+        "mallory"
+    ]
@@ -0,0 +1,124 @@
+import orjson
+import pytest
+
+from core.main_graph import tools
+
+CONFIG = {"configurable": {"user_id": "alice", "thread_id": "thread-1"}}
+
+
+class FakeRequest(dict):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.headers = {}
+
+
+class FakeEvents:
+    def insert(self, calendarId, body, sendUpdates):
+        return FakeRequest(method="insert", body=body)
+
+    def patch(self, calendarId, eventId, body, sendUpdates):
+        return FakeRequest(method="patch", event_id=eventId, body=body)
+
+    def delete(self, calendarId, eventId, sendUpdates):
+        return FakeRequest(method="delete", event_id=eventId)
+
+
+class FakeService:
+    def events(self):
+        return FakeEvents()
+
+
+@pytest.fixture
+def batches(monkeypatch, event_cache, tool_cache):
+    """The requests of each batch sent, all succeeding."""
+    batches = []
+
+    def execute_batch(service, requests, user_id):
+        batches.append(requests)
+        return [
+            {
+                "ok": True,
+                "result": {
+                    "id": request.get("event_id") or f"created-{i}",
+                    "etag": '"1"',
+                    "summary": request.get("body", {}).get("summary"),
+                },
+            }
+            for i, request in enumerate(requests)
+        ]
+
+    monkeypatch.setattr(tools, "execute_batch", execute_batch)
+    monkeypatch.setattr(
+        tools, "get_user_calendar_service", lambda user_id, timeout=None: FakeService()
+    )
+    return batches
+
+
+def report(output: str) -> list[dict]:
+    return orjson.loads(output.split("\n\n", 1)[1])
+
+
+def test_bulk_create_reports_invalid_events(batches):
+    output = tools.bulk_create_events_tool.invoke(
+        {
+            "events": [
+                {
+                    "summary": "Sync",
+                    "start": "2025-04-02T10:00:00Z",
+                    "end": "2025-04-02T11:00:00Z",
+                },
+                {"summary": "No times"},
+                {
+                    "summary": "Lunch",
+                    "start": "2025-04-02T12:00:00Z",
+                    "end": "2025-04-02T13:00:00Z",
+                    "room": "2",
+                },
+                {
+                    "summary": "Review",
+                    "start": "2025-04-02T14:00:00Z",
+                    "end": "2025-04-02T15:00:00Z",
+                },
+            ]
+        },
+        config=CONFIG,
+    )
+
+    assert output.startswith("2 of 4 events created successfully.")
+    assert [item["status"] for item in report(output)] == [
+        "ok",
+        "failed",
+        "failed",
+        "ok",
+    ]
+    assert "start" in report(output)[1]["error"]
+    assert "room" in report(output)[2]["error"]
+    assert [request["body"]["summary"] for request in batches[0]] == ["Sync", "Review"]
+
+
+def test_bulk_edit_reports_invalid_edits(batches, event_cache):
+    output = tools.bulk_edit_events_tool.invoke(
+        {
+            "edits": [
+                {"event_id": "event-1", "changes": {"summary": "Renamed"}},
+                {"event_id": "event-2"},
+                {"changes": {"summary": "No event"}},
+                {"event_id": "event-4", "changes": "summary=Renamed"},
+            ]
+        },
+        config=CONFIG,
+    )
+
+    assert output.startswith("1 of 4 events updated successfully.")
+    assert [item["status"] for item in report(output)] == ["ok"] + ["failed"] * 3
+    assert [request["event_id"] for request in batches[0]] == ["event-1"]
+    assert event_cache.get("alice", "primary", "event-1")["summary"] == "Renamed"
+
+
+def test_bulk_call_with_only_invalid_items_sends_nothing(batches):
+    output = tools.bulk_create_events_tool.invoke(
+        {"events": [{"summary": "No times"}]}, config=CONFIG
+    )
+
+    assert output.startswith("0 of 1 events created successfully.")
+    assert batches == [[]]
@@ -0,0 +1,125 @@
+import asyncio
+import time
+
+import pytest
+from langchain_core.messages import AIMessage
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, START, StateGraph
+
+from core.main_graph import cancellation
+from core.main_graph.cancellation import at_safe_point, with_deadline
+from core.main_graph.states import InputState, OverallState
+from core.turns import deliver_turn, start_graph_execution
+from database.turn_stream import TurnStream
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def stream(monkeypatch, app_settings, async_redis_client) -> TurnStream:
+    app_settings.CANCEL_ABANDONED_TURNS = True
+    stream = TurnStream(
+        async_redis_client, "turn-1", ttl_seconds=60, maxlen=100, grace_seconds=5
+    )
+    monkeypatch.setattr(cancellation, "get_turn_stream", lambda turn_id: stream)
+    return stream
+
+
+def make_graph(first, second):
+    """`first` then `second`, each at a safe point."""
+    builder = StateGraph(state_schema=OverallState, input=InputState)
+    builder.add_node("first", at_safe_point(first))
+    builder.add_node("second", at_safe_point(second))
+    builder.add_edge(START, "first")
+    builder.add_edge("first", "second")
+    builder.add_edge("second", END)
+    return builder.compile(checkpointer=MemorySaver())
+
+
+async def delivered(graph, deadline: float = None) -> list[dict]:
+    config = {
+        "configurable": {
+            "thread_id": "thread-1",
+            "turn_id": "turn-1",
+            "deadline": deadline,
+        }
+    }
+    sent = []
+
+    async def send(event: dict):
+        sent.append(event)
+
+    await deliver_turn("turn-1", start_graph_execution(config, graph, "Hi"), send)
+    return sent
+
+
+async def answer(state: OverallState):
+    return {"main_agent_messages": [AIMessage(content="Done")]}
+
+
+async def test_followed_turn_runs_to_the_end(stream):
+    await stream.mark_followed()
+
+    sent = await delivered(make_graph(answer, answer))
+
+    assert sent[-1] == {"op": "final_generated", "message": "Done"}
+
+
+async def test_abandoned_turn_is_cancelled_at_the_next_safe_point(stream):
+    await stream.mark_followed()
+    ran = []
+
+    async def first(state: OverallState):
+        ran.append("first")
+        # The client went away while the node ran
+        await stream.conn.delete(stream.followed_key)
+        return {}
+
+    async def second(state: OverallState):
+        ran.append("second")
+        return {}
+
+    sent = await delivered(make_graph(first, second))
+
+    assert ran == ["first"]
+    assert sent[-1]["op"] == "final_generated"
+    assert sent[-1]["error"] == "cancelled"
+
+
+async def test_nodes_may_skip_the_abandoned_check(stream):
+    # Nobody follows the turn
+    builder = StateGraph(state_schema=OverallState, input=InputState)
+    builder.add_node("router", at_safe_point(answer, check_abandoned=False))
+    builder.add_edge(START, "router")
+    builder.add_edge("router", END)
+
+    sent = await delivered(builder.compile(checkpointer=MemorySaver()))
+
+    assert sent[-1] == {"op": "final_generated", "message": "Done"}
+
+
+async def test_slow_llm_call_ends_the_turn_at_its_deadline(stream, monkeypatch):
+    await stream.mark_followed()
+    monkeypatch.setattr(cancellation, "MIN_TIMEOUT_SECONDS", 0.01)
+
+    async def slow_agent(state: OverallState):
+        await with_deadline(asyncio.sleep(10))
+        return {}
+
+    sent = await delivered(make_graph(slow_agent, answer), time.time() + 0.05)
+
+    assert sent[-1]["op"] == "final_generated"
+    assert sent[-1]["error"] == "error"
+    assert "taking too long" in sent[-1]["message"]
+
+
+async def test_turn_past_its_deadline_stops_at_the_next_safe_point(stream):
+    await stream.mark_followed()
+
+    async def late(state: OverallState):
+        await asyncio.sleep(0.05)
+        return {}
+
+    sent = await delivered(make_graph(late, answer), time.time() + 0.01)
+
+    assert sent[-1]["error"] == "error"
@@ -0,0 +1,73 @@
+import os
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from core.google_api.contact_embeddings import ContactEmbeddings
+from core.google_api.contacts import ContactIndex
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    embedded: int = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+
+
+@pytest.fixture
+def index() -> ContactIndex:
+    index = ContactIndex()
+    index.upsert("people/1", "Anna Martin", "anna@example.com")
+    index.upsert("people/2", "Ben Dubois", "No email")
+    return index
+
+
+def open_embeddings(tmp_path) -> ContactEmbeddings:
+    return ContactEmbeddings(
+        str(tmp_path / "alice"), CountingEmbedding(size=8), "fake__8"
+    )
+
+
+def test_restarts_reuse_the_saved_rows(tmp_path, index):
+    embeddings = open_embeddings(tmp_path)
+    embeddings.refresh(index)
+    index.upsert("people/3", "Chloe Moreau", "chloe@example.com")
+    embeddings.refresh(index)
+    assert embeddings.embedder.embedded == 3
+
+    restarted = open_embeddings(tmp_path)
+    restarted.refresh(index)
+    assert restarted.embedder.embedded == 0
+    np.testing.assert_array_equal(restarted.matrix, embeddings.matrix)
+    assert restarted.search("Chloe Moreau <chloe@example.com>")[0]["name"] == (
+        "Chloe Moreau"
+    )
+    # Only the current matrix, no temporary files
+    assert sorted(name.rsplit(".", 1)[-1] for name in os.listdir(tmp_path)) == [
+        "f32",
+        "json",
+    ]
+
+
+def test_partial_matrix_is_embedded_again(tmp_path, index):
+    open_embeddings(tmp_path).refresh(index)
+    (matrix_file,) = [name for name in os.listdir(tmp_path) if name.endswith(".f32")]
+    with open(tmp_path / matrix_file, "r+b") as f:
+        f.truncate(8)
+
+    restarted = open_embeddings(tmp_path)
+    restarted.refresh(index)
+    assert restarted.embedder.embedded == 2
+
+
+def test_names_looked_up_are_embedded_once(tmp_path, index):
+    embeddings = open_embeddings(tmp_path)
+    embeddings.refresh(index)
+    embedded = embeddings.embedder.embedded
+
+    first = embeddings.search_many(["Anna Martin", "Ben", "Anna Martin"])
+    assert embeddings.embedder.embedded == embedded + 2
+    assert embeddings.search_many(["Ben", "Anna Martin"]) == first[1:]
+    assert embeddings.embedder.embedded == embedded + 2
@@ -0,0 +1,100 @@
+import itertools
+from difflib import SequenceMatcher
+
+import pytest
+
+from core.google_api.contacts import SIMILARITY_THRESHOLD, ContactIndex
+
+FIRST_NAMES = (
+    "James Mary Robert Patricia John Jennifer Michael Linda David Elizabeth "
+    "William Barbara Richard Susan Joseph Jessica Thomas Sarah Charles Karen Anna "
+    "Ben Chloe Daniel Emma Farid Giulia Hugo Yuki Wei Xu Omar Fatima Lucas Sofia "
+    "Mateo Olga Ivan Priya Arjun"
+).split()
+LAST_NAMES = (
+    "Smith Johnson Williams Brown Jones Garcia Miller Davis Rodriguez Martinez "
+    "Hernandez Lopez Gonzalez Wilson Anderson Thomas Taylor Moore Jackson Martin "
+    "Lee Perez Thompson White Harris Sanchez Clark Ramirez Lewis Robinson Walker "
+    "Young Allen King Wright Scott Torres Nguyen Hill Flores"
+).split()
+
+
+def linear_search(contacts: list[dict], name: str, top_n: int) -> list[float]:
+    """Similarities of the top matches, as scored before the index."""
+    search_parts = [p for p in name.lower().split() if p]
+    similarities = []
+    for contact in contacts:
+        contact_name = contact["name"].lower()
+        contact_parts = [p for p in contact_name.split() if p]
+        full_name_similarity = SequenceMatcher(None, name.lower(), contact_name).ratio()
+        part_matches = 0
+        for search_part in search_parts:
+            for contact_part in contact_parts:
+                if search_part == contact_part:
+                    part_matches += 1
+                    break
+                elif (
+                    len(search_part) >= 3
+                    and len(contact_part) >= 3
+                    and (search_part in contact_part or contact_part in search_part)
+                ):
+                    part_matches += 0.5
+                    break
+        part_similarity = part_matches / max(len(search_parts), len(contact_parts), 1)
+        if name.strip().lower() == contact_name.strip().lower():
+            similarity = 1.0
+        else:
+            similarity = min(max(full_name_similarity, part_similarity), 0.99)
+        if similarity > SIMILARITY_THRESHOLD:
+            similarities.append(similarity)
+    return sorted(similarities, reverse=True)[:top_n]
+
+
+@pytest.fixture(scope="module")
+def contacts() -> list[dict]:
+    return [
+        {"name": f"{first} {last}", "email": f"{first}.{last}@example.com".lower()}
+        for first, last in itertools.product(FIRST_NAMES, LAST_NAMES)
+    ]
+
+
+@pytest.fixture(scope="module")
+def index(contacts) -> ContactIndex:
+    index = ContactIndex()
+    for i, contact in enumerate(contacts):
+        index.upsert(f"people/{i}", contact["name"], contact["email"])
+    return index
+
+
+@pytest.mark.parametrize(
+    "name",
+    [
+        "Jon Smith",
+        "jennifer",
+        "Garcia",
+        "Xu",
+        "Giula Martinez",
+        "Liz Taylor",
+        "Robert Jonson",
+        "J Smith",
+        "Hernandes",
+    ],
+)
+@pytest.mark.parametrize("top_n", [1, 2, 5])
+def test_search_matches_the_linear_scan(index, contacts, name, top_n):
+    similarities = [match["similarity"] for match in index.search(name, top_n=top_n)]
+    assert similarities == linear_search(contacts, name, top_n)
+
+
+def test_search_falls_back_to_all_contacts():
+    index = ContactIndex()
+    index.upsert("people/1", "Bo", "bo@example.com")
+    # No trigram in common with the query, only characters
+    assert [match["name"] for match in index.search("ob")] == ["Bo"]
+
+
+def test_removed_contacts_are_not_found():
+    index = ContactIndex()
+    index.upsert("people/1", "Anna Martin", "anna@example.com")
+    index.remove("people/1")
+    assert index.search("Anna Martin") == []
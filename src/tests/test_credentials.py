@@ -0,0 +1,103 @@
+import datetime
+
+import pytest
+from cryptography.fernet import Fernet
+from google.oauth2.credentials import Credentials
+
+from core.google_api import auth
+from database.credential_store import FileCredentialStore, RedisCredentialStore
+
+
+def make_credentials(token="token", expires_in=3600) -> Credentials:
+    return Credentials(
+        token=token,
+        refresh_token="refresh-token",
+        token_uri="https://oauth2.googleapis.com/token",
+        client_id="client-id",
+        client_secret="client-secret",
+        scopes=auth.SCOPES,
+        expiry=datetime.datetime.utcnow() + datetime.timedelta(seconds=expires_in),
+    )
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = FileCredentialStore(str(tmp_path))
+    monkeypatch.setattr(auth, "get_credential_store", lambda: store)
+    # No legacy token files around
+    monkeypatch.chdir(tmp_path)
+    auth._credentials_cache.clear()
+    yield store
+    auth._credentials_cache.clear()
+
+
+def test_redis_store_encrypts_credentials(redis_client):
+    store = RedisCredentialStore(redis_client, Fernet.generate_key().decode())
+    store.put("alice", "calendar", make_credentials("alice-token"))
+
+    assert b"alice-token" not in redis_client.get("credentials:alice:calendar")
+    assert store.get("alice", "calendar").token == "alice-token"
+    assert store.get("bob", "calendar") is None
+    store.delete("alice", "calendar")
+    assert store.get("alice", "calendar") is None
+
+
+def test_redis_store_requires_a_key(redis_client):
+    with pytest.raises(ValueError):
+        RedisCredentialStore(redis_client, "")
+
+
+def test_file_store_keeps_users_apart(tmp_path):
+    store = FileCredentialStore(str(tmp_path))
+    store.put("alice", "calendar", make_credentials("alice-token"))
+    store.put("bob", "calendar", make_credentials("bob-token"))
+
+    assert store.get("alice", "calendar").token == "alice-token"
+    assert store.get("bob", "calendar").token == "bob-token"
+    assert store.get("alice", "people") is None
+
+
+def test_valid_credentials_are_cached(store, monkeypatch):
+    store.put("alice", "calendar", make_credentials("alice-token"))
+    assert auth.get_user_credentials("alice", "calendar").token == "alice-token"
+
+    monkeypatch.setattr(store, "get", lambda *args: pytest.fail("store read"))
+    assert auth.get_user_credentials("alice", "calendar").token == "alice-token"
+
+
+def test_expired_credentials_are_refreshed_once(store, monkeypatch):
+    refreshes = []
+
+    def refresh(creds, request):
+        refreshes.append(creds.token)
+        creds.token = "refreshed-token"
+        creds.expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+
+    monkeypatch.setattr(Credentials, "refresh", refresh)
+    store.put("alice", "calendar", make_credentials("old-token", expires_in=-60))
+
+    assert auth.get_user_credentials("alice", "calendar").token == "refreshed-token"
+    auth._credentials_cache.clear()
+    assert auth.get_user_credentials("alice", "calendar").token == "refreshed-token"
+    assert refreshes == ["old-token"]
+
+
+def test_missing_credentials_are_not_authorized(store, app_settings, monkeypatch):
+    app_settings.GOOGLE_LOCAL_OAUTH_FLOW = False
+    with pytest.raises(auth.MissingCredentialsError, match="not authorized"):
+        auth.get_user_credentials("alice", "calendar")
+
+
+def test_local_flow_runs_outside_the_refresh_lock(store, app_settings, monkeypatch):
+    app_settings.GOOGLE_LOCAL_OAUTH_FLOW = True
+    held = []
+
+    def run_local_oauth_flow(user_id, service):
+        held.append(store._lock.locked())
+        return make_credentials("consented-token")
+
+    monkeypatch.setattr(auth, "_run_local_oauth_flow", run_local_oauth_flow)
+
+    assert auth.get_user_credentials("alice", "calendar").token == "consented-token"
+    assert held == [False]
+    assert store.get("alice", "calendar").token == "consented-token"
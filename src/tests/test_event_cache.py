@@ -0,0 +1,101 @@
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from core.google_api.event_cache import (EventConflictError, get_event,
+                                         patch_event)
+
+
+class Request:
+    def __init__(self, method_id: str, execute):
+        self.methodId = method_id
+        self.headers = {}
+        self._execute = execute
+
+    def execute(self):
+        return self._execute(self.headers)
+
+
+class Events:
+    """A calendar holding one event, honouring conditional requests."""
+
+    def __init__(self, event: dict):
+        self.event = event
+        self.fetched = 0
+
+    def get(self, calendarId, eventId):
+        def execute(headers):
+            if headers.get("If-None-Match") == self.event["etag"]:
+                raise HttpError(httplib2.Response({"status": 304}), b"")
+            self.fetched += 1
+            return dict(self.event)
+
+        return Request("calendar.events.get", execute)
+
+    def patch(self, calendarId, eventId, body):
+        def execute(headers):
+            if headers.get("If-Match", self.event["etag"]) != self.event["etag"]:
+                raise HttpError(httplib2.Response({"status": 412}), b"")
+            self.edit(**body)
+            return dict(self.event)
+
+        return Request("calendar.events.patch", execute)
+
+    def edit(self, **fields):
+        self.event = {**self.event, **fields, "etag": self.event["etag"] + "+"}
+
+
+class Service:
+    def __init__(self, events: Events):
+        self._events = events
+
+    def events(self) -> Events:
+        return self._events
+
+
+@pytest.fixture
+def events(event_cache, google_api_scheduler) -> Events:
+    return Events({"id": "e1", "etag": '"1"', "summary": "Sync"})
+
+
+def test_unchanged_event_is_revalidated_not_refetched(events, event_cache):
+    service = Service(events)
+
+    first = get_event(service, "alice", "primary", "e1")
+    second = get_event(service, "alice", "primary", "e1")
+
+    assert first == second == events.event
+    assert events.fetched == 1
+
+
+def test_changed_event_is_refetched(events, event_cache):
+    service = Service(events)
+    get_event(service, "alice", "primary", "e1")
+
+    events.edit(summary="Weekly sync")
+
+    assert get_event(service, "alice", "primary", "e1")["summary"] == "Weekly sync"
+    assert event_cache.get("alice", "primary", "e1") == events.event
+
+
+def test_patch_based_on_the_cached_read_succeeds(events, event_cache):
+    service = Service(events)
+    get_event(service, "alice", "primary", "e1")
+
+    event = patch_event(service, "alice", "primary", "e1", {"summary": "Retro"})
+
+    assert event["summary"] == "Retro"
+    assert event_cache.get("alice", "primary", "e1") == event
+
+
+def test_patch_based_on_a_stale_read_conflicts(events, event_cache):
+    service = Service(events)
+    get_event(service, "alice", "primary", "e1")
+    # Edited elsewhere since the read
+    events.edit(summary="Weekly sync")
+
+    with pytest.raises(EventConflictError):
+        patch_event(service, "alice", "primary", "e1", {"summary": "Retro"})
+
+    assert events.event["summary"] == "Weekly sync"
+    assert event_cache.get("alice", "primary", "e1") is None
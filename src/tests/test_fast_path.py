@@ -0,0 +1,50 @@
+import pytest
+
+from core.main_graph.fast_path import FastPathIntent, render_response
+from core.main_graph.projections import format_events
+
+EVENTS = [
+    {
+        "id": "event-1",
+        "summary": "Project sync",
+        "start": {"dateTime": "2025-04-02T10:00:00Z"},
+        "end": {"dateTime": "2025-04-02T11:00:00Z"},
+        "location": "Meeting room 2",
+        "attendees": [
+            {"email": "alice@example.com", "responseStatus": "accepted", "self": True},
+            {"email": "bob@example.com"},
+        ],
+    }
+]
+
+
+@pytest.mark.parametrize("verbose", [False, True])
+def test_events_are_rendered_with_the_displayed_fields(verbose):
+    output = format_events(EVENTS, {"configurable": {"verbose_tool_output": verbose}})
+    response = render_response(
+        FastPathIntent(tool="get_all_events_tool", args={}, label="today"), output
+    )
+
+    assert response.response == "- Here are your events today:"
+    assert [event.model_dump() for event in response.events] == [
+        {
+            "type": "existing",
+            "metadata": {
+                "event_id": "event-1",
+                "title": "Project sync",
+                "start": "2025-04-02T10:00:00Z",
+                "end": "2025-04-02T11:00:00Z",
+                "attendees": ["alice@example.com", "bob@example.com"],
+            },
+        }
+    ]
+
+
+def test_no_events():
+    response = render_response(
+        FastPathIntent(tool="get_calendar_invitations_tool", args={}),
+        "No pending calendar invitations found.",
+    )
+
+    assert response.response == "- You have no pending invitations."
+    assert response.events == []
@@ -0,0 +1,129 @@
+import threading
+import time
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+from langchain_core.runnables.config import var_child_runnable_config
+
+from core.google_api.batch import execute_batch
+
+
+def http_error(status: int, content: bytes = b"", **headers) -> HttpError:
+    return HttpError(httplib2.Response({"status": status, **headers}), content)
+
+
+class FakeRequest:
+    def __init__(self, name: str):
+        self.name = name
+
+    def execute(self):
+        return self.name
+
+
+@pytest.fixture
+def scheduler(google_api_scheduler):
+    return google_api_scheduler
+
+
+def test_retry_after_is_capped_at_the_maximum_backoff(scheduler):
+    error = http_error(429, **{"retry-after": "3600"})
+
+    assert scheduler.backoff(0, error) == 5
+
+
+def test_backoff_is_capped_at_the_turn_deadline(scheduler):
+    error = http_error(429, **{"retry-after": "4"})
+    token = var_child_runnable_config.set(
+        {"configurable": {"deadline": time.time() + 1}}
+    )
+    try:
+        assert scheduler.backoff(0, error) <= 1
+    finally:
+        var_child_runnable_config.reset(token)
+
+
+def test_user_slot_is_taken_before_the_global_one(scheduler):
+    # A user at its cap waits without holding the global slot
+    scheduler.user_slots["alice"].acquire()
+    waiting = threading.Thread(
+        target=scheduler._call, args=(FakeRequest("a"), "alice"), daemon=True
+    )
+    waiting.start()
+    waiting.join(0.1)
+
+    assert scheduler._call(FakeRequest("b"), "bob") == "b"
+    scheduler.user_slots["alice"].release()
+    waiting.join(1)
+    assert not waiting.is_alive()
+
+
+class FakeBatch:
+    def __init__(self, service):
+        self.service = service
+        self.added = []
+
+    def add(self, request, callback):
+        self.added.append((request, callback))
+
+    def execute(self):
+        self.service.batches.append([request.name for request, _ in self.added])
+        for request, callback in self.added:
+            error = self.service.errors.get(request.name)
+            if error is not None:
+                self.service.errors[request.name] = error[1:]
+            if error:
+                callback(request.name, None, error[0])
+            else:
+                callback(request.name, request.name, None)
+
+
+class FakeService:
+    def __init__(self, errors: dict[str, list[Exception]]):
+        # Errors of each request, in order of the attempts
+        self.errors = errors
+        self.batches = []
+
+    def new_batch_http_request(self):
+        return FakeBatch(self)
+
+
+def test_rate_limited_items_are_retried(scheduler):
+    service = FakeService(
+        {
+            "b": [http_error(429)],
+            "c": [http_error(403, b'{"reason": "rateLimitExceeded"}')],
+            "d": [http_error(404)],
+        }
+    )
+    requests = [FakeRequest(name) for name in "abcd"]
+
+    results = execute_batch(service, requests, "alice", batch_limit=2)
+
+    assert service.batches == [["a", "b"], ["c", "d"], ["b", "c"]]
+    assert [result["ok"] for result in results] == [True, True, True, False]
+    assert results[1]["result"] == "b"
+    assert len(scheduler.sleeps) == 1
+
+
+def test_item_retries_are_bounded(scheduler):
+    service = FakeService({"a": [http_error(429)] * 10})
+
+    results = execute_batch(service, [FakeRequest("a")], "alice")
+
+    assert len(service.batches) == scheduler.max_retries + 1
+    assert results == [{"ok": False, "error": results[0]["error"]}]
+    assert "429" in results[0]["error"]
+
+
+def test_stats_are_counted_in_process_and_flushed(scheduler, monkeypatch):
+    for name in "abc":
+        scheduler.execute(FakeRequest(name), "alice")
+
+    assert not scheduler.conn.exists(scheduler.STATS_KEY)
+    assert scheduler.stats()["methods"]["batch"]["calls"] == 3
+
+    scheduler.execute(FakeRequest("d"), "alice")
+    monkeypatch.setattr(scheduler, "flushed_at", time.monotonic() - 60)
+    scheduler.execute(FakeRequest("e"), "alice")
+    assert scheduler.conn.hget(scheduler.STATS_KEY, "batch:calls") == b"5"
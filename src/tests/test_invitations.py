@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta, timezone
+
+import httplib2
+import orjson
+import pytest
+from googleapiclient.errors import HttpError
+
+from core.google_api import invitations
+from core.google_api.invitations import InvitationIndex, is_pending_invitation
+
+ATTENDEE = {"self": True, "responseStatus": "needsAction"}
+
+
+def invitation(event_id: str, start: dict, end: dict, **fields) -> dict:
+    return {
+        "id": event_id,
+        "start": start,
+        "end": end,
+        "attendees": [ATTENDEE],
+        **fields,
+    }
+
+
+def day(offset: int) -> datetime:
+    return datetime.now(tz=timezone.utc) + timedelta(days=offset)
+
+
+@pytest.fixture
+def index(redis_client, monkeypatch) -> InvitationIndex:
+    monkeypatch.setattr(invitations, "get_redis_client", lambda: redis_client)
+    return InvitationIndex("alice", "primary")
+
+
+def test_pending_invitations_need_an_answer():
+    assert is_pending_invitation(invitation("1", {}, {}))
+    assert not is_pending_invitation(invitation("1", {}, {}, status="cancelled"))
+    assert not is_pending_invitation(
+        {"attendees": [{"self": True, "responseStatus": "accepted"}]}
+    )
+    assert is_pending_invitation(
+        {
+            "organizer": {"self": True},
+            "attendees": [
+                {"email": "bob@example.com", "responseStatus": "needsAction"}
+            ],
+        }
+    )
+
+
+def test_pending_compares_times_across_offsets(index):
+    tomorrow = day(1).replace(hour=12, minute=0, second=0, microsecond=0)
+    index.apply_events(
+        [
+            # 12:00 UTC, written at +05:00
+            invitation(
+                "later",
+                {
+                    "dateTime": tomorrow.astimezone(
+                        timezone(timedelta(hours=5))
+                    ).isoformat()
+                },
+                {"dateTime": (tomorrow + timedelta(hours=1)).isoformat()},
+            ),
+            # 11:00 UTC, written at -08:00: a string sort puts it last
+            invitation(
+                "sooner",
+                {
+                    "dateTime": (tomorrow - timedelta(hours=1))
+                    .astimezone(timezone(timedelta(hours=-8)))
+                    .isoformat()
+                },
+                {"dateTime": tomorrow.isoformat()},
+            ),
+            invitation(
+                "past",
+                {"dateTime": day(-2).isoformat()},
+                {"dateTime": (day(-2) + timedelta(hours=1)).isoformat()},
+            ),
+        ]
+    )
+
+    assert [event["id"] for event in index.pending(10)] == ["sooner", "later"]
+
+
+def test_all_day_invitations_end_at_midnight_of_the_calendar(index, redis_client):
+    today = datetime.now(tz=timezone.utc).date()
+    index.apply_events(
+        [
+            invitation(
+                "today",
+                {"date": today.isoformat()},
+                {"date": (today + timedelta(days=1)).isoformat()},
+            ),
+            invitation(
+                "yesterday",
+                {"date": (today - timedelta(days=2)).isoformat()},
+                {"date": (today - timedelta(days=1)).isoformat()},
+            ),
+        ]
+    )
+    # Ahead of UTC by 14 hours: today's event may already be over there
+    redis_client.hset(index.state_key, "time_zone", "Pacific/Kiritimati")
+    kiritimati_today = datetime.now(tz=timezone(timedelta(hours=14))).date()
+    expected = ["today"] if kiritimati_today == today else []
+
+    assert [event["id"] for event in index.pending(10)] == expected
+    redis_client.hset(index.state_key, "time_zone", "UTC")
+    assert [event["id"] for event in index.pending(10)] == ["today"]
+
+
+def test_failed_watch_falls_back_to_polling(index, app_settings, monkeypatch):
+    app_settings.CALENDAR_WEBHOOK_URL = "https://example.com/webhook"
+    upcoming = invitation(
+        "1",
+        {"dateTime": day(1).isoformat()},
+        {"dateTime": (day(1) + timedelta(hours=1)).isoformat()},
+    )
+    watches = []
+
+    def sync(self, service):
+        self.apply_events([upcoming])
+        self.conn.hset(self.state_key, mapping={"sync_token": "token", "synced_at": 0})
+
+    def watch_calendar(service, user_id, calendar_id):
+        watches.append(calendar_id)
+        raise HttpError(httplib2.Response({"status": 403}), b"push not allowed")
+
+    monkeypatch.setattr(InvitationIndex, "sync", sync)
+    monkeypatch.setattr(invitations, "watch_calendar", watch_calendar)
+    monkeypatch.setattr(
+        invitations, "get_user_calendar_service", lambda user_id: object()
+    )
+
+    assert invitations.get_pending_invitations("alice", "primary", 10) == [upcoming]
+    # Not watched, polled again
+    assert invitations.get_pending_invitations("alice", "primary", 10) == [upcoming]
+    assert watches == ["primary", "primary"]
+    assert orjson.loads(index.conn.hget(index.key, "1")) == upcoming
@@ -0,0 +1,66 @@
+import pytest
+
+from database.job_queue import JobQueue
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def queue(async_redis_client):
+    return JobQueue(async_redis_client)
+
+
+async def claim_all(queue: JobQueue, worker_id: str, count: int) -> list[dict]:
+    claimed = []
+    for _ in range(count):
+        raw, job = await queue.claim(worker_id, 1)
+        claimed.append(job)
+    return claimed
+
+
+async def test_jobs_of_a_dead_worker_are_requeued_oldest_first(queue):
+    for i in range(3):
+        await queue.enqueue({"turn_id": str(i)})
+    await queue.heartbeat("dead", 0, 60)
+    await queue.heartbeat("alive", 0, 60)
+    await claim_all(queue, "dead", 2)
+    await claim_all(queue, "alive", 1)
+    # The heartbeat of "dead" expired
+    await queue.conn.delete(queue._heartbeat_key("dead"))
+
+    assert await queue.requeue_orphans() == 2
+
+    requeued = await claim_all(queue, "alive", 2)
+    assert [job["turn_id"] for job in requeued] == ["0", "1"]
+    assert await queue.conn.smembers(queue.WORKERS_KEY) == {b"alive"}
+    assert (await queue.stats())["requeued"] == 2
+    # Nothing left to requeue, not counted twice
+    assert await queue.requeue_orphans() == 0
+    assert (await queue.stats())["requeued"] == 2
+
+
+async def test_requeue_is_skipped_while_another_worker_holds_the_lock(queue):
+    await queue.enqueue({"turn_id": "0"})
+    await queue.heartbeat("dead", 0, 60)
+    await claim_all(queue, "dead", 1)
+    await queue.conn.delete(queue._heartbeat_key("dead"))
+    await queue.conn.set(queue.REQUEUE_LOCK_KEY, "other")
+
+    assert await queue.requeue_orphans() == 0
+    assert await queue.conn.llen(queue.QUEUE_KEY) == 0
+    # Not released by the worker that skipped
+    assert await queue.conn.get(queue.REQUEUE_LOCK_KEY) == b"other"
+
+    await queue.conn.delete(queue.REQUEUE_LOCK_KEY)
+    assert await queue.requeue_orphans() == 1
+    assert not await queue.conn.exists(queue.REQUEUE_LOCK_KEY)
+
+
+async def test_leaving_worker_requeues_its_jobs(queue):
+    await queue.enqueue({"turn_id": "0"})
+    await queue.heartbeat("leaving", 1, 60)
+    raw, job = await queue.claim("leaving", 1)
+
+    await queue.leave("leaving")
+
+    assert await queue.conn.lrange(queue.QUEUE_KEY, 0, -1) == [raw]
@@ -0,0 +1,65 @@
+import threading
+
+import pytest
+
+from database.langfuse_handler import LangfuseHandler, TraceExporter
+
+
+@pytest.fixture
+def handler(monkeypatch) -> LangfuseHandler:
+    handler = LangfuseHandler()
+    monkeypatch.setattr(handler, "enabled", True)
+    monkeypatch.setattr(handler, "sample_rate", 0.5)
+    return handler
+
+
+def test_conversations_are_sampled_as_a_whole(handler):
+    keys = [f"thread-{i}" for i in range(1000)]
+
+    sampled = {key: handler.is_sampled(key) for key in keys}
+
+    assert all(handler.is_sampled(key) == sampled[key] for key in keys)
+    assert 400 < sum(sampled.values()) < 600
+
+
+def test_sample_rate_bounds(handler, monkeypatch):
+    monkeypatch.setattr(handler, "sample_rate", 0)
+    assert not handler.is_sampled("thread-1")
+    monkeypatch.setattr(handler, "sample_rate", 1)
+    assert handler.is_sampled("thread-1")
+
+
+def test_events_past_the_queue_size_are_dropped():
+    exporter = TraceExporter(max_size=1)
+    started, release = threading.Event(), threading.Event()
+
+    def slow_export():
+        started.set()
+        release.wait(5)
+
+    exporter.submit(slow_export, (), {})
+    started.wait(5)
+    # One waits in the queue, the next doesn't fit
+    exporter.submit(lambda: None, (), {})
+    exporter.submit(lambda: None, (), {})
+    release.set()
+    exporter.join()
+
+    assert exporter.exported == 2
+    assert exporter.dropped == 1
+
+
+def test_failed_exports_are_counted_apart():
+    exporter = TraceExporter(max_size=10)
+
+    def unsupported():
+        raise NotImplementedError
+
+    def failing():
+        raise ConnectionError("Langfuse is down")
+
+    for call in (unsupported, failing, lambda: None):
+        exporter.submit(call, (), {})
+    exporter.join()
+
+    assert (exporter.exported, exporter.unsupported, exporter.failed) == (1, 1, 1)
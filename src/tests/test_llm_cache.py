@@ -0,0 +1,106 @@
+import pytest
+from langchain_core.language_models.fake_chat_models import \
+    FakeMessagesListChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.tools import tool
+
+from database.llm_cache import RedisLLMCache
+
+
+class FakeChatModel(FakeMessagesListChatModel):
+    """Answers from `responses`, with the llm string of a serializable model."""
+
+    @classmethod
+    def is_lc_serializable(cls) -> bool:
+        return True
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=tools, **kwargs)
+
+
+@tool
+def get_all_events_tool(query: str) -> str:
+    """Events matching `query`."""
+    return ""
+
+
+@pytest.fixture
+def llm_cache(redis_client) -> RedisLLMCache:
+    return RedisLLMCache(
+        redis_client,
+        ttl_seconds=60,
+        max_entries=100,
+        max_entry_bytes=64 * 1024,
+        now_window_seconds=300,
+    )
+
+
+def tool_turn(call_id: str, message_id: str) -> list:
+    return [
+        HumanMessage(content="What's on tomorrow?", id=f"{message_id}-1"),
+        AIMessage(
+            content="",
+            id=f"{message_id}-2",
+            tool_calls=[
+                {"id": call_id, "name": "get_all_events_tool", "args": {"query": ""}}
+            ],
+        ),
+        ToolMessage(
+            content='[{"id": "e1", "title": "Sync"}]',
+            tool_call_id=call_id,
+            id=f"{message_id}-3",
+        ),
+    ]
+
+
+def test_tool_turns_hit_whatever_their_ids(llm_cache):
+    llm = FakeChatModel(
+        responses=[AIMessage(content="A sync."), AIMessage(content="Nothing.")],
+        cache=llm_cache,
+    ).bind_tools([get_all_events_tool])
+
+    first = llm.invoke(tool_turn("call_1", "run-1"))
+    again = llm.invoke(tool_turn("call_2", "run-2"))
+
+    assert first.content == again.content == "A sync."
+    assert llm_cache.stats()["hits"] == 1
+    assert llm_cache.stats()["misses"] == 1
+
+
+def test_different_conversations_miss(llm_cache):
+    llm = FakeChatModel(
+        responses=[AIMessage(content="A sync."), AIMessage(content="Nothing.")],
+        cache=llm_cache,
+    )
+    other = [
+        *tool_turn("call_1", "run-1")[:-1],
+        ToolMessage(content="[]", tool_call_id="call_1"),
+    ]
+
+    llm.invoke(tool_turn("call_1", "run-1"))
+    assert llm.invoke(other).content == "Nothing."
+    assert llm_cache.stats()["misses"] == 2
+
+
+def test_message_types_are_part_of_the_key(llm_cache):
+    llm = FakeChatModel(
+        responses=[AIMessage(content="Hi."), AIMessage(content="Hello.")],
+        cache=llm_cache,
+    )
+
+    llm.invoke([HumanMessage(content="Hi")])
+
+    assert llm.invoke([AIMessage(content="Hi")]).content == "Hello."
+
+
+def test_nested_kwargs_are_sorted(llm_cache):
+    prompt = '[{"lc": 1, "type": "constructor", "id": ["HumanMessage"]}]'
+    schema = {"type": "object", "properties": {}}
+    reordered = {"properties": {}, "type": "object"}
+
+    assert llm_cache._key(
+        prompt, '{"model": "m"}---' + str([("tools", [schema])])
+    ) == llm_cache._key(prompt, '{"model": "m"}---' + str([("tools", [reordered])]))
+    assert llm_cache._key(prompt, '{"model": "m"}---[]') != llm_cache._key(
+        prompt, '{"model": "n"}---[]'
+    )
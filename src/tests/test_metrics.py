@@ -0,0 +1,44 @@
+import pytest
+from langchain_core.tools import tool
+from prometheus_client import REGISTRY
+
+from core.turns import make_graph_config
+from helpers.metrics import ToolMetricsHandler, get_tool_metrics_handler
+
+
+@tool
+def lookup_tool(query: str) -> str:
+    """Looks `query` up."""
+    if query == "fail":
+        raise ValueError("lookup failed")
+    return query
+
+
+def observed(tool_name: str, outcome: str) -> float:
+    return (
+        REGISTRY.get_sample_value(
+            "calendar_agent_tool_call_seconds_count",
+            {"tool": tool_name, "outcome": outcome},
+        )
+        or 0
+    )
+
+
+def test_tool_calls_are_timed_by_outcome():
+    handler = ToolMetricsHandler()
+    config = {"callbacks": [handler]}
+    ok, error = observed("lookup_tool", "ok"), observed("lookup_tool", "error")
+
+    lookup_tool.invoke({"query": "sync"}, config=config)
+    with pytest.raises(ValueError):
+        lookup_tool.invoke({"query": "fail"}, config=config)
+
+    assert observed("lookup_tool", "ok") == ok + 1
+    assert observed("lookup_tool", "error") == error + 1
+    assert handler.starts == {}
+
+
+def test_turns_time_their_tools():
+    config = make_graph_config("thread-1", "alice", None, 0, callbacks=[])
+
+    assert config["callbacks"] == [get_tool_metrics_handler()]
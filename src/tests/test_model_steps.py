@@ -0,0 +1,28 @@
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, START, StateGraph
+
+from core.main_graph.states import InputState, OverallState
+
+
+def test_model_steps_are_kept_for_the_current_turn_only():
+    def fast_path_router(state: OverallState) -> dict:
+        return {"fast_path": False, "model_steps": None}
+
+    def main_agent(state: OverallState) -> dict:
+        return {"model_steps": [{"model": "small", "message": state.user_message}]}
+
+    builder = StateGraph(state_schema=OverallState, input=InputState)
+    builder.add_node("fast_path_router", fast_path_router)
+    builder.add_node("main_agent", main_agent)
+    builder.add_edge(START, "fast_path_router")
+    builder.add_edge("fast_path_router", "main_agent")
+    builder.add_edge("main_agent", END)
+    graph = builder.compile(checkpointer=MemorySaver())
+    config = {"configurable": {"thread_id": "thread-1"}}
+
+    graph.invoke({"user_message": "first"}, config)
+    graph.invoke({"user_message": "second"}, config)
+
+    assert graph.get_state(config).values["model_steps"] == [
+        {"model": "small", "message": "second"}
+    ]
@@ -0,0 +1,157 @@
+import orjson
+import pytest
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.tools import tool
+
+from core.main_graph import agents, nodes
+from core.main_graph.conditional_edges import continue_with_plan
+from core.main_graph.formatted_responses import ExecutionPlan, PlanStep
+from core.main_graph.states import OverallState
+
+pytestmark = pytest.mark.anyio
+
+
+class Planner:
+    """Stands in for the LLM, planning `plan`."""
+
+    def __init__(self, plan: ExecutionPlan):
+        self.plan = plan
+
+    def with_structured_output(self, schema, **kwargs):
+        return self
+
+    async def ainvoke(self, messages):
+        return self.plan
+
+
+async def planned(monkeypatch, plan: ExecutionPlan) -> OverallState:
+    monkeypatch.setattr(agents, "get_llm_model", lambda *args: Planner(plan))
+    state = OverallState(user_message="Invite John to the sync")
+    return state.model_copy(update=await agents.planner_agent(state))
+
+
+async def test_plan_is_left_to_the_executor(monkeypatch):
+    step = PlanStep(id="s1", tool="get_all_events_tool", args={})
+    state = await planned(monkeypatch, ExecutionPlan(steps=[step]))
+
+    assert continue_with_plan(state) == "PLAN"
+    assert state.plan == [step.model_dump()]
+    assert state.response == ""
+
+
+async def test_answer_without_tools_ends_the_turn(monkeypatch):
+    state = await planned(
+        monkeypatch, ExecutionPlan(steps=[], response="Which sync do you mean?")
+    )
+
+    assert continue_with_plan(state) == "NO_PLAN"
+    assert state.response == "Which sync do you mean?"
+    # Recorded like the main agent's responses
+    assert orjson.loads(state.main_agent_messages[-1].content) == {
+        "response": "Which sync do you mean?",
+        "events": [],
+    }
+
+
+@pytest.mark.parametrize(
+    "plan", [ExecutionPlan(steps=[]), ExecutionPlan(steps=[], response="")]
+)
+async def test_empty_plan_is_left_to_the_main_agent(monkeypatch, plan):
+    state = await planned(monkeypatch, plan)
+
+    assert continue_with_plan(state) == "AGENT"
+    assert state.main_agent_messages == []
+
+
+@tool
+def resolve_contacts_tool(names: list[str]) -> dict:
+    """Resolves `names` to contacts."""
+    return {name: [{"email": f"{name.lower()}@example.com"}] for name in names}
+
+
+@tool
+def get_all_events_tool(query: str) -> str:
+    """Events matching `query`, as JSON text."""
+    return orjson.dumps([{"id": "e1", "title": query}]).decode()
+
+
+@tool
+def edit_event_tool(event_id: str, attendees: list[str]) -> str:
+    """Invites `attendees` to the event."""
+    return f"Invited {', '.join(attendees)} to {event_id}"
+
+
+@tool
+def delete_event_tool(event_id: str) -> str:
+    """Deletes the event."""
+    raise ValueError("Google is down")
+
+
+async def executed(monkeypatch, steps: list[PlanStep]) -> list:
+    monkeypatch.setattr(
+        nodes,
+        "MAIN_AGENT_TOOLS",
+        [
+            resolve_contacts_tool,
+            get_all_events_tool,
+            edit_event_tool,
+            delete_event_tool,
+        ],
+    )
+    state = OverallState(
+        user_message="Invite John to the sync",
+        plan=[step.model_dump() for step in steps],
+    )
+    update = await nodes.plan_executor(state, {}, writer=lambda event: None)
+    assert update["plan"] == []
+    return update["main_agent_messages"]
+
+
+async def test_references_are_resolved_from_step_outputs(monkeypatch):
+    messages = await executed(
+        monkeypatch,
+        [
+            PlanStep(id="s1", tool="resolve_contacts_tool", args={"names": ["John"]}),
+            PlanStep(id="s2", tool="get_all_events_tool", args={"query": "sync"}),
+            PlanStep(
+                id="s3",
+                tool="edit_event_tool",
+                # A dict output, then JSON text output
+                args={"event_id": "$s2.0.id", "attendees": ["$s1.John.0.email"]},
+                depends_on=["s1", "s2"],
+            ),
+        ],
+    )
+
+    call, *results = messages
+    assert isinstance(call, AIMessage)
+    assert call.tool_calls[2]["args"] == {
+        "event_id": "e1",
+        "attendees": ["john@example.com"],
+    }
+    assert [result.tool_call_id for result in results] == [
+        tool_call["id"] for tool_call in call.tool_calls
+    ]
+    assert results[2].content == "Invited john@example.com to e1"
+
+
+async def test_failed_steps_fail_their_dependents(monkeypatch):
+    messages = await executed(
+        monkeypatch,
+        [
+            PlanStep(id="s1", tool="delete_event_tool", args={"event_id": "e1"}),
+            PlanStep(
+                id="s2",
+                tool="edit_event_tool",
+                args={"event_id": "$s1.id", "attendees": []},
+                depends_on=["s1"],
+            ),
+            PlanStep(id="s3", tool="send_email_tool", args={}),
+        ],
+    )
+
+    results: list[ToolMessage] = messages[1:]
+    assert [result.status for result in results] == ["error"] * 3
+    assert "Google is down" in results[0].content
+    assert "depends on failed steps ['s1']" in results[1].content
+    assert "Unknown tool" in results[2].content
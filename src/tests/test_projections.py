@@ -0,0 +1,74 @@
+import orjson
+
+from core.main_graph.projections import (format_event, format_events,
+                                         project_event)
+
+EVENT = {
+    "kind": "calendar#event",
+    "etag": '"3381"',
+    "id": "e1",
+    "status": "confirmed",
+    "htmlLink": "https://www.google.com/calendar/event?eid=e1",
+    "created": "2024-05-01T09:00:00.000Z",
+    "updated": "2024-05-02T09:00:00.000Z",
+    "summary": "Sync",
+    "creator": {"email": "alice@example.com", "self": True},
+    "organizer": {"email": "alice@example.com", "self": True},
+    "start": {"dateTime": "2024-05-06T10:00:00+02:00", "timeZone": "Europe/Paris"},
+    "end": {"dateTime": "2024-05-06T10:30:00+02:00", "timeZone": "Europe/Paris"},
+    "iCalUID": "e1@google.com",
+    "sequence": 0,
+    "attendees": [
+        {"email": "alice@example.com", "self": True, "responseStatus": "accepted"},
+        {"email": "bob@example.com", "responseStatus": "tentative"},
+        {"email": "carol@example.com"},
+    ],
+    "reminders": {"useDefault": True},
+    "eventType": "default",
+}
+
+
+def test_event_keeps_what_the_agent_acts_on():
+    assert project_event(EVENT) == {
+        "id": "e1",
+        "title": "Sync",
+        "start": "2024-05-06T10:00:00+02:00",
+        "end": "2024-05-06T10:30:00+02:00",
+        "att": [
+            "alice@example.com:accepted:me",
+            "bob@example.com:tentative",
+            "carol@example.com:needsAction",
+        ],
+    }
+
+
+def test_all_day_event_keeps_its_dates():
+    event = {"id": "e2", "start": {"date": "2024-05-06"}, "end": {"date": "2024-05-07"}}
+
+    assert project_event(event) == {
+        "id": "e2",
+        "start": "2024-05-06",
+        "end": "2024-05-07",
+    }
+
+
+def test_unusual_fields_are_kept():
+    event = {
+        **EVENT,
+        "status": "cancelled",
+        "organizer": {"email": "bob@example.com"},
+        "description": "x" * 400,
+    }
+
+    projected = project_event(event)
+
+    assert projected["status"] == "cancelled"
+    assert projected["org"] == "bob@example.com"
+    assert len(projected["desc"]) == 301
+
+
+def test_verbose_output_is_the_raw_payload():
+    config = {"configurable": {"verbose_tool_output": True}}
+
+    assert orjson.loads(format_event(EVENT, config)) == EVENT
+    assert orjson.loads(format_events([EVENT], {})) == [project_event(EVENT)]
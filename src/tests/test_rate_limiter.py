@@ -0,0 +1,84 @@
+import pytest
+
+from database.rate_limiter import Budget, RateLimiter, RateLimitExceededError
+
+pytestmark = pytest.mark.anyio
+
+
+def make_limiter(conn, **overrides) -> RateLimiter:
+    limits = {
+        "user_requests": Budget(3),
+        "global_requests": Budget(100),
+        "user_llm_tokens": Budget(1000),
+        "global_llm_tokens": Budget(100000),
+        "user_max_turns": 10,
+        "global_max_turns": 100,
+        "slot_seconds": 60,
+        **overrides,
+    }
+    return RateLimiter(conn, **limits)
+
+
+async def test_user_requests_bucket(async_redis_client):
+    limiter = make_limiter(async_redis_client)
+    for i in range(3):
+        await limiter.admit("alice", f"slot-{i}")
+
+    with pytest.raises(RateLimitExceededError) as e:
+        await limiter.admit("alice", "slot-3")
+    assert e.value.limit == "user_requests"
+    # A request refills every 20 seconds
+    assert 0 < e.value.retry_after <= 20
+    # Per user
+    await limiter.admit("bob", "slot-4")
+
+
+async def test_concurrent_turns_until_finished(async_redis_client):
+    limiter = make_limiter(async_redis_client, user_max_turns=2)
+    await limiter.admit("alice", "slot-0")
+    await limiter.admit("alice", "slot-1")
+
+    with pytest.raises(RateLimitExceededError) as e:
+        await limiter.admit("alice", "slot-2")
+    assert e.value.limit == "user_turns"
+
+    await limiter.finish("alice", "slot-0", 0)
+    await limiter.admit("alice", "slot-2")
+
+
+async def test_rejection_takes_nothing(async_redis_client):
+    limiter = make_limiter(async_redis_client, user_max_turns=1)
+    await limiter.admit("alice", "slot-0")
+    for i in range(5):
+        with pytest.raises(RateLimitExceededError):
+            await limiter.admit("alice", f"rejected-{i}")
+    await limiter.finish("alice", "slot-0", 0)
+
+    # The rejected turns used no request token, 2 of 3 are left
+    await limiter.admit("alice", "slot-1")
+    await limiter.finish("alice", "slot-1", 0)
+    await limiter.admit("alice", "slot-2")
+    stats = await limiter.stats("alice")
+    assert stats["admitted"] == 3
+    assert stats["rejected"] == {"user_turns": 5}
+    assert stats["user"]["turns"] == 1
+
+
+async def test_llm_tokens_are_charged_after_the_turn(async_redis_client):
+    limiter = make_limiter(async_redis_client)
+    await limiter.admit("alice", "slot-0")
+    # Over budget: the debt is paid back before the next turn
+    await limiter.finish("alice", "slot-0", 1500)
+
+    with pytest.raises(RateLimitExceededError) as e:
+        await limiter.admit("alice", "slot-1")
+    assert e.value.limit == "user_llm_tokens"
+    assert e.value.retry_after > 0
+
+
+async def test_expired_slots_are_freed(async_redis_client):
+    limiter = make_limiter(async_redis_client, user_max_turns=1, slot_seconds=-1)
+    # Expired as soon as taken, e.g. the process running the turn crashed
+    await limiter.admit("alice", "slot-0")
+
+    await limiter.admit("alice", "slot-1")
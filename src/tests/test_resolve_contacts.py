@@ -0,0 +1,72 @@
+import pytest
+
+from core.google_api.contacts import ContactIndex
+from core.main_graph import tools
+
+CONFIG = {"configurable": {"user_id": "alice", "thread_id": "thread-1"}}
+
+
+@pytest.fixture
+def contacts(monkeypatch, app_settings, tool_cache) -> ContactIndex:
+    app_settings.CONTACT_MATCHING_MODE = "fuzzy"
+    index = ContactIndex()
+    index.upsert("people/1", "Anna Martin", "anna.martin@example.com")
+    index.upsert("people/2", "Anna Moreau", "anna.moreau@example.com")
+    index.upsert("people/3", "Ben Dubois", "No email")
+    monkeypatch.setattr(tools, "get_contact_index", lambda user_id: index)
+    return index
+
+
+def resolve(names: list[str], top_n: int = 2) -> dict:
+    return tools.resolve_contacts_tool.invoke(
+        {"names": names, "top_n": top_n}, config=CONFIG
+    )
+
+
+def test_each_name_gets_its_matches(contacts):
+    matches = resolve(["Ben Dubois", "Anna Martin"])
+
+    assert list(matches) == ["Ben Dubois", "Anna Martin"]
+    assert matches["Ben Dubois"][0] == {
+        "name": "Ben Dubois",
+        "email": "No email",
+        "similarity": 1.0,
+    }
+    assert matches["Anna Martin"][0]["email"] == "anna.martin@example.com"
+
+
+def test_ambiguous_name_returns_every_candidate(contacts):
+    matches = resolve(["Anna"])["Anna"]
+
+    assert {match["email"] for match in matches} == {
+        "anna.martin@example.com",
+        "anna.moreau@example.com",
+    }
+    # Tied: the agent has to ask which one
+    assert matches[0]["similarity"] == matches[1]["similarity"] < 1
+
+
+def test_missing_name_has_no_match(contacts):
+    matches = resolve(["Xu", "Ben Dubois"])
+
+    assert matches["Xu"] == []
+    assert matches["Ben Dubois"]
+
+
+def test_embedding_mode_resolves_all_names_at_once(
+    monkeypatch, app_settings, tool_cache
+):
+    app_settings.CONTACT_MATCHING_MODE = "embedding"
+    searches = []
+
+    class Embeddings:
+        def search_many(self, names, top_n):
+            searches.append(names)
+            return [[{"name": name, "email": "No email"}] for name in names]
+
+    monkeypatch.setattr(tools, "get_contact_embeddings", lambda user_id: Embeddings())
+
+    matches = resolve(["Anna", "Ben"])
+
+    assert searches == [["Anna", "Ben"]]
+    assert matches["Ben"] == [{"name": "Ben", "email": "No email"}]
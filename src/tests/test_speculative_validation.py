@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+from core.main_graph import nodes
+from core.main_graph.cancellation import DeadlineExceededError
+from core.main_graph.states import OverallState
+
+pytestmark = pytest.mark.anyio
+
+STATE = OverallState(user_message="What do I have tomorrow?")
+
+
+@pytest.fixture
+def written() -> list:
+    """Events written to the stream by the node."""
+    return []
+
+
+class SlowAgent:
+    """An agent node answering only once released."""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.cancelled = False
+
+    async def __call__(self, state: OverallState) -> dict:
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return {"response": "You have a project sync.", "main_agent_messages": []}
+
+
+def validator(decision=None, error=None, wait: asyncio.Event = None):
+    async def validator_agent(state: OverallState) -> dict:
+        # The LLM call, the agent starts meanwhile
+        await asyncio.sleep(0)
+        if wait is not None:
+            await wait.wait()
+        if error is not None:
+            raise error
+        return decision
+
+    return validator_agent
+
+
+async def test_accepted_input_waits_for_the_agent(monkeypatch, written):
+    agent = SlowAgent()
+    monkeypatch.setattr(
+        nodes,
+        "validator_agent",
+        validator({"validator_messages": [], "is_valid_user_input": True}),
+    )
+    node = asyncio.create_task(
+        nodes.with_speculative_validation(agent)(STATE, written.append)
+    )
+    await asyncio.sleep(0)
+    agent.release.set()
+
+    update = await node
+    assert update["response"] == "You have a project sync."
+    assert update["is_valid_user_input"] is True
+    assert written == [nodes.INPUT_VALIDATED]
+
+
+async def test_rejected_input_cancels_the_agent(monkeypatch, written):
+    agent = SlowAgent()
+    monkeypatch.setattr(
+        nodes,
+        "validator_agent",
+        validator(
+            {
+                "validator_messages": [],
+                "is_valid_user_input": False,
+                "response": "I can only help with your calendar.",
+            }
+        ),
+    )
+
+    update = await nodes.with_speculative_validation(agent)(STATE, written.append)
+    await asyncio.sleep(0)
+    assert update["response"] == "I can only help with your calendar."
+    assert agent.cancelled
+    assert written == []
+
+
+async def test_failing_validator_accepts_the_input(monkeypatch, written):
+    agent = SlowAgent()
+    agent.release.set()
+    monkeypatch.setattr(nodes, "validator_agent", validator(error=ValueError("down")))
+
+    update = await nodes.with_speculative_validation(agent)(STATE, written.append)
+    assert update["is_valid_user_input"] is True
+
+
+async def test_deadline_cancels_the_agent(monkeypatch, written):
+    agent = SlowAgent()
+    monkeypatch.setattr(
+        nodes, "validator_agent", validator(error=DeadlineExceededError())
+    )
+
+    with pytest.raises(DeadlineExceededError):
+        await nodes.with_speculative_validation(agent)(STATE, written.append)
+    await asyncio.sleep(0)
+    assert agent.cancelled
+
+
+async def test_cancelled_node_cancels_the_agent(monkeypatch, written):
+    agent = SlowAgent()
+    monkeypatch.setattr(nodes, "validator_agent", validator(wait=asyncio.Event()))
+    node = asyncio.create_task(
+        nodes.with_speculative_validation(agent)(STATE, written.append)
+    )
+    await asyncio.sleep(0)
+
+    node.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await node
+    await asyncio.sleep(0)
+    assert agent.cancelled
@@ -0,0 +1,58 @@
+import orjson
+import pytest
+
+from database.turn_stream import TurnStream
+from routes.v1.chat import sse_events
+
+pytestmark = pytest.mark.anyio
+
+EVENTS = [
+    {"op": "trace_id", "trace_id": "thread-1"},
+    {"op": "info", "message": "Thinking..."},
+    {"op": "final_generated", "message": "You have a sync at 10."},
+]
+
+
+def frame_data(frame: str):
+    """Parses a frame like the frontend does, see frameData in ChatInterface.tsx."""
+    for line in frame.split("\n"):
+        if line.startswith("data: "):
+            return orjson.loads(line[len("data: ") :])
+    return None
+
+
+async def streamed(stream: TurnStream, last_event_id=None) -> list[str]:
+    body = "".join(
+        [chunk async for chunk in sse_events(stream, "chat", 0.0, last_event_id)]
+    )
+    return [frame for frame in body.split("\n\n") if frame]
+
+
+@pytest.fixture
+async def stream(async_redis_client) -> TurnStream:
+    stream = TurnStream(
+        async_redis_client, "turn-1", ttl_seconds=60, maxlen=100, grace_seconds=5
+    )
+    for event in EVENTS:
+        await stream.publish(event)
+    await stream.close()
+    return stream
+
+
+async def test_each_frame_carries_its_event(stream):
+    frames = await streamed(stream)
+
+    assert [frame_data(frame) for frame in frames] == EVENTS
+
+
+async def test_frames_resume_after_their_id(stream):
+    frames = await streamed(stream)
+    first_id = next(
+        line.removeprefix("id: ")
+        for line in frames[0].split("\n")
+        if line.startswith("id: ")
+    )
+
+    resumed = await streamed(stream, first_id)
+
+    assert [frame_data(frame) for frame in resumed] == EVENTS[1:]
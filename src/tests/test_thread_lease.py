@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+from langgraph.checkpoint.base import empty_checkpoint
+
+from database.redis import AsyncRedisSaver, StaleFencingTokenError
+from database.thread_lease import ThreadLease
+
+pytestmark = pytest.mark.anyio
+
+
+def lease(conn, lease_seconds: int = 30) -> ThreadLease:
+    return ThreadLease(conn, "thread-1", lease_seconds)
+
+
+async def test_one_holder_at_a_time(async_redis_client):
+    first, second = lease(async_redis_client), lease(async_redis_client)
+
+    assert await first.acquire("Hello")
+    assert not await second.acquire("Hello again")
+    assert await second.is_held()
+    await first.release()
+    assert not await first.is_held()
+    assert await second.acquire("Hello again")
+    # Every acquisition attempt gets a higher token
+    assert second.token > 1
+    await second.release()
+
+
+async def test_lost_lease_is_not_released_by_its_former_holder(async_redis_client):
+    first, second = lease(async_redis_client), lease(async_redis_client)
+    assert await first.acquire("Hello")
+    # Expired, e.g. a stalled worker
+    await async_redis_client.delete(first.key)
+    assert await second.acquire("Hello again")
+
+    await first.release()
+    assert await second.is_held()
+    await second.release()
+
+
+async def test_lease_is_renewed_while_held(async_redis_client):
+    holder = lease(async_redis_client, lease_seconds=1)
+    assert await holder.acquire("Hello")
+
+    await asyncio.sleep(1.5)
+    assert await holder.is_held()
+    await holder.release()
+    assert not await holder.is_held()
+
+
+async def test_wait_acquire_waits_for_the_release(async_redis_client):
+    first, second = lease(async_redis_client), lease(async_redis_client)
+    assert await first.acquire("Hello")
+
+    waiting = asyncio.create_task(second.wait_acquire("Hello again", 5))
+    await asyncio.sleep(0.2)
+    assert not waiting.done()
+    await first.release()
+    assert await waiting
+    await second.release()
+
+
+async def test_wait_acquire_times_out(async_redis_client):
+    holder = lease(async_redis_client)
+    assert await holder.acquire("Hello")
+
+    assert not await lease(async_redis_client).wait_acquire("Hello again", 0.2)
+    await holder.release()
+
+
+async def test_merged_messages(async_redis_client):
+    holder, other = lease(async_redis_client), lease(async_redis_client)
+    assert await holder.acquire("Book a room")
+
+    # A double submit of the message in flight is dropped
+    assert not await other.merge("Book a room")
+    assert await other.merge("For 4 people")
+    assert await other.merge("At 10am")
+    assert await other.withdraw("At 10am")
+    assert await holder.take_pending() == ["For 4 people"]
+    assert not await other.withdraw("For 4 people")
+    await holder.release()
+
+
+async def test_checkpoint_writes_are_fenced(async_redis_client):
+    saver = AsyncRedisSaver(async_redis_client)
+    holder, successor = lease(async_redis_client), lease(async_redis_client)
+    assert await holder.acquire("Hello")
+
+    def config(token: int) -> dict:
+        return {
+            "configurable": {
+                "thread_id": "thread-1",
+                "checkpoint_ns": "",
+                "fencing_token": token,
+            }
+        }
+
+    await saver.aput(config(holder.token), empty_checkpoint(), {}, {})
+    await async_redis_client.delete(holder.key)
+    assert await successor.acquire("Hello again")
+
+    with pytest.raises(StaleFencingTokenError):
+        await saver.aput(config(holder.token), empty_checkpoint(), {}, {})
+    await saver.aput(config(successor.token), empty_checkpoint(), {}, {})
+    await holder.release()
+    await successor.release()
@@ -0,0 +1,121 @@
+import time
+
+import pytest
+
+from core.main_graph import tools
+from core.main_graph.tool_cache import calendar_scope
+
+CONFIG = {"configurable": {"user_id": "alice", "thread_id": "thread-1"}}
+
+
+@pytest.fixture
+def calendar(monkeypatch, tool_cache):
+    """Events of a fake calendar, read through get_event and edited by patch_event."""
+    events = {"event-1": {"id": "event-1", "summary": "Sync"}}
+    reads = []
+
+    def get_event(service, user_id, calendar_id, event_id):
+        reads.append(event_id)
+        return dict(events[event_id])
+
+    monkeypatch.setattr(tools, "get_event", get_event)
+    monkeypatch.setattr(
+        tools, "get_user_calendar_service", lambda user_id, timeout=None: object()
+    )
+    return events, reads
+
+
+def read(event_id: str = "event-1") -> str:
+    return tools.get_event_tool.invoke({"event_id": event_id}, config=CONFIG)
+
+
+def test_reads_are_cached_until_a_write(calendar, tool_cache):
+    events, reads = calendar
+    assert "Sync" in read()
+    assert "Sync" in read()
+    assert reads == ["event-1"]
+
+    events["event-1"]["summary"] = "Renamed"
+    tool_cache.invalidate("alice", [calendar_scope("primary")])
+    assert "Renamed" in read()
+    assert reads == ["event-1", "event-1"]
+
+
+def test_version_counters_do_not_expire(calendar, tool_cache, redis_client):
+    read()
+    tool_cache.invalidate("alice", [calendar_scope("primary")])
+    read()
+
+    assert redis_client.ttl("tool_cache_version:alice:calendar:primary") == -1
+    # The thread's entries expire together, refreshed by every put
+    assert 0 < redis_client.ttl("tool_cache:alice:thread-1") <= 900
+
+
+def test_edits_invalidate_after_the_write(calendar, monkeypatch):
+    events, reads = calendar
+
+    def patch_event(service, user_id, calendar_id, event_id, body, **kwargs):
+        # Another call of the thread reads the event while it's being written
+        read(event_id)
+        events[event_id].update(body)
+        return dict(events[event_id])
+
+    monkeypatch.setattr(tools, "patch_event", patch_event)
+    read()
+
+    tools.edit_event_tool.invoke(
+        {"event_id": "event-1", "changes": {"summary": "Renamed"}}, config=CONFIG
+    )
+    assert "Renamed" in read()
+
+
+def test_conflicting_edits_invalidate_too(calendar, monkeypatch):
+    events, reads = calendar
+
+    def patch_event(service, user_id, calendar_id, event_id, body, **kwargs):
+        events[event_id]["summary"] = "Changed elsewhere"
+        raise tools.EventConflictError(f"Event {event_id} was changed.")
+
+    monkeypatch.setattr(tools, "patch_event", patch_event)
+    read()
+
+    output = tools.edit_event_tool.invoke(
+        {"event_id": "event-1", "changes": {"summary": "Renamed"}}, config=CONFIG
+    )
+    assert "get_event_tool" in output
+    assert "Changed elsewhere" in read()
+
+
+def test_reads_older_than_the_ttl_are_refetched(calendar, tool_cache, monkeypatch):
+    events, reads = calendar
+    read()
+    now = time.time()
+
+    monkeypatch.setattr(time, "time", lambda: now + tool_cache.ttl_seconds - 1)
+    read()
+    assert reads == ["event-1"]
+    # Changed on Google's side, without a notification
+    events["event-1"]["summary"] = "Renamed"
+    monkeypatch.setattr(time, "time", lambda: now + tool_cache.ttl_seconds + 1)
+    assert "Renamed" in read()
+    assert reads == ["event-1", "event-1"]
+
+
+def test_lookups_are_one_round_trip(calendar, tool_cache, monkeypatch):
+    read()
+    commands = []
+    execute_command = tool_cache.conn.execute_command
+
+    def counted(*args, **kwargs):
+        commands.append(args[0])
+        return execute_command(*args, **kwargs)
+
+    monkeypatch.setattr(tool_cache.conn, "execute_command", counted)
+    read()
+
+    assert commands == ["EVALSHA"]
+    assert tool_cache.stats()["get_event_tool"] == {
+        "hits": 1,
+        "misses": 1,
+        "hit_rate": 0.5,
+    }
@@ -0,0 +1,64 @@
+import pytest
+
+from core.main_graph.tool_selection import select_tools
+from core.main_graph.tools import MAIN_AGENT_TOOLS
+
+WRITE_TOOLS = {
+    "create_event_tool",
+    "edit_event_tool",
+    "delete_event_tool",
+    "bulk_create_events_tool",
+    "bulk_edit_events_tool",
+    "bulk_delete_events_tool",
+}
+
+
+@pytest.fixture(autouse=True)
+def selection_enabled(app_settings):
+    app_settings.TOOL_SELECTION_ENABLED = True
+
+
+def selected(message: str) -> set[str]:
+    return {tool.name for tool in select_tools(message)}
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "Move my 3pm with Bob to Thursday",
+        "Rename the standup to Daily",
+        "Cancel tomorrow's dentist appointment",
+        "Please DELETE all my meetings on Friday",
+    ],
+)
+def test_edits_and_deletes_keep_the_write_tools(message):
+    tools = selected(message)
+
+    assert WRITE_TOOLS <= tools
+    # And the lookups they need
+    assert {"get_all_events_tool", "resolve_contacts_tool"} <= tools
+
+
+def test_reads_leave_out_the_write_tools():
+    tools = selected("What's on my agenda today?")
+
+    assert "get_all_events_tool" in tools
+    assert not WRITE_TOOLS & tools
+
+
+@pytest.mark.parametrize("message", ["yes, go ahead", "ok", ""])
+def test_messages_without_cues_get_every_tool(message):
+    assert select_tools(message) == MAIN_AGENT_TOOLS
+    assert len(MAIN_AGENT_TOOLS) == 11
+
+
+def test_selection_keeps_the_tools_order():
+    tools = select_tools("Invite Bob to the sync")
+
+    assert tools == [tool for tool in MAIN_AGENT_TOOLS if tool in tools]
+
+
+def test_disabled_selection_gets_every_tool(app_settings):
+    app_settings.TOOL_SELECTION_ENABLED = False
+
+    assert select_tools("What's on my agenda today?") == MAIN_AGENT_TOOLS
@@ -0,0 +1,153 @@
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from core.main_graph.agents import RESPONSE_TAG
+from core.main_graph.cancellation import DeadlineExceededError, TurnCancelledError
+from core.main_graph.nodes import INPUT_VALIDATED
+from core.turns import (deliver_turn, followup_graph, rejected_turn,
+                        start_graph_execution)
+
+pytestmark = pytest.mark.anyio
+
+
+async def failing_turn(error: Exception):
+    yield {"op": "info", "message": "Thinking..."}
+    raise error
+
+
+async def delivered(events) -> list[dict]:
+    sent = []
+
+    async def send(event: dict):
+        sent.append(event)
+
+    await deliver_turn("turn", events, send)
+    return sent
+
+
+@pytest.mark.parametrize(
+    "error, kind",
+    [
+        (TurnCancelledError("cancelled"), "cancelled"),
+        (DeadlineExceededError("deadline"), "error"),
+        (RuntimeError("boom"), "error"),
+    ],
+)
+async def test_failed_turns_end_with_final_generated(error, kind):
+    sent = await delivered(failing_turn(error))
+
+    assert sent[0]["op"] == "info"
+    assert sent[-1]["op"] == "final_generated"
+    assert sent[-1]["error"] == kind
+    assert sent[-1]["message"]
+
+
+async def test_rejected_turn_ends_with_final_generated():
+    sent = await delivered(rejected_turn())
+
+    assert [event["op"] for event in sent] == ["final_generated"]
+    assert "already being answered" in sent[0]["message"]
+
+
+class FakeGraph:
+    """Replays the stream of a graph run, then answers `final`."""
+
+    def __init__(self, stream: list[tuple], final: str):
+        self.stream = stream
+        self.final = final
+
+    async def astream(self, input, config, stream_mode):
+        for mode, update in self.stream:
+            if mode in stream_mode:
+                yield mode, update
+
+    async def aget_state(self, config, subgraphs=False):
+        return SimpleNamespace(
+            values={"main_agent_messages": [AIMessage(content=self.final)]}
+        )
+
+
+def token(text: str, node: str, tagged: bool = True) -> tuple:
+    metadata = {"langgraph_node": node, "tags": [RESPONSE_TAG] if tagged else []}
+    return "messages", (AIMessageChunk(content=text), metadata)
+
+
+async def streamed(graph: FakeGraph) -> list[str]:
+    return [
+        event["text"]
+        async for event in followup_graph("Hi", {}, graph, stream_tokens=True)
+        if event["op"] == "token"
+    ]
+
+
+async def test_only_the_kept_llm_call_is_streamed():
+    graph = FakeGraph(
+        [
+            # Escalated from
+            token("cheap", "main_agent", tagged=False),
+            token("final", "main_agent"),
+        ],
+        "final",
+    )
+
+    assert await streamed(graph) == ["final"]
+
+
+async def test_tokens_are_held_until_the_input_is_validated(app_settings):
+    app_settings.VALIDATOR_ENABLED = True
+    graph = FakeGraph(
+        [
+            token("You", "validated_main_agent"),
+            ("custom", INPUT_VALIDATED),
+            token(" have", "validated_main_agent"),
+            ("custom", "Looking up your events..."),
+            token(" a sync", "main_agent"),
+        ],
+        "You have a sync",
+    )
+
+    events = [
+        event async for event in followup_graph("Hi", {}, graph, stream_tokens=True)
+    ]
+
+    assert [event.get("text") or event["message"] for event in events] == [
+        "Thinking...",
+        "You",
+        " have",
+        "Looking up your events...",
+        " a sync",
+        "You have a sync",
+    ]
+
+
+async def test_tokens_of_a_rejected_input_are_dropped(app_settings):
+    app_settings.VALIDATOR_ENABLED = True
+    graph = FakeGraph(
+        [token("Sure, here is a poem", "validated_main_agent")],
+        "I can only help with your calendar.",
+    )
+
+    assert await streamed(graph) == []
+
+
+async def test_first_turn_skips_the_validation_event(app_settings):
+    app_settings.VALIDATOR_ENABLED = True
+    graph = FakeGraph(
+        [
+            ("custom", INPUT_VALIDATED),
+            ("custom", "Looking up your events..."),
+        ],
+        "You have a sync",
+    )
+    config = {"configurable": {"thread_id": "thread-1"}}
+
+    events = [event async for event in start_graph_execution(config, graph, "Hi")]
+
+    assert [event.get("message") for event in events] == [
+        None,
+        "Thinking...",
+        "Looking up your events...",
+        "You have a sync",
+    ]
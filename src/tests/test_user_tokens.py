@@ -0,0 +1,38 @@
+import pytest
+from fastapi import HTTPException, WebSocketException
+
+from helpers.user_tokens import sign_user_id, verify_user_token
+from routes.v1.dependencies import current_user_id, websocket_user_id
+
+
+def test_tokens_verify_with_their_secret_only():
+    token = sign_user_id("alice.smith", "secret")
+
+    assert verify_user_token(token, "secret") == "alice.smith"
+    assert verify_user_token(token, "other-secret") is None
+    assert verify_user_token("alice.smith", "secret") is None
+    assert verify_user_token(token.replace("alice", "bob"), "secret") is None
+
+
+@pytest.mark.anyio
+async def test_requests_without_a_secret_are_the_default_user(app_settings):
+    app_settings.USER_TOKEN_SECRET = ""
+
+    assert await current_user_id(None) == app_settings.DEFAULT_USER_ID
+    assert await websocket_user_id("anything") == app_settings.DEFAULT_USER_ID
+
+
+@pytest.mark.anyio
+async def test_requests_need_a_signed_token(app_settings):
+    app_settings.USER_TOKEN_SECRET = "secret"
+    token = sign_user_id("alice", "secret")
+
+    assert await current_user_id(f"Bearer {token}") == "alice"
+    assert await websocket_user_id(token) == "alice"
+    with pytest.raises(HTTPException) as error:
+        await current_user_id(None)
+    assert error.value.status_code == 401
+    with pytest.raises(HTTPException):
+        await current_user_id(f"Bearer {sign_user_id('alice', 'guess')}")
+    with pytest.raises(WebSocketException):
+        await websocket_user_id("alice")
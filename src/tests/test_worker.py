@@ -0,0 +1,79 @@
+import pytest
+
+import worker as worker_module
+from core import turns
+from database.job_queue import JobQueue
+from database.turn_stream import TurnStream
+
+pytestmark = pytest.mark.anyio
+
+
+class UnreachableLease:
+    async def acquire(self, user_message: str):
+        raise ConnectionError("Redis is unreachable")
+
+
+class RateLimiter:
+    def __init__(self):
+        self.finished = []
+
+    async def finish(self, user_id: str, slot_id: str, llm_tokens: int):
+        self.finished.append(slot_id)
+
+
+@pytest.fixture
+def worker(monkeypatch, async_redis_client):
+    monkeypatch.setattr(
+        worker_module, "get_job_queue", lambda: JobQueue(async_redis_client)
+    )
+    monkeypatch.setattr(
+        worker_module,
+        "get_turn_stream",
+        lambda turn_id: TurnStream(
+            async_redis_client, turn_id, ttl_seconds=60, maxlen=100, grace_seconds=5
+        ),
+    )
+    monkeypatch.setattr(
+        worker_module, "get_thread_lease", lambda thread_id: UnreachableLease()
+    )
+    return worker_module.GraphWorker(graph=None, concurrency=1, heartbeat_seconds=1)
+
+
+async def test_failed_setup_ends_the_turn(worker, monkeypatch, async_redis_client):
+    limiter = RateLimiter()
+    monkeypatch.setattr(turns, "get_rate_limiter", lambda: limiter)
+    await worker.queue.enqueue(
+        {
+            "kind": "thread",
+            "turn_id": "turn-1",
+            "thread_id": "thread-1",
+            "user_id": "alice",
+            "slot_id": "slot-1",
+            "deadline": 0,
+            "user_message": "Hi",
+        }
+    )
+    await worker.slots.acquire()
+
+    await worker._run_job(*await worker.queue.claim(worker.worker_id, 1))
+
+    stream = TurnStream(async_redis_client, "turn-1", 60, 100, 5)
+    events = [event async for _, event in stream.read()]
+    assert events[-1]["op"] == "final_generated"
+    assert events[-1]["error"] == "error"
+    assert limiter.finished == ["slot-1"]
+    assert (await worker.queue.stats())["failed"] == 1
+    assert not worker.slots.locked()
+
+
+async def test_job_without_a_turn_is_dropped(worker):
+    await worker.queue.enqueue({"kind": "start"})
+    await worker.slots.acquire()
+
+    await worker._run_job(*await worker.queue.claim(worker.worker_id, 1))
+
+    assert (await worker.queue.stats())["failed"] == 1
+    assert (
+        await worker.queue.conn.llen(worker.queue._processing_key(worker.worker_id))
+        == 0
+    )
@@ -0,0 +1,159 @@
+"""
+Job worker, running the graph for the turns the API queues in job mode
+(JOB_MODE_ENABLED). Start as many as needed, on any node sharing Redis:
+
+    python worker.py
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from typing import AsyncGenerator, Optional
+
+from langgraph.graph.state import CompiledStateGraph
+from prometheus_client import start_http_server
+
+from core.google_api import get_google_api_scheduler
+from core.main_graph import compile_graph, get_compiled_graph
+from core.turns import (TurnAdmission, make_graph_config, publish_turn,
+                        start_graph_execution, thread_turn)
+from database import (LangfuseHandler, get_job_queue, get_redis_saver,
+                      get_thread_lease, get_turn_stream)
+from helpers import get_settings
+
+app_settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class GraphWorker:
+    """Runs up to `concurrency` turns at a time, claimed from the job queue."""
+
+    def __init__(
+        self, graph: CompiledStateGraph, concurrency: int, heartbeat_seconds: int
+    ):
+        self.graph = graph
+        self.queue = get_job_queue()
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.slots = asyncio.Semaphore(concurrency)
+        self.heartbeat_seconds = heartbeat_seconds
+        self.running: set[asyncio.Task] = set()
+
+    async def run(self):
+        await self._beat()
+        heartbeat = asyncio.create_task(self._heartbeat())
+        logger.info("Worker %s started", self.worker_id)
+        try:
+            while True:
+                await self.slots.acquire()
+                claimed = await self.queue.claim(self.worker_id, self.heartbeat_seconds)
+                if claimed is None:
+                    self.slots.release()
+                    continue
+                task = asyncio.create_task(self._run_job(*claimed))
+                self.running.add(task)
+                task.add_done_callback(self.running.discard)
+        finally:
+            # Stops claiming, lets the turns in flight finish
+            if self.running:
+                logger.info(
+                    "Worker %s draining %d jobs", self.worker_id, len(self.running)
+                )
+                await asyncio.gather(*self.running, return_exceptions=True)
+            heartbeat.cancel()
+            await self.queue.leave(self.worker_id)
+            logger.info("Worker %s stopped", self.worker_id)
+
+    async def _beat(self):
+        await self.queue.heartbeat(
+            self.worker_id, len(self.running), self.heartbeat_seconds * 3
+        )
+        requeued = await self.queue.requeue_orphans()
+        if requeued:
+            logger.warning(
+                "Worker %s requeued %d orphaned jobs", self.worker_id, requeued
+            )
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            try:
+                await self._beat()
+            except Exception:
+                logger.exception("Worker %s heartbeat failed", self.worker_id)
+
+    async def _run_job(self, raw: bytes, job: dict):
+        completed = False
+        try:
+            stream = get_turn_stream(job["turn_id"])
+            admission = (
+                TurnAdmission(job["user_id"], job["slot_id"])
+                if job.get("slot_id")
+                else None
+            )
+            completed = await publish_turn(
+                stream, self._job_events(job, admission), admission
+            )
+        except Exception:
+            # Only a job without a turn ends here, there is no stream to tell
+            logger.exception("Worker %s can't run job %r", self.worker_id, job)
+        finally:
+            await self.queue.complete(self.worker_id, raw, failed=not completed)
+            self.slots.release()
+
+    async def _job_events(
+        self, job: dict, admission: Optional[TurnAdmission]
+    ) -> AsyncGenerator[dict, None]:
+        """
+        The events of the job's turn. Set up as the first event is read, so a
+        failed setup, e.g. Redis unavailable to the lease, ends the turn like a
+        failed graph run: the stream gets its final error and is closed.
+        """
+        graph_config = make_graph_config(
+            job["thread_id"],
+            job["user_id"],
+            job["turn_id"],
+            job["deadline"],
+            admission,
+        )
+        if job["kind"] == "start":
+            events = start_graph_execution(
+                graph_config=graph_config,
+                graph=self.graph,
+                user_message=job["user_message"],
+            )
+        else:
+            lease = get_thread_lease(job["thread_id"])
+            acquired = await lease.acquire(job["user_message"])
+            events = thread_turn(
+                lease, acquired, job["user_message"], graph_config, self.graph
+            )
+        async for event in events:
+            yield event
+
+
+async def main():
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+    if app_settings.WORKER_METRICS_PORT:
+        # The graph runs here in job mode, with its node and LLM metrics
+        start_http_server(app_settings.WORKER_METRICS_PORT)
+    langfuse = LangfuseHandler()
+    try:
+        async for checkpointer in get_redis_saver():
+            compile_graph(checkpointer=checkpointer)
+            worker = GraphWorker(
+                get_compiled_graph(),
+                concurrency=app_settings.WORKER_CONCURRENCY,
+                heartbeat_seconds=app_settings.WORKER_HEARTBEAT_SECONDS,
+            )
+            await worker.run()
+    finally:
+        langfuse.flush()
+        get_google_api_scheduler().flush_stats()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())